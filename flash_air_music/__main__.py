@@ -4,37 +4,114 @@ Command line options overridden by config file values.
 
 Usage:
     {program} [options] run
+    {program} [options] status
+    {program} [options] (pause | resume) [convert | upload]
+    {program} [options] sync-now
     {program} -h | --help
     {program} -V | --version
 
 Options:
+    -a DIR --archive-dir=DIR    Also convert songs into this directory (e.g. a
+                                high quality copy for archiving).
+    --archive-profile=NAME      Encoder profile for archive dir [default: V0].
     -c FILE --config=FILE       Path to INI config file.
+    --control-socket=FILE       UNIX socket the service listens on for the
+                                status, pause, resume, and sync-now commands.
+                                Defaults to .fam_control.sock in working dir.
+    --cpu-affinity=CPUS         Pin ffmpeg processes to these CPUs (e.g. 0,2-3).
+    --discovery-threads=NUM     Threads reading source/target files while
+                                looking for songs to convert [default: 1].
+    -e NAME --encoder-profile=NAME
+                                Encoder profile for songs synced to the card
+                                [default: V0]. See below.
     -f FILE --ffmpeg-bin=FILE   File path to ffmpeg binary.
                                 [default: {ffmpeg_default}]
+    --full-speed-hours=HOURS    Hours when conversion uses all --threads
+                                workers (e.g. 22-7). Unset means always.
     -h --help                   Show this screen.
     -i ADDR --ip-addr=ADDR      FlashAir hostname/IP address.
+    --ionice=CLASS              I/O scheduling class of ffmpeg processes: idle
+                                or best-effort:N (N is 0 highest to 7 lowest).
     -l FILE --log=FILE          Log to file. Will be rotated daily.
+    --metrics=ADDR              Serve Prometheus metrics over HTTP on this port,
+                                HOST:PORT, or UNIX socket path. Port alone
+                                listens on localhost.
+    --nice=NUM                  Niceness increment of ffmpeg processes (0-19).
+    --pinned-dirs=DIRS          Colon separated directories (relative to or in
+                                the music source) uploaded first by the pinned
+                                upload order policy.
+    --probe-timeout=SEC         Seconds to wait for the FlashAir card to accept
+                                a connection when checking if it is in range
+                                [default: 2].
     -q --quiet                  Don't print anything to stdout/stderr.
+    --reduced-threads=NUM       Conversion worker count outside of full speed
+                                hours [default: 1].
+    --remote-cache-ttl=SEC      Reuse the FlashAir card's file listing for this
+                                many seconds between syncs [default: 0].
     -s DIR --music-source=DIR   Source directory containing FLAC/MP3s.
                                 [default: ~/fam_music_source]
+    --stall-threshold=SEC       Log the stack of the event loop thread when it
+                                is blocked longer than this many seconds.
+                                Unset disables the watchdog.
+    --sync-hours=HOURS          Only sync to the FlashAir card during these
+                                hours (e.g. 1-6). Unset means always.
     -t NUM --threads=NUM        File conversion worker count [default: 0].
                                 0 is one worker per CPU.
+    -u ORDER --upload-order=ORDER
+                                Order songs are uploaded to the card in
+                                [default: size]. See below.
     -v --verbose                Debug logging.
     -V --version                Show version and exit.
     -w DIR --working-dir=DIR    Working directory for converted music, etc.
                                 [default: ~/fam_working_dir]
+
+Encoder profiles:
+    V0 through V9 are LAME VBR presets (V0 is best quality, V5 is about 130 kbps).
+    CBR32 through CBR320 are constant bitrates in kbps. Append +mono to downmix
+    and/or +RATE to resample (e.g. V5+mono or CBR96+22050) to fit more music on
+    the card.
+
+Upload order:
+    Comma separated policies, earlier ones win: pinned (songs in --pinned-dirs),
+    newest (recently modified songs), size (smallest songs), and album (finish a
+    directory before starting the next one). E.g. pinned,album,newest,size
+    uploads a new album before an old ringtone folder.
+
+Hours:
+    Comma separated hour ranges in 24-hour local time. The end hour is excluded
+    and ranges may wrap around midnight (e.g. 22-7 or 1-5,13-14). Reloaded on
+    SIGHUP.
+
+Signals:
+    SIGHUP reloads the config file. SIGUSR1 starts profiling and the next
+    SIGUSR1 stops it, writing cProfile stats, thread stack samples, and top
+    memory allocations into profiles in the working dir. SIGUSR2 scans the
+    whole music source for new songs (merged with a run already in progress)
+    and checks for the FlashAir card right away.
+
+Commands:
+    run starts the service. The others talk to the running service: status
+    shows ffmpeg jobs, queued conversions, upload progress, and the last scan
+    timings. pause stops ffmpeg processes (continued on resume) and/or uploads
+    after the current file (or part), both if neither is given. sync-now does
+    the same as SIGUSR2.
 """
 
 import asyncio
 import logging
+import os
 import signal
 import sys
 
-from flash_air_music.configuration import initialize_config, SIGNALS_INT_TO_NAME, update_config
+from flash_air_music.configuration import GLOBAL_MUTABLE_CONFIG, initialize_config, SIGNALS_INT_TO_NAME, update_config
+from flash_air_music.control import client, request_sync, serve as serve_control, socket_path
 from flash_air_music.convert.triggers import EVERY_SECONDS_PERIODIC, periodically_convert, watch_directory
 from flash_air_music.exceptions import BaseError
 from flash_air_music.lib import SHUTDOWN
+from flash_air_music.metrics import serve as serve_metrics
+from flash_air_music.profiler import PROFILER, PROFILES_DIR
 from flash_air_music.upload.triggers import watch_for_flashair
+from flash_air_music.watchdog import Watchdog
 
 
 def main():
@@ -46,14 +123,28 @@ def main():
     loop.add_signal_handler(signal.SIGHUP, update_config, __doc__, signal.SIGHUP)
     loop.add_signal_handler(signal.SIGINT, loop.create_task, shutdown(loop, signal.SIGINT, True))
     loop.add_signal_handler(signal.SIGTERM, loop.create_task, shutdown(loop, signal.SIGTERM, True))
+    loop.add_signal_handler(signal.SIGUSR1, toggle_profiling, signal.SIGUSR1)
+    loop.add_signal_handler(signal.SIGUSR2, sync_now, signal.SIGUSR2)
 
     log.info('Scheduling periodic tasks.')
     loop.call_later(EVERY_SECONDS_PERIODIC, loop.create_task, periodically_convert())
     loop.create_task(watch_directory())
     loop.create_task(watch_for_flashair())
+    loop.create_task(serve_control(socket_path(GLOBAL_MUTABLE_CONFIG)))
+    if GLOBAL_MUTABLE_CONFIG['--metrics']:
+        loop.create_task(serve_metrics(GLOBAL_MUTABLE_CONFIG['--metrics']))
+
+    watchdog = None
+    if GLOBAL_MUTABLE_CONFIG['--stall-threshold']:
+        watchdog = Watchdog(loop, float(GLOBAL_MUTABLE_CONFIG['--stall-threshold']))
+        watchdog.start()
 
     log.info('Running main loop.')
     loop.run_forever()
+    if watchdog is not None:
+        watchdog.stop()
+    if PROFILER.active:
+        PROFILER.stop(os.path.join(GLOBAL_MUTABLE_CONFIG['--working-dir'], PROFILES_DIR))
     loop.close()
     log.info('Main loop has exited.')
 
@@ -73,6 +164,27 @@ def shutdown(loop, signum, stop_loop=False):
         loop.create_task(stop(loop))
 
 
+def sync_now(signum):
+    """Request a full conversion run and FlashAir card check right away instead of waiting for the next trigger.
+
+    :param int signum: Signal caught.
+    """
+    log = logging.getLogger(__name__)
+    log.info('Caught signal %d (%s). Scanning for songs now.', signum, '/'.join(SIGNALS_INT_TO_NAME[signum]))
+    request_sync()
+
+
+def toggle_profiling(signum):
+    """Start profiling the service, or stop and write the results if already profiling.
+
+    :param int signum: Signal caught.
+    """
+    log = logging.getLogger(__name__)
+    log.info('Caught signal %d (%s). %s profiling.', signum, '/'.join(SIGNALS_INT_TO_NAME[signum]),
+             'Stopping' if PROFILER.active else 'Starting')
+    PROFILER.toggle(os.path.join(GLOBAL_MUTABLE_CONFIG['--working-dir'], PROFILES_DIR))
+
+
 @asyncio.coroutine
 def stop(loop):
     """Wait up to 5 seconds for tasks to cleanup before stopping event loop.
@@ -83,11 +195,12 @@ def stop(loop):
     log.info('Waiting up to 5 seconds for tasks to cleanup.')
 
     this_task = asyncio.Task.current_task()
-    for _ in range(50):
-        yield from asyncio.sleep(0.1)
+    deadline = loop.time() + 5
+    while loop.time() < deadline:
         running_tasks = [t for t in asyncio.Task.all_tasks() if not t.done() and t != this_task]
         if not running_tasks:
             break
+        yield from asyncio.wait(running_tasks, timeout=deadline - loop.time())  # Tasks may start others, check again.
     log.info('Stopping loop.')
     loop.stop()
 
@@ -96,7 +209,10 @@ def entry_point():
     """Entry-point from setuptools."""
     try:
         initialize_config(__doc__)
-        main()
+        if GLOBAL_MUTABLE_CONFIG['run']:
+            main()
+        else:
+            client(GLOBAL_MUTABLE_CONFIG)
     except BaseError:
         logging.critical('Failure.')
         sys.exit(1)
@@ -2,6 +2,7 @@
 
 import logging
 import os
+import platform
 import re
 import signal
 from distutils.spawn import find_executable
@@ -9,12 +10,19 @@ from distutils.spawn import find_executable
 import pkg_resources
 from docoptcfg import docoptcfg, DocoptcfgFileError
 
+from flash_air_music.convert.priority import parse_cpu_list, parse_ionice, SYS_IOPRIO_SET
+from flash_air_music.convert.profiles import is_valid, normalize
 from flash_air_music.exceptions import ConfigError
+from flash_air_music.metrics import parse_address
+from flash_air_music.schedule import parse_hours
 from flash_air_music.setup_logging import setup_logging
+from flash_air_music.upload.planner import parse_order, parse_pinned_dirs
 
 FFMPEG_DEFAULT_BINARY = find_executable('ffmpeg')
 FFMPEG_NOT_FOUND_LABEL = '<not found>'
 GLOBAL_MUTABLE_CONFIG = dict()
+PATH_OPTIONS = ('--archive-dir', '--config', '--control-socket', '--ffmpeg-bin', '--log', '--music-source',
+                '--working-dir')
 REGEX_IP_ADDR = re.compile(r'^[a-zA-Z0-9_.-]+$')
 SIGNALS_INT_TO_NAME = {v: {a for a, b in vars(signal).items() if a.startswith('SIG') and b == v}
                        for k, v in vars(signal).items() if k.startswith('SIG')}
@@ -35,18 +43,19 @@ def _get_arguments(doc):
     return docoptcfg(docstring, config_option='--config', env_prefix='FAM_', version=version)
 
 
-def _real_paths(config):
+def _real_paths(config, keys=PATH_OPTIONS):
     """Resolve relative paths in config to absolute/real paths.
 
     :param dict config: Configuration dict to validate.
+    :param iter keys: Options holding paths to resolve.
     """
-    for key in ('--config', '--ffmpeg-bin', '--log', '--music-source', '--working-dir'):
+    for key in keys:
         if not config[key]:
             continue
         config[key] = os.path.realpath(os.path.expanduser(config[key]))
 
 
-def _validate_config(config):  # pylint:disable=too-many-branches
+def _validate_config(config):  # pylint:disable=too-many-branches,too-many-statements
     """Validate config data.
 
     :raise flash_air_music.exceptions.ConfigError: On invalid data.
@@ -88,6 +97,26 @@ def _validate_config(config):  # pylint:disable=too-many-branches
         logging.getLogger(__name__).error('Music source dir cannot be in working directory.')
         raise ConfigError
 
+    # --archive-dir
+    if config['--archive-dir']:
+        if not os.path.isdir(config['--archive-dir']):
+            logging.getLogger(__name__).error('Archive directory does not exist: %s', config['--archive-dir'])
+            raise ConfigError
+        if not os.access(config['--archive-dir'], os.R_OK | os.W_OK | os.X_OK):
+            logging.getLogger(__name__).error('No access to archive directory: %s', config['--archive-dir'])
+            raise ConfigError
+        for other in (config['--music-source'], config['--working-dir']):
+            if config['--archive-dir'].startswith(other) or other.startswith(config['--archive-dir']):
+                logging.getLogger(__name__).error('Archive dir cannot be in or contain music source/working dirs.')
+                raise ConfigError
+
+    # --archive-profile and --encoder-profile
+    for key in ('--archive-profile', '--encoder-profile'):
+        if not is_valid(config[key]):
+            logging.getLogger(__name__).error('Invalid encoder profile: %s', config[key])
+            raise ConfigError
+        config[key] = normalize(config[key])  # Stored in converted files and compared on every scan.
+
     # --ip-addr
     if config['--ip-addr'] and not REGEX_IP_ADDR.match(config['--ip-addr']):
         logging.getLogger(__name__).error('Invalid hostname/IP address: %s', config['--ip-addr'])
@@ -111,10 +140,106 @@ def _validate_config(config):  # pylint:disable=too-many-branches
         logging.getLogger(__name__).error('Thread count must be a number: %s', config['--threads'])
         raise ConfigError
 
+    # --cpu-affinity
+    if config['--cpu-affinity']:
+        try:
+            parse_cpu_list(config['--cpu-affinity'])
+        except ValueError:
+            logging.getLogger(__name__).error('Invalid CPU list: %s', config['--cpu-affinity'])
+            raise ConfigError
+
+    # --nice
+    if config['--nice'] and (not config['--nice'].isdigit() or int(config['--nice']) > 19):
+        logging.getLogger(__name__).error('Nice level must be 0 through 19: %s', config['--nice'])
+        raise ConfigError
+
+    # --ionice
+    if config['--ionice']:
+        try:
+            parse_ionice(config['--ionice'])
+        except ValueError:
+            logging.getLogger(__name__).error('Invalid I/O scheduling class: %s', config['--ionice'])
+            raise ConfigError
+        if platform.machine() not in SYS_IOPRIO_SET:
+            logging.getLogger(__name__).error('I/O scheduling class not supported on %s.', platform.machine())
+            raise ConfigError
+
+    # --full-speed-hours and --sync-hours
+    for key in ('--full-speed-hours', '--sync-hours'):
+        if not config[key]:
+            continue
+        try:
+            parse_hours(config[key])
+        except ValueError:
+            logging.getLogger(__name__).error('Invalid hours for %s: %s', key, config[key])
+            raise ConfigError
+
+    # --reduced-threads and --discovery-threads
+    for key, label in (('--reduced-threads', 'Reduced'), ('--discovery-threads', 'Discovery')):
+        if not config[key].isdigit() or not int(config[key]):
+            logging.getLogger(__name__).error('%s thread count must be 1 or more: %s', label, config[key])
+            raise ConfigError
+
+    # --upload-order
+    try:
+        parse_order(config['--upload-order'])
+    except ValueError:
+        logging.getLogger(__name__).error('Invalid upload order: %s', config['--upload-order'])
+        raise ConfigError
+
+    # --pinned-dirs
+    try:
+        parse_pinned_dirs(config['--pinned-dirs'], config['--working-dir'], config['--music-source'])
+    except ValueError:
+        logging.getLogger(__name__).error('Pinned directories must be in the music source: %s', config['--pinned-dirs'])
+        raise ConfigError
+
+    # --probe-timeout
+    try:
+        if float(config['--probe-timeout']) <= 0:
+            raise ValueError
+    except ValueError:
+        logging.getLogger(__name__).error('Probe timeout must be more than 0 seconds: %s', config['--probe-timeout'])
+        raise ConfigError
+
+    # --remote-cache-ttl
+    ttl = config['--remote-cache-ttl']
+    if not ttl.isdigit():
+        logging.getLogger(__name__).error('Remote cache TTL must be 0 or more seconds: %s', ttl)
+        raise ConfigError
+
+    # --metrics
+    if config['--metrics']:
+        try:
+            parse_address(config['--metrics'])
+        except ValueError:
+            logging.getLogger(__name__).error('Invalid metrics address: %s', config['--metrics'])
+            raise ConfigError
+
+    # --stall-threshold
+    if config['--stall-threshold']:
+        try:
+            if float(config['--stall-threshold']) <= 0:
+                raise ValueError
+        except ValueError:
+            logging.getLogger(__name__).error('Stall threshold must be more than 0 seconds: %s',
+                                              config['--stall-threshold'])
+            raise ConfigError
+
+    # --control-socket
+    if config['--control-socket']:
+        parent = os.path.dirname(config['--control-socket'])
+        if not os.path.isdir(parent):
+            logging.getLogger(__name__).error('Control socket parent directory %s not a directory.', parent)
+            raise ConfigError
+
 
 def initialize_config(doc):
     """Called during initial startup. Read config data from command line and optionally a config file.
 
+    Commands talking to the running service (everything but run) only resolve the paths needed to find the control
+    socket. They skip validation and log to the console only, so they work without access to --log and other paths.
+
     :raise flash_air_music.exceptions.ConfigError: On invalid data.
 
     :param str doc: Docstring to pass to docoptcfg.
@@ -125,6 +250,12 @@ def initialize_config(doc):
         logging.getLogger(__name__).error('Config file specified but invalid: %s', exc.message)
         raise ConfigError
 
+    # Client commands.
+    if not GLOBAL_MUTABLE_CONFIG['run']:
+        _real_paths(GLOBAL_MUTABLE_CONFIG, ('--config', '--control-socket', '--working-dir'))
+        setup_logging(dict(GLOBAL_MUTABLE_CONFIG, **{'--log': None}))
+        return
+
     # Resolve relative paths.
     _real_paths(GLOBAL_MUTABLE_CONFIG)
 
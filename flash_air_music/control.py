@@ -0,0 +1,205 @@
+"""Control the running service over a UNIX socket with the status, pause, resume, and sync-now subcommands.
+
+The service listens on --control-socket (.fam_control.sock in the working directory by default). A client sends one
+JSON request line such as {"command": "pause", "targets": ["upload"]} and reads one JSON response line back. Responses
+have an "error" key if the request was invalid.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+
+from flash_air_music.convert.scheduler import SCHEDULER
+from flash_air_music.exceptions import ControlError
+from flash_air_music.lib import bind_unix_socket, wait_for_shutdown
+from flash_air_music.pipeline import PIPELINE, TARGETS
+
+COMMANDS = ('pause', 'resume', 'status', 'sync-now')
+REQUEST_TIMEOUT = 5  # Seconds.
+SOCKET_NAME = '.fam_control.sock'
+
+
+def socket_path(config):
+    """Get the control socket path.
+
+    :param dict config: Configuration dict.
+
+    :return: Value of --control-socket or its default in the working directory.
+    :rtype: str
+    """
+    return config['--control-socket'] or os.path.join(config['--working-dir'], SOCKET_NAME)
+
+
+def request_sync():
+    """Request a full conversion run and have watch_for_flashair() check for the card right away."""
+    SCHEDULER.request()
+    PIPELINE.wake_upload()
+
+
+def execute(request):
+    """Carry out one request.
+
+    :param dict request: Decoded request.
+
+    :return: JSON serializable response.
+    :rtype: dict
+    """
+    command = request.get('command')
+    if command not in COMMANDS:
+        return dict(error='Unknown command: {}'.format(command))
+
+    if command == 'status':
+        return PIPELINE.snapshot()
+
+    if command == 'sync-now':
+        request_sync()
+        return dict(message='Sync requested.')
+
+    targets = request.get('targets') or list(TARGETS)
+    if not isinstance(targets, list) or any(t not in TARGETS for t in targets):
+        return dict(error='Invalid targets: {}'.format(targets))
+    if command == 'pause':
+        PIPELINE.pause(targets)
+        return dict(message='Paused {}.'.format(', '.join(targets)))
+    PIPELINE.resume(targets)
+    return dict(message='Resumed {}.'.format(', '.join(targets)))
+
+
+@asyncio.coroutine
+def handle_request(reader, writer):
+    """Answer one request line.
+
+    :param asyncio.StreamReader reader: Client stream reader.
+    :param asyncio.StreamWriter writer: Client stream writer.
+    """
+    log = logging.getLogger(__name__)
+    try:
+        line = yield from asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+    except (asyncio.TimeoutError, ConnectionError, ValueError):
+        writer.close()
+        return
+
+    try:
+        request = json.loads(line.decode('utf-8'))
+        if not isinstance(request, dict):
+            raise ValueError
+    except ValueError:
+        response = dict(error='Invalid request.')
+    else:
+        log.debug('Control request: %s', request)
+        response = execute(request)
+    writer.write(json.dumps(response).encode('utf-8') + b'\n')
+    try:
+        yield from writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+
+@asyncio.coroutine
+def serve(path):
+    """Accept control requests until shutdown.
+
+    :param str path: UNIX socket path.
+    """
+    log = logging.getLogger(__name__)
+    try:
+        sock = bind_unix_socket(path, 0o177)  # Only the user running the service may pause it.
+        server = yield from asyncio.start_unix_server(handle_request, sock=sock)
+    except OSError as exc:
+        log.error('Unable to listen for control requests on %s: %s', path, exc)
+        return
+    log.info('Listening for control requests on %s', path)
+
+    yield from wait_for_shutdown(None)
+    server.close()
+    yield from server.wait_closed()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def send(path, request):
+    """Send one request to the service and wait for its response.
+
+    :raise OSError: When the service can't be reached.
+    :raise ValueError: On an invalid response.
+
+    :param str path: UNIX socket path.
+    :param dict request: Request to send.
+
+    :return: Decoded response.
+    :rtype: dict
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(REQUEST_TIMEOUT)
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return json.loads(data.decode('utf-8'))
+
+
+def format_status(status):
+    """Format the response of the status command for humans.
+
+    :param dict status: From Pipeline.snapshot().
+
+    :return: Multi-line text.
+    :rtype: str
+    """
+    lines = ['Paused: {}'.format(', '.join(status['paused']) or 'nothing')]
+
+    lines.append('Converting {} song(s), {} waiting.'.format(len(status['conversions']), status['pending']))
+    for conversion in status['conversions']:
+        lines.append('    {elapsed:8.1f}s  {song} (pid {pid})'.format(**conversion))
+
+    upload = status['upload']
+    if upload is None:
+        lines.append('Not uploading.')
+    else:
+        percent = 100.0 * upload['sent'] / upload['size'] if upload['size'] else 100.0
+        lines.append('Uploading {source}: {sent} of {size} bytes'.format(**upload) + ' ({:.0f}%).'.format(percent))
+
+    if status['scans']:
+        lines.append('Last scans:')
+        lines.extend('    {:8.2f}s  {}'.format(s, p) for p, s in sorted(status['scans'].items()))
+    else:
+        lines.append('No scans yet.')
+    return '\n'.join(lines)
+
+
+def client(config):
+    """Send the subcommand given on the command line to the running service and print the response.
+
+    :raise flash_air_music.exceptions.ControlError: When the service can't be reached or rejects the request.
+
+    :param dict config: Configuration dict with the docopt subcommand flags.
+    """
+    log = logging.getLogger(__name__)
+    command = [c for c in COMMANDS if config[c]][0]
+    request = dict(command=command)
+    if command in ('pause', 'resume'):
+        request['targets'] = [t for t in TARGETS if config[t]]
+    path = socket_path(config)
+
+    try:
+        response = send(path, request)
+    except OSError as exc:
+        log.error('Unable to reach the service on %s: %s', path, exc)
+        raise ControlError
+    except ValueError:
+        log.error('Invalid response from the service on %s', path)
+        raise ControlError
+    if 'error' in response:
+        log.error('Service rejected the request: %s', response['error'])
+        raise ControlError
+
+    print(format_status(response) if command == 'status' else response['message'])
@@ -3,10 +3,15 @@
 Target mp3 files hold source metadata in their ID3 comment tags. Each mp3 file is like a little database of itself.
 """
 
+import hashlib
+import itertools
 import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
 
 from flash_air_music.convert.id3_flac_tags import read_stored_metadata
-from flash_air_music.lib import BaseSong
+from flash_air_music.convert.profiles import DEFAULT_PROFILE
+from flash_air_music.lib import BaseSong, walk_files
 
 VALID_SOURCE_EXTENSIONS = ('.flac', '.mp3')
 
@@ -14,12 +19,34 @@ VALID_SOURCE_EXTENSIONS = ('.flac', '.mp3')
 class Song(BaseSong):
     """Holds information about one song. Handles source/destination file paths.
 
+    :ivar tuple extra_outputs: Song instances of the same source file encoded into other target directories.
     :ivar dict live_metadata: Current metadata of source and target files.
+    :ivar str profile: Name of the encoder profile used for the target file.
     :ivar str source: Source file path (usually FLAC file).
     :ivar dict stored_metadata: Previously recorded metadata of source and target files stored in target file ID3 tag.
     :ivar str target: Target file path (mp3 file).
     """
 
+    __slots__ = ('extra_outputs', 'profile')
+
+    def __init__(self, source, source_dir, target_dir, profile=DEFAULT_PROFILE, extra_outputs=(), source_stat=None):
+        """Constructor.
+
+        :param str source: Absolute source file path.
+        :param str source_dir: Root absolute source directory path.
+        :param str target_dir: Root absolute target directory path.
+        :param str profile: Encoder profile name for the target file.
+        :param iter extra_outputs: Pairs of profile name and root target directory, converted in the same ffmpeg run.
+        :param os.stat_result source_stat: Stat of source file from walk_source() to avoid stat'ing it again.
+        """
+        if source_stat is None:
+            source_stat = os.stat(source)  # Shared with extra outputs.
+        self.extra_outputs = ()  # Singleton, no memory used if there are no extra outputs.
+        self.profile = profile
+        super().__init__(source, source_dir, target_dir, source_stat)
+        if extra_outputs:
+            self.extra_outputs = tuple(Song(source, source_dir, d, p, (), source_stat) for p, d in extra_outputs)
+
     def _generate_target_path(self, source_dir, target_dir):
         """Generate self.target value.
 
@@ -44,9 +71,20 @@ class Song(BaseSong):
         size = int(source_stat.st_size)
         return self.live_metadata['source_mtime'] != mtime or self.live_metadata['source_size'] != size
 
-    def refresh_live_metadata(self):
-        """Read current file metadata of source and target file."""
-        super().refresh_live_metadata()
+    @property
+    def pending_outputs(self):
+        """Return this Song and/or its extra outputs that need to be converted."""
+        return [s for s in (self,) + self.extra_outputs if s.needs_action]
+
+    def refresh_live_metadata(self, source_stat=None):
+        """Read current file metadata of source and target file.
+
+        :param os.stat_result source_stat: Use this instead of calling os.stat() on the source file.
+        """
+        if source_stat is None and self.extra_outputs:
+            source_stat = os.stat(self.source)  # Shared with extra outputs.
+        super().refresh_live_metadata(source_stat)
+        self.live_metadata['profile'] = self.profile  # Re-convert if the configured profile changes.
         try:
             target_stat = os.stat(self.target)
             self.live_metadata['target_mtime'] = int(target_stat.st_mtime)
@@ -54,26 +92,72 @@ class Song(BaseSong):
         except FileNotFoundError:
             self.live_metadata['target_mtime'] = 0
             self.live_metadata['target_size'] = 0
+        for song in self.extra_outputs:
+            song.refresh_live_metadata(source_stat)
 
 
-def walk_source(source_dir):
+def walk_source(source_dir, directories=None):
     """Walk source directory and yield valid file paths.
 
     :param str source_dir: Source directory.
+    :param iter directories: Only yield files directly in these directories (not recursive). All if None.
+
+    :return: Yield file paths and their os.stat_result.
+    :rtype: tuple
+    """
+    if directories is None:
+        yield from walk_files(source_dir, VALID_SOURCE_EXTENSIONS)
+        return
+    for directory in sorted(directories):
+        yield from walk_files(directory, VALID_SOURCE_EXTENSIONS, recursive=False)
+
+
+def source_signatures(source_dir, directories=None):
+    """Compute one signature per source directory from its files' names, sizes, and mtimes.
+
+    Each file contributes a 64-bit hash that is summed into its directory's signature, so walk order doesn't matter and
+    nothing has to be sorted or buffered. Only signatures of directories holding songs are returned.
+
+    :param str source_dir: Source directory.
+    :param iter directories: Only sign these directories (not recursive). Whole source_dir if None.
+
+    :return: Signatures (int) keyed by directory path.
+    :rtype: dict
+    """
+    signatures = dict()
+    for path, source_stat in walk_source(source_dir, directories):
+        directory, name = os.path.split(path)
+        digest = hashlib.md5(name.encode('utf-8', 'surrogateescape'))
+        digest.update(struct.pack('<QQ', source_stat.st_size, source_stat.st_mtime_ns))
+        signature = signatures.get(directory, 0) + int.from_bytes(digest.digest()[:8], 'little')
+        signatures[directory] = signature & 0xFFFFFFFFFFFFFFFF
+    return signatures
+
+
+def changed_directories(previous, current):
+    """Compare two source_signatures() return values.
+
+    :param dict previous: Older signatures.
+    :param dict current: Newer signatures.
 
-    :return: Yield file paths.
-    :rtype: str
+    :return: Directories with added, removed, or modified songs.
+    :rtype: set
     """
-    for path in (os.path.join(root, f) for root, _, files in os.walk(source_dir) for f in files):
-        if os.path.splitext(path)[1].lower() in VALID_SOURCE_EXTENSIONS:
-            yield path
+    return {d for d in previous.keys() | current.keys() if previous.get(d) != current.get(d)}
 
 
-def get_songs(source_dir, target_dir):
+def get_songs(source_dir, target_dir, profile=DEFAULT_PROFILE, extra_outputs=(), threads=1, directories=None):
     """Walk source and target directories looking for files to convert.
 
+    With more than one thread each source directory's files are stat'ed and their target ID3 tags read in a thread
+    pool. Both mostly wait on the file system (especially network file systems), releasing the GIL.
+
     :param str source_dir: Source directory.
     :param str target_dir: Target directory.
+    :param str profile: Encoder profile name for files in the target directory.
+    :param iter extra_outputs: Pairs of profile name and additional target directory.
+    :param int threads: Number of threads reading files. 1 to do everything in the calling thread.
+    :param iter directories: Only look at files directly in these source directories. Whole source_dir if None.
 
     :return: Song instances that need conversion and list of all mp3 target files that need or don't need conversion.
     :rtype: tuple
@@ -81,41 +165,61 @@ def get_songs(source_dir, target_dir):
     valid_targets = list()
     songs = list()
 
-    for path in walk_source(source_dir):
-        song = Song(path, source_dir, target_dir)
+    def read_directory(files):
+        """Instantiate Song for every file in one directory. Runs in a worker thread.
+
+        :param list files: Source file paths and their os.stat_result.
+
+        :return: Song instances.
+        :rtype: list
+        """
+        return [Song(p, source_dir, target_dir, profile, extra_outputs, s) for p, s in files]
+
+    if threads > 1:
+        with ThreadPoolExecutor(threads) as executor:
+            grouped = itertools.groupby(walk_source(source_dir, directories), lambda i: os.path.dirname(i[0]))
+            futures = [executor.submit(read_directory, list(f)) for _, f in grouped]
+        all_songs = (s for f in futures for s in f.result())
+    else:
+        walked = walk_source(source_dir, directories)
+        all_songs = (Song(p, source_dir, target_dir, profile, extra_outputs, s) for p, s in walked)
+
+    for song in all_songs:
         valid_targets.append(song.target)
-        if song.needs_action:
+        valid_targets.extend(s.target for s in song.extra_outputs)
+        if song.pending_outputs:
             songs.append(song)
 
     return songs, valid_targets
 
 
-def files_dirs_to_delete(target_dir, valid_targets):
+def files_dirs_to_delete(target_dir, valid_targets, directories=None):
     """Walk source and target directories looking for files to delete and empty directories to remove.
 
     :param str target_dir: Target directory.
     :param iter valid_targets: List of valid target files from get_songs().
+    :param iter directories: Only look at files directly in these target directories. Whole target_dir if None.
 
     :return: Abandoned files to delete and empty directories to remove.
     :rtype: tuple
     """
     delete_files = set()
     remove_dirs = set()
+    valid_targets = set(valid_targets)
 
-    # Discover abandoned target files.
-    for path in (os.path.join(root, f) for root, _, files in os.walk(target_dir) for f in files):
-        if path in valid_targets:
-            continue
-        if path.lower().endswith('.mp3'):
-            delete_files.add(path)
-
-    # Discover empty directories.
-    for root, files in ((r, {os.path.join(r, f) for f in fs}) for r, _, fs in os.walk(target_dir)):
-        if root == target_dir:
-            continue
-        if not files:
-            remove_dirs.add(root)
-        elif not files - delete_files:
+    if directories is None:
+        walked = os.walk(target_dir)
+    else:
+        walked = (w for d in sorted(directories) for w in itertools.islice(os.walk(d), 1))  # Missing dirs skipped.
+
+    for root, _, files in walked:
+        # Discover abandoned target files.
+        paths = {os.path.join(root, f) for f in files}
+        abandoned = {p for p in paths if p not in valid_targets and p.lower().endswith('.mp3')}
+        delete_files.update(abandoned)
+
+        # Discover empty directories.
+        if root != target_dir and not paths - abandoned:
             remove_dirs.add(root)
 
     return delete_files, remove_dirs
@@ -7,6 +7,7 @@ import time
 
 from mutagen.id3 import COMM, ID3, ID3NoHeaderError
 
+from flash_air_music.convert.profiles import DEFAULT_PROFILE, normalize
 from flash_air_music.exceptions import CorruptedTargetFile
 
 COMMENT_DESCRIPTION = 'Generated by FlashAirMusic'
@@ -48,6 +49,7 @@ def read_stored_metadata(path):
     # Make sure there's no funny business in the JSON data.
     try:
         strict_data = dict(
+            profile=normalize(str(data.get('profile', DEFAULT_PROFILE))),  # Files converted before profiles were V0.
             source_mtime=int(data['source_mtime']),
             source_size=int(data['source_size']),
             target_mtime=int(data['target_mtime']),
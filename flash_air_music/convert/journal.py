@@ -0,0 +1,110 @@
+"""Record planned and finished conversions in the working directory so an interrupted run can be resumed.
+
+The journal is a text file holding one JSON document per line. The first line lists the source/target directories and
+every source file about to be converted. Each following line is the source file path of one finished conversion. Only
+one short line is appended per song so large imports don't rewrite the whole file over and over.
+"""
+
+import json
+import logging
+import os
+
+JOURNAL_NAME = '.fam_convert_journal'
+
+
+class Journal(object):
+    """Append-only journal of one conversion run.
+
+    :ivar str path: File path of the journal in the target directory.
+    :ivar str source_dir: Root absolute source directory path.
+    :ivar str target_dir: Root absolute target directory path.
+    """
+
+    def __init__(self, source_dir, target_dir):
+        """Constructor.
+
+        :param str source_dir: Root absolute source directory path.
+        :param str target_dir: Root absolute target directory path.
+        """
+        self._handle = None
+        self.path = os.path.join(target_dir, JOURNAL_NAME)
+        self.source_dir = source_dir
+        self.target_dir = target_dir
+
+    def close(self, remove):
+        """Close journal file handle.
+
+        :param bool remove: Also delete the journal file (run finished without interruption).
+        """
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        if remove:
+            self.remove()
+
+    def mark_done(self, song):
+        """Record one finished conversion.
+
+        :param flash_air_music.convert.discover.Song song: Song instance.
+        """
+        if self._handle is None:
+            return
+        self._handle.write(json.dumps(song.source) + '\n')
+        self._handle.flush()
+
+    def pending(self):
+        """Read a previous journal and return source file paths planned but never finished.
+
+        :return: Source file paths in planned order. Empty if there is no usable journal.
+        :rtype: list
+        """
+        log = logging.getLogger(__name__)
+        try:
+            with open(self.path) as handle:
+                lines = handle.read().splitlines()
+        except FileNotFoundError:
+            return list()
+        except (IOError, UnicodeDecodeError):
+            log.warning('Unable to read journal %s', self.path)
+            return list()
+
+        # Parse header.
+        try:
+            header = dict(json.loads(lines[0]))
+            planned = [str(p) for p in header['planned']]
+        except (IndexError, KeyError, TypeError, ValueError):
+            log.warning('Ignoring corrupted journal %s', self.path)
+            return list()
+        if header.get('source_dir') != self.source_dir or header.get('target_dir') != self.target_dir:
+            log.info('Ignoring journal from different source/target directories.')
+            return list()
+
+        # Parse finished songs. Last line may be truncated if the process was killed while writing it.
+        done = set()
+        for line in lines[1:]:
+            try:
+                done.add(json.loads(line))
+            except ValueError:
+                continue
+
+        return [p for p in planned if p not in done]
+
+    def plan(self, songs):
+        """Start a new journal listing every song about to be converted. Replaces any previous journal.
+
+        :param iter songs: List of Song instances.
+        """
+        self.close(remove=False)
+        header = dict(source_dir=self.source_dir, target_dir=self.target_dir, planned=[s.source for s in songs])
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as handle:
+            handle.write(json.dumps(header) + '\n')
+        os.replace(temporary, self.path)
+        self._handle = open(self.path, 'a')
+
+    def remove(self):
+        """Delete the journal file if it exists."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
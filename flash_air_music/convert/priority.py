@@ -0,0 +1,111 @@
+"""Lower the CPU and disk priority of ffmpeg processes so conversions don't starve other services on the same host.
+
+Settings are applied from the service to the ffmpeg process (every thread it has so far, later threads inherit them)
+right after it is started. Nothing runs in the forked child before exec: the service has other threads by then and
+running Python code there could deadlock on locks held by them at fork time.
+"""
+
+import ctypes
+import os
+import platform
+
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+SYS_IOPRIO_SET = {'aarch64': 30, 'armv6l': 314, 'armv7l': 314, 'i686': 289, 'x86_64': 251}  # No glibc wrapper.
+LIBC = ctypes.CDLL(None, use_errno=True)
+
+
+def parse_cpu_list(value):
+    """Parse a CPU list such as "0,2-3" (same format as taskset --cpu-list).
+
+    :raise ValueError: On invalid CPU list.
+
+    :param str value: CPU list.
+
+    :return: CPU numbers.
+    :rtype: set
+    """
+    cpus = set()
+    for item in value.split(','):
+        first, separator, last = item.partition('-')
+        last = last if separator else first
+        if not first.isdigit() or not last.isdigit() or int(first) > int(last):
+            raise ValueError('Invalid CPU range: {}'.format(item))
+        cpus.update(range(int(first), int(last) + 1))
+    if max(cpus) >= os.cpu_count():
+        raise ValueError('No such CPU: {}'.format(max(cpus)))
+    return cpus
+
+
+def parse_ionice(value):
+    """Parse an I/O scheduling class: "idle" or "best-effort:N" where N is 0 (highest) through 7 (lowest).
+
+    :raise ValueError: On invalid scheduling class.
+
+    :param str value: I/O scheduling class.
+
+    :return: ioprio value for the ioprio_set() system call.
+    :rtype: int
+    """
+    if value == 'idle':
+        return IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT
+    name, _, level = value.partition(':')
+    if name == 'best-effort' and level in [str(i) for i in range(8)]:
+        return IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT | int(level)
+    raise ValueError('Invalid I/O scheduling class: {}'.format(value))
+
+
+def set_ioprio(tid, ioprio):
+    """Set I/O priority of a thread.
+
+    :raise OSError: On failure or unsupported platform.
+
+    :param int tid: Thread (or process) ID.
+    :param int ioprio: Value from parse_ionice().
+    """
+    if platform.machine() not in SYS_IOPRIO_SET:
+        raise OSError('I/O priority not supported on {}.'.format(platform.machine()))
+    if LIBC.syscall(SYS_IOPRIO_SET[platform.machine()], IOPRIO_WHO_PROCESS, tid, ioprio) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def priority_settings(cpu_affinity, nice, ionice):
+    """Parse priority settings for apply_priority().
+
+    :param str cpu_affinity: CPU list to pin processes to, or None.
+    :param str nice: Niceness increment, or None.
+    :param str ionice: I/O scheduling class, or None.
+
+    :return: CPUs (or None), niceness increment, and ioprio value (or None). None if there is nothing to change.
+    :rtype: tuple
+    """
+    if not any((cpu_affinity, nice, ionice)):
+        return None
+    cpus = parse_cpu_list(cpu_affinity) if cpu_affinity else None
+    ioprio = parse_ionice(ionice) if ionice else None
+    return cpus, int(nice or 0), ioprio
+
+
+def apply_priority(pid, settings):
+    """Apply priority settings to every thread of a running process.
+
+    :raise OSError: On failure, including when the process already exited.
+
+    :param int pid: Process ID.
+    :param tuple settings: From priority_settings().
+    """
+    cpus, nice, ioprio = settings
+    try:
+        tids = sorted(int(t) for t in os.listdir('/proc/{}/task'.format(pid)))
+    except FileNotFoundError:
+        raise ProcessLookupError(pid)
+    for tid in tids:
+        if cpus is not None:
+            os.sched_setaffinity(tid, cpus)
+        if nice:
+            os.setpriority(os.PRIO_PROCESS, tid, min(os.getpriority(os.PRIO_PROCESS, tid) + nice, 19))
+        if ioprio is not None:
+            set_ioprio(tid, ioprio)
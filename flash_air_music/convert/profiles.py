@@ -0,0 +1,75 @@
+"""Named encoder profiles. Each one maps to the libmp3lame codec arguments passed to ffmpeg for one output file.
+
+A profile name is a bitrate mode optionally followed by modifiers, all separated by "+":
+    V0 through V9: LAME VBR presets, V0 is highest quality (~245 kbps), V5 is ~130 kbps.
+    CBR32 through CBR320: Constant bitrate in kbps.
+    mono: Downmix to one channel.
+    22050 (or any other value in SAMPLE_RATES): Resample to this many Hz.
+
+Examples: V0, V5+mono, CBR128+22050, V7+mono+22050
+
+Modifiers may be given in any order. normalize() spells every profile one way so the same settings compare equal.
+"""
+
+CBR_BITRATES = (32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)  # Valid for MPEG-1 Layer III.
+DEFAULT_PROFILE = 'V0'
+SAMPLE_RATES = (8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000)
+
+
+def codec_arguments(name):
+    """Get ffmpeg output arguments for an encoder profile.
+
+    :raise ValueError: On invalid profile name.
+
+    :param str name: Profile name (e.g. V0 or CBR128+mono).
+
+    :return: ffmpeg command line arguments to place before the output file path.
+    :rtype: list
+    """
+    mode, *modifiers = name.split('+')
+
+    # Bitrate mode.
+    if mode in ['V{}'.format(i) for i in range(10)]:
+        arguments = ['-qscale:a', mode[1:]]
+    elif mode in ['CBR{}'.format(i) for i in CBR_BITRATES]:
+        arguments = ['-b:a', '{}k'.format(mode[3:])]
+    else:
+        raise ValueError('Invalid bitrate mode: {}'.format(mode))
+
+    # Modifiers.
+    for modifier in modifiers:
+        if modifier == 'mono' and '-ac' not in arguments:
+            arguments.extend(['-ac', '1'])
+        elif modifier in [str(i) for i in SAMPLE_RATES] and '-ar' not in arguments:
+            arguments.extend(['-ar', modifier])
+        else:
+            raise ValueError('Invalid or repeated modifier: {}'.format(modifier))
+
+    return arguments
+
+
+def normalize(name):
+    """Sort modifiers of a profile name: mono first, then the sample rate. Doesn't validate.
+
+    :param str name: Profile name (e.g. V5+22050+mono).
+
+    :return: Normalized profile name (e.g. V5+mono+22050).
+    :rtype: str
+    """
+    mode, *modifiers = name.split('+')
+    return '+'.join([mode] + sorted(modifiers, key=lambda m: (m != 'mono', m)))
+
+
+def is_valid(name):
+    """Check if profile name is valid.
+
+    :param str name: Profile name.
+
+    :return: If codec_arguments() will accept it.
+    :rtype: bool
+    """
+    try:
+        codec_arguments(name)
+    except ValueError:
+        return False
+    return True
@@ -1,29 +1,203 @@
-"""Main coroutines that fire directory walking, song conversion, file deletion, and directory removal."""
+"""Main coroutines that fire directory walking, song conversion, file deletion, and directory removal.
+
+Walking the source and target directories and deleting orphans touch every file in the library and can take minutes on
+large or network mounted libraries. They run in the event loop's default executor so upload triggers, signal handlers,
+and ffmpeg process callbacks keep running meanwhile.
+"""
 
 import asyncio
 import logging
 import os
+import time
 
 from flash_air_music.configuration import GLOBAL_MUTABLE_CONFIG
-from flash_air_music.convert.discover import files_dirs_to_delete, get_songs
+from flash_air_music.convert.discover import files_dirs_to_delete, get_songs, Song
+from flash_air_music.convert.journal import Journal
+from flash_air_music.convert.profiles import DEFAULT_PROFILE
 from flash_air_music.convert.transcode import convert_songs
-from flash_air_music.lib import SEMAPHORE
+from flash_air_music.lib import SEMAPHORE, SHUTDOWN, wait_for_shutdown
+from flash_air_music.metrics import SONGS_DISCOVERED
+from flash_air_music.pipeline import PIPELINE
 
 CHANGE_WAIT = 0.5  # Seconds.
 
 
+def get_extra_outputs():
+    """Get additional outputs to encode every song into besides the working directory.
+
+    :return: Pairs of encoder profile name and root target directory.
+    :rtype: list
+    """
+    if not GLOBAL_MUTABLE_CONFIG['--archive-dir']:
+        return list()
+    return [(GLOBAL_MUTABLE_CONFIG['--archive-profile'], GLOBAL_MUTABLE_CONFIG['--archive-dir'])]
+
+
+def resume(journal, profile=DEFAULT_PROFILE, extra_outputs=()):
+    """Load songs left unconverted by an interrupted run. Skips discovery. Removes partially written target files.
+
+    :param flash_air_music.convert.journal.Journal journal: Journal of the previous run.
+    :param str profile: Encoder profile name for files in the target directory.
+    :param iter extra_outputs: Pairs of profile name and additional target directory.
+
+    :return: Song instances that still need conversion.
+    :rtype: list
+    """
+    log = logging.getLogger(__name__)
+    songs = list()
+    for path in journal.pending():
+        try:
+            song = Song(path, journal.source_dir, journal.target_dir, profile, extra_outputs)
+        except FileNotFoundError:
+            log.debug('Source file gone since journal was written: %s', path)
+            continue
+        for output in song.pending_outputs:
+            if output.live_metadata['target_size'] and not output.stored_metadata:
+                log.info('Removing stale partial file %s', output.target)
+                try:
+                    os.remove(output.target)
+                except IOError:
+                    log.info('Failed to remove %s', output.target)
+                output.refresh_live_metadata()
+        if song.pending_outputs:
+            songs.append(song)
+
+    if not songs:
+        journal.remove()
+        return songs
+    log.info('Resuming interrupted run: %d song%s left to convert.', len(songs), '' if len(songs) == 1 else 's')
+    return songs
+
+
+def scan(source_dir, target_dir, profile, extra_outputs, threads, directories):
+    """Find songs to convert, orphaned target files, and empty target directories. Blocking, runs in an executor.
+
+    :param str source_dir: Source directory.
+    :param str target_dir: Target directory.
+    :param str profile: Encoder profile name for files in the target directory.
+    :param iter extra_outputs: Pairs of profile name and additional target directory.
+    :param int threads: Number of threads reading files.
+    :param iter directories: Only scan these source directories (not recursive) and their target directories. Whole
+        source and target directories if None.
+
+    :return: 3 item tuple: Song instances, files to delete, directories to remove.
+    :rtype: tuple
+    """
+    relative = None if directories is None else {os.path.relpath(d, source_dir) for d in directories}
+    songs, valid_targets = get_songs(source_dir, target_dir, profile, extra_outputs, threads, directories)
+    delete_files, remove_dirs = set(), set()
+    for root in [target_dir] + [d for _, d in extra_outputs]:
+        scoped = None if relative is None else {os.path.normpath(os.path.join(root, r)) for r in relative}
+        root_delete_files, root_remove_dirs = files_dirs_to_delete(root, valid_targets, scoped)
+        delete_files.update(root_delete_files)
+        remove_dirs.update(root_remove_dirs)
+    return songs, delete_files, remove_dirs
+
+
+def delete_remove(delete_files, remove_dirs):
+    """Delete abandoned files and remove empty directories. Blocking, runs in an executor.
+
+    :param iter delete_files: Files to delete.
+    :param iter remove_dirs: Directories to remove. Removed deepest first.
+    """
+    log = logging.getLogger(__name__)
+    for file_ in delete_files:
+        log.info('Deleting %s', file_)
+        try:
+            os.remove(file_)
+        except IOError:
+            log.info('Failed to delete %s', file_)
+    for dir_ in sorted(remove_dirs, reverse=True):
+        log.info('Removing empty directory %s', dir_)
+        try:
+            os.rmdir(dir_)
+        except IOError:
+            log.info('Failed to remove %s', dir_)
+
+
+def split_settled(songs):
+    """Stat source files again and split songs into those done being written to and those still changing. Blocking.
+
+    Metadata of songs that changed is refreshed, so they settle once unchanged for one more CHANGE_WAIT. Songs whose
+    source file was removed meanwhile are dropped.
+
+    :param iter songs: Song instances.
+
+    :return: Songs unchanged since their metadata was last read and songs that changed.
+    :rtype: tuple
+    """
+    log = logging.getLogger(__name__)
+    settled, changing = list(), list()
+    for song in songs:
+        try:
+            changed = song.changed
+        except FileNotFoundError:
+            log.info('Source file removed while being written to: %s', song.source)
+            continue
+        if not changed:
+            settled.append(song)
+            continue
+        log.debug('Size/mtime changed for %s', song.source)
+        song.refresh_live_metadata()
+        changing.append(song)
+    return settled, changing
+
+
+@asyncio.coroutine
+def feed_settled(changing, queue):
+    """Keep polling songs still being written to, putting each batch that settles in the queue for convert_songs().
+
+    Only songs still changing are stat'ed every CHANGE_WAIT. None is put in the queue when all of them settled (or were
+    removed) or on shutdown.
+
+    :param iter changing: Songs still being written to from scan_wait().
+    :param asyncio.Queue queue: Queue read by convert_songs().
+    """
+    log = logging.getLogger(__name__)
+    loop = asyncio.get_event_loop()
+    try:
+        while changing:
+            log.info('%d song%s still being written to, waiting %f second%s...',
+                     len(changing), '' if len(changing) == 1 else 's',
+                     CHANGE_WAIT, '' if CHANGE_WAIT == 1 else 's')
+            if (yield from wait_for_shutdown(CHANGE_WAIT)):
+                return
+            settled, changing = yield from loop.run_in_executor(None, split_settled, changing)
+            if settled:
+                queue.put_nowait(settled)
+    finally:
+        queue.put_nowait(None)
+
+
 @asyncio.coroutine
-def scan_wait():
-    """Walk source directory for new songs and wait until they're done being written to if needed.
+def scan_wait(directories=None):
+    """Walk source directory for new songs and check which ones are done being written to.
+
+    Every song is stat'ed once more after CHANGE_WAIT. Songs still changing are returned separately so the others can be
+    converted without waiting for them (see feed_settled()).
 
-    :return: 3 item tuple of lists: Song instances, files to delete, directories to remove.
+    :param iter directories: Only scan these source directories (not recursive) and their target directories. The whole
+        source and target directories are scanned if None.
+
+    :return: 4 item tuple of lists: Song instances, files to delete, directories to remove, songs still changing.
     """
     log = logging.getLogger(__name__)
-    log.debug('Scanning for new/changed songs...')
     source_dir = GLOBAL_MUTABLE_CONFIG['--music-source']
     target_dir = GLOBAL_MUTABLE_CONFIG['--working-dir']
-    songs, valid_targets = get_songs(source_dir, target_dir)
-    delete_files, remove_dirs = files_dirs_to_delete(target_dir, valid_targets)
+    extra_outputs = get_extra_outputs()
+    profile = GLOBAL_MUTABLE_CONFIG['--encoder-profile']
+    threads = int(GLOBAL_MUTABLE_CONFIG['--discovery-threads'])
+    if directories is not None:
+        directories = {d for d in directories if d == source_dir or d.startswith(os.path.join(source_dir, ''))}
+        log.debug('Scanning for new/changed songs in %d director%s...',
+                  len(directories), 'y' if len(directories) == 1 else 'ies')
+    else:
+        log.debug('Scanning for new/changed songs...')
+    start_time = time.monotonic()
+    songs, delete_files, remove_dirs = yield from asyncio.get_event_loop().run_in_executor(
+        None, scan, source_dir, target_dir, profile, extra_outputs, threads, directories)
+    PIPELINE.scanned('convert_discover', time.monotonic() - start_time)
+    SONGS_DISCOVERED.inc(len(songs))
 
     # Log results.
     log.info('Found: %d new source song%s, %d orphaned target song%s, %d empty director%s.',
@@ -31,55 +205,66 @@ def scan_wait():
              len(delete_files), '' if len(delete_files) == 1 else 's',
              len(remove_dirs), 'y' if len(remove_dirs) == 1 else 'ies')
 
-    # Make sure files aren't still being written to.
-    while songs:
+    # Check if files are still being written to.
+    changing = list()
+    if songs:
         yield from asyncio.sleep(CHANGE_WAIT)
-        changed = [s for s in songs if s.changed]
-        if not changed:
-            break
-        for song in changed:
-            log.debug('Size/mtime changed for %s', song.source)
-            song.refresh_live_metadata()
-        log.info('%d song%s still being written to, waiting %f second%s...',
-                 len(changed), '' if len(changed) == 1 else 's',
-                 CHANGE_WAIT, '' if CHANGE_WAIT == 1 else 's')
+        start_time = time.monotonic()
+        songs, changing = yield from asyncio.get_event_loop().run_in_executor(None, split_settled, songs)
+        PIPELINE.scanned('convert_settle', time.monotonic() - start_time)
 
-    return songs, delete_files, remove_dirs
+    return songs, delete_files, remove_dirs, changing
 
 
 @asyncio.coroutine
-def convert_cleanup(songs, delete_files, remove_dirs):
+def convert_cleanup(songs, delete_files, remove_dirs, journal=None, changing=()):
     """Convert songs, delete abandoned songs in target directory, remove empty directories in target directory.
 
     :param songs: List of Song instances from scan_wait().
     :param delete_files: List of files to delete from scan_wait().
     :param remove_dirs: List of directories to delete from scan_wait().
+    :param flash_air_music.convert.journal.Journal journal: Record planned and finished conversions if not None.
+    :param changing: List of Song instances still being written to from scan_wait(). Converted once they settle.
     """
-    log = logging.getLogger(__name__)
-    if songs:
-        yield from convert_songs(songs)
-    for file_ in delete_files:
-        log.info('Deleting %s', file_)
-        try:
-            os.remove(file_)
-        except IOError:
-            log.info('Failed to delete %s', file_)
-    for dir_ in sorted(remove_dirs, reverse=True):
-        log.info('Removing empty directory %s', dir_)
+    if songs or changing:
+        if journal is not None:
+            journal.plan(list(songs) + list(changing))
+        queue, feeder = None, None
+        if changing:
+            queue = asyncio.Queue()
+            feeder = asyncio.get_event_loop().create_task(feed_settled(changing, queue))
         try:
-            os.rmdir(dir_)
-        except IOError:
-            log.info('Failed to remove %s', dir_)
+            yield from convert_songs(songs, journal, queue)
+        finally:
+            if feeder is not None:
+                feeder.cancel()
+            if journal is not None:
+                journal.close(remove=not SHUTDOWN.done())
+    if delete_files or remove_dirs:
+        yield from asyncio.get_event_loop().run_in_executor(None, delete_remove, delete_files, remove_dirs)
 
 
 @asyncio.coroutine
-def run():
-    """Wait for semaphore before running scan_convert_cleanup()."""
+def run(directories=None):
+    """Wait for semaphore before running scan_convert_cleanup(). Resume an interrupted run first if there is one.
+
+    :param iter directories: Passed to scan_wait() to only look at these source directories. None for everything.
+
+    :return: If the requested directories were scanned (False on shutdown while resuming an interrupted run).
+    :rtype: bool
+    """
     log = logging.getLogger(__name__)
     log.debug('Waiting for semaphore...')
     with (yield from SEMAPHORE):
         log.debug('Got semaphore lock.')
-        songs, delete_files, remove_dirs = yield from scan_wait()
-        if any([songs, delete_files, remove_dirs]):
-            yield from convert_cleanup(songs, delete_files, remove_dirs)
+        journal = Journal(GLOBAL_MUTABLE_CONFIG['--music-source'], GLOBAL_MUTABLE_CONFIG['--working-dir'])
+        songs = resume(journal, GLOBAL_MUTABLE_CONFIG['--encoder-profile'], get_extra_outputs())
+        if songs:
+            yield from convert_cleanup(songs, set(), set(), journal)  # Orphans are handled by the scan below.
+        scanned = not (songs and SHUTDOWN.done())  # Keep the journal for the next startup instead.
+        if scanned:
+            songs, delete_files, remove_dirs, changing = yield from scan_wait(directories)
+            if any([songs, delete_files, remove_dirs, changing]):
+                yield from convert_cleanup(songs, delete_files, remove_dirs, journal, changing)
     log.debug('Released lock.')
+    return scanned
@@ -0,0 +1,78 @@
+"""Coalesce conversion run requests from the periodic, watch, and signal triggers.
+
+Only one run() is active at a time. Any number of requests made while it's active mark the scheduler dirty and are
+merged into one follow-up run. Scopes merge too: the follow-up run scans the union of the requested source directories,
+or everything if any request asked for a full scan.
+"""
+
+import asyncio
+import logging
+
+from flash_air_music.convert.run import run
+from flash_air_music.lib import SHUTDOWN
+
+
+class Scheduler(object):
+    """Runs run() for requests, one at a time, merging requests made while a run is active.
+
+    :ivar asyncio.Task active: Task running requested runs. None if idle.
+    :ivar asyncio.Future pending: Done once the next run finishes. None if nothing was requested since that began.
+    :ivar set scope: Source directories of the next run. None for a full scan.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.active = None
+        self.pending = None
+        self.scope = None
+
+    def request(self, directories=None):
+        """Request a conversion run. Starts one right away if idle, otherwise merges into the next one.
+
+        :param iter directories: Only scan these source directories. None for a full scan.
+
+        :return: Future done once a run covering this request finishes. Its result is run()'s (if the requested
+            directories were scanned), False if the run was skipped, or run()'s exception if it raised.
+        :rtype: asyncio.Future
+        """
+        log = logging.getLogger(__name__)
+        if self.pending is None:
+            self.pending = asyncio.Future()
+            self.scope = None if directories is None else set(directories)
+        elif self.scope is not None:
+            if directories is None:
+                self.scope = None
+            else:
+                self.scope.update(directories)
+        if self.active is None:
+            self.active = asyncio.get_event_loop().create_task(self._run_pending())
+        else:
+            log.debug('Conversion run already active, queued %s scan.', 'full' if self.scope is None else 'partial')
+        return self.pending
+
+    @asyncio.coroutine
+    def _run_pending(self):
+        """Keep calling run() until no more runs are requested."""
+        log = logging.getLogger(__name__)
+        try:
+            while self.pending is not None:
+                future, directories = self.pending, self.scope
+                self.pending, self.scope = None, None
+                if SHUTDOWN.done():
+                    log.debug('Service shutting down, skipping requested conversion run.')
+                    future.set_result(False)
+                    continue
+                try:
+                    scanned = yield from run(directories)
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as exc:  # pylint: disable=broad-except
+                    future.set_exception(exc)
+                else:
+                    future.set_result(scanned)
+        finally:
+            self.active = None
+
+
+SCHEDULER = Scheduler()
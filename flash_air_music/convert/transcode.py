@@ -4,13 +4,19 @@ import asyncio
 import itertools
 import logging
 import os
+import re
 import signal
 import time
 
 from flash_air_music.configuration import GLOBAL_MUTABLE_CONFIG, SIGNALS_INT_TO_NAME
 from flash_air_music.convert.id3_flac_tags import write_stored_metadata
+from flash_air_music.convert.priority import apply_priority, priority_settings
+from flash_air_music.convert.profiles import codec_arguments
 from flash_air_music.exceptions import ShuttingDown
 from flash_air_music.lib import SHUTDOWN
+from flash_air_music.metrics import CONVERSION_QUEUE, CONVERSIONS, FFMPEG_REALTIME_FACTOR, FFMPEG_SECONDS
+from flash_air_music.pipeline import PIPELINE
+from flash_air_music.schedule import in_window
 
 SLEEP_FOR = 1  # Seconds.
 TIMEOUT = 5 * 60  # Seconds.
@@ -41,6 +47,71 @@ class Protocol(asyncio.SubprocessProtocol):
         self.exit_future.set_result(True)
 
 
+class Workers(object):
+    """Limit concurrent conversions to a worker count that follows --full-speed-hours.
+
+    The count is checked again whenever a song asks for a worker, so long runs speed up or slow down as the window
+    opens or closes. Lowering it doesn't stop running conversions, new ones just wait until enough have finished.
+
+    :ivar int active: Number of workers in use.
+    :ivar asyncio.Condition condition: Notified when a worker is released.
+    :ivar int count: Worker count from the last check.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.active = 0
+        self.condition = asyncio.Condition()
+        self.count = None
+
+    def limit(self):
+        """Get the worker count for the current hour, logging when it changes.
+
+        :return: Maximum number of concurrent conversions.
+        :rtype: int
+        """
+        log = logging.getLogger(__name__)
+        if in_window(GLOBAL_MUTABLE_CONFIG['--full-speed-hours']):
+            count = int(GLOBAL_MUTABLE_CONFIG['--threads']) or os.cpu_count()
+            if self.count is not None and count != self.count:
+                log.info('Inside full speed hours, using full worker count.')
+        else:
+            count = int(GLOBAL_MUTABLE_CONFIG['--reduced-threads'])
+            if count != self.count:
+                log.info('Outside of full speed hours, using reduced worker count.')
+        self.count = count
+        return count
+
+    @asyncio.coroutine
+    def acquire(self):
+        """Wait for a free worker."""
+        with (yield from self.condition):
+            while self.active >= self.limit():
+                yield from self.condition.wait()
+            self.active += 1
+
+    @asyncio.coroutine
+    def release(self):
+        """Free a worker and wake up songs waiting for one."""
+        with (yield from self.condition):
+            self.active -= 1
+            self.condition.notify_all()
+
+
+def parse_duration(stderr):
+    """Get the duration of the input file from ffmpeg's output.
+
+    :param bytes stderr: ffmpeg's stderr.
+
+    :return: Duration in seconds, or None if not found.
+    :rtype: float
+    """
+    match = re.search(br'Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)', stderr)
+    if not match:
+        return None
+    return int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3))
+
+
 def timeout_signals_generator():
     """Yield SIGINT, then SIGTERM, then infinitely SIGKILL.
 
@@ -53,10 +124,14 @@ def timeout_signals_generator():
 
 
 @asyncio.coroutine
-def convert_file(song):
+def convert_file(song, priority=None):
     """Convert one file to mp3. Store metadata in ID3 comment tag.
 
+    The source is decoded once and encoded into every output (song.target and extra outputs) that needs it, each with
+    its own encoder profile.
+
     :param flash_air_music.convert.discover.Song song: Song instance.
+    :param tuple priority: Settings from priority.priority_settings() to apply to ffmpeg once started.
 
     :return: Same Song instance, command, and exit status of command.
     :rtype: tuple
@@ -67,45 +142,65 @@ def convert_file(song):
         raise ShuttingDown
     start_time = time.time()
     timeout_signals = timeout_signals_generator()
-    command = [
-        GLOBAL_MUTABLE_CONFIG['--ffmpeg-bin'],
-        '-i', song.source,
-        '-codec:a', 'libmp3lame',
-        '-id3v2_version', '3',
-        '-map_metadata', '0',
-        '-qscale:a', '0',
-        '-y', '-sn', '-vn',
-        song.target,
-    ]
+    outputs = song.pending_outputs or [song]
+    command = [GLOBAL_MUTABLE_CONFIG['--ffmpeg-bin'], '-i', song.source]
+    for output in outputs:
+        command.extend(['-codec:a', 'libmp3lame', '-id3v2_version', '3', '-map_metadata', '0'])
+        command.extend(codec_arguments(output.profile))
+        command.extend(['-y', '-sn', '-vn', output.target])
+        os.makedirs(os.path.dirname(output.target), exist_ok=True)  # ffmpeg won't create missing directories.
 
     # Start process.
     log.info('Converting %s', song.name)
     loop = asyncio.get_event_loop()
     transport, protocol = yield from loop.subprocess_exec(Protocol, *command, stdin=None)
     pid = transport.get_pid()
+    if priority is not None:
+        try:
+            apply_priority(pid, priority)
+        except OSError as exc:
+            log.warning('Unable to lower priority of process %d: %s', pid, exc)
+    PIPELINE.conversion_started(pid, song.name, transport)
 
-    # Wait for process to finish.
+    # Wait for process to finish. Time spent paused doesn't count towards TIMEOUT or the ffmpeg metrics.
     log.debug('Process %d started with command %s with timeout %d.', pid, str(command), TIMEOUT)
-    while not protocol.exit_future.done():
-        log.debug('Process %d still running...', pid)
-        if SHUTDOWN.done():
-            send_signal = next(timeout_signals)
-            if send_signal == signal.SIGINT and SHUTDOWN.result() != signal.SIGINT:
-                send_signal = next(timeout_signals)  # Start with SIGTERM instead.
-            log.info('Service shutdown initiated, sending %s to %d', '/'.join(SIGNALS_INT_TO_NAME[send_signal]), pid)
-            transport.send_signal(send_signal)
-        elif time.time() - start_time > TIMEOUT and timeout_signals:
-            send_signal = next(timeout_signals)
-            log.warning('Timeout exceeded, sending signal %d to pid %d.', send_signal, pid)
-            transport.send_signal(send_signal)
-        yield from asyncio.sleep(SLEEP_FOR)
-    yield from protocol.exit_future
+    checked_time = time.time()
+    try:
+        while not protocol.exit_future.done():
+            log.debug('Process %d still running...', pid)
+            now = time.time()
+            if PIPELINE.is_paused('convert'):
+                start_time += now - checked_time
+            checked_time = now
+            if SHUTDOWN.done():
+                send_signal = next(timeout_signals)
+                if send_signal == signal.SIGINT and SHUTDOWN.result() != signal.SIGINT:
+                    send_signal = next(timeout_signals)  # Start with SIGTERM instead.
+                log.info('Service shutdown initiated, sending %s to %d', '/'.join(SIGNALS_INT_TO_NAME[send_signal]),
+                         pid)
+                transport.send_signal(send_signal)
+                if PIPELINE.is_paused('convert'):
+                    transport.send_signal(signal.SIGCONT)  # Stopped processes only act on signals once continued.
+            elif now - start_time > TIMEOUT and timeout_signals:
+                send_signal = next(timeout_signals)
+                log.warning('Timeout exceeded, sending signal %d to pid %d.', send_signal, pid)
+                transport.send_signal(send_signal)
+            yield from asyncio.sleep(SLEEP_FOR)
+        yield from protocol.exit_future
+    finally:
+        PIPELINE.conversion_finished(pid)
 
     # Get results.
     transport.close()
     exit_status = transport.get_returncode()
     stdout = bytes(protocol.stdout)
     stderr = bytes(protocol.stderr)
+    wall_time = time.time() - start_time
+    FFMPEG_SECONDS.observe(wall_time)
+    CONVERSIONS.inc(result='failed' if exit_status else 'succeeded')
+    duration = parse_duration(stderr)
+    if not exit_status and duration and wall_time > 0:
+        FFMPEG_REALTIME_FACTOR.observe(duration / wall_time)
     log.debug('Process %d exited %d', pid, exit_status)
     log.debug('Process %d stdout: %s', pid, stdout.decode('utf-8'))
     log.debug('Process %d stderr: %s', pid, stderr.decode('utf-8'))
@@ -114,49 +209,79 @@ def convert_file(song):
     if exit_status:
         log.error('Failed to convert %s! ffmpeg exited %d.', song.name, exit_status)
         log.error('Error output of %s: %s', str(command), stderr.decode('utf-8'))
-        if os.path.isfile(song.target):
-            log.error('Removing %s', song.target)
-            os.remove(song.target)
+        for output in (o for o in outputs if os.path.isfile(o.target)):
+            log.error('Removing %s', output.target)
+            os.remove(output.target)
     else:
-        log.debug('Storing metadata in %s', os.path.basename(song.target))
-        write_stored_metadata(song)
+        for output in outputs:
+            log.debug('Storing metadata in %s', os.path.basename(output.target))
+            write_stored_metadata(output)
 
     return song, command, exit_status
 
 
 @asyncio.coroutine
-def bottleneck(conversion_semaphore, song):
-    """Wait for conversion_semaphore before running convert_file().
+def bottleneck(workers, song, journal=None, priority=None):
+    """Wait for a worker (and for conversions to be resumed if paused) before running convert_file().
 
-    :param asyncio.Semaphore conversion_semaphore: Semaphore() instance.
+    :param Workers workers: Workers instance shared by all songs.
     :param flash_air_music.convert.discover.Song song: Song instance.
+    :param flash_air_music.convert.journal.Journal journal: Record finished conversions here if not None.
+    :param tuple priority: Passed to convert_file().
 
     :return: convert_file() return value.
     :rtype: tuple
     """
     log = logging.getLogger(__name__)
-    log.debug('%s: waiting for conversion_semaphore...', song.name)
+    log.debug('%s: waiting for a worker...', song.name)
+    CONVERSION_QUEUE.inc()
+    queued = True
     try:
-        with (yield from conversion_semaphore):
-            log.debug('%s: got conversion_semaphore lock.', song.name)
-            return (yield from convert_file(song))
+        yield from workers.acquire()
+        try:
+            yield from PIPELINE.wait_resumed('convert')
+            CONVERSION_QUEUE.inc(-1)
+            queued = False
+            log.debug('%s: got a worker.', song.name)
+            result = yield from convert_file(song, priority)
+            if journal is not None and (result[-1] == 0 or not SHUTDOWN.done()):
+                journal.mark_done(song)  # Failures not caused by shutdown won't be fixed by retrying on restart.
+            return result
+        finally:
+            yield from workers.release()
     finally:
-        log.debug('%s: released lock.', song.name)
+        if queued:
+            CONVERSION_QUEUE.inc(-1)
+        log.debug('%s: released worker.', song.name)
 
 
 @asyncio.coroutine
-def convert_songs(songs):
+def convert_songs(songs, journal=None, queue=None):
     """Convert all songs concurrently.
 
     :param iter songs: List of Song instances.
+    :param flash_air_music.convert.journal.Journal journal: Record finished conversions here if not None.
+    :param asyncio.Queue queue: Also convert lists of Song instances put here while converting, until None is put.
     """
     log = logging.getLogger(__name__)
-    workers = int(GLOBAL_MUTABLE_CONFIG['--threads']) or os.cpu_count()
-    conversion_semaphore = asyncio.Semaphore(workers)
+    workers = Workers()
+    priority = priority_settings(
+        GLOBAL_MUTABLE_CONFIG['--cpu-affinity'],
+        GLOBAL_MUTABLE_CONFIG['--nice'],
+        GLOBAL_MUTABLE_CONFIG['--ionice'],
+    )
 
     # Execute all.
-    log.info('Beginning to convert %d file(s) up to %d at a time.', len(songs), workers)
-    nested = yield from asyncio.wait([bottleneck(conversion_semaphore, s) for s in songs])
+    log.info('Beginning to convert %d file(s) up to %d at a time.', len(songs), workers.limit())
+    loop = asyncio.get_event_loop()
+    tasks = [loop.create_task(bottleneck(workers, s, journal, priority)) for s in songs]
+    while queue is not None:
+        batch = yield from queue.get()
+        if batch is None:
+            break
+        log.info('Adding %d file(s) done being written to.', len(batch))
+        tasks.extend(loop.create_task(bottleneck(workers, s, journal, priority)) for s in batch)
+    nested = (yield from asyncio.wait(tasks)) if tasks else ()
     results = [t for s in nested for t in s]
     succeeded = [t for t in (r.result() for r in results if not r.exception()) if t[-1] == 0]
     log.info('Done converting %d file(s) (%d failed).', len(results), len(results) - len(succeeded))
@@ -1,14 +1,13 @@
 """Main callers of convert functions/coroutines. Run indefinitely."""
 
 import asyncio
-import hashlib
 import logging
-import os
 
 from flash_air_music.configuration import GLOBAL_MUTABLE_CONFIG
-from flash_air_music.convert.discover import walk_source
-from flash_air_music.convert.run import run
-from flash_air_music.lib import SHUTDOWN
+from flash_air_music.convert.discover import changed_directories, source_signatures
+from flash_air_music.convert.scheduler import SCHEDULER
+from flash_air_music.convert.watch_state import directory_mtimes, WatchState
+from flash_air_music.lib import SHUTDOWN, wait_for_shutdown
 
 EVERY_SECONDS_PERIODIC = 60 * 60
 EVERY_SECONDS_WATCH = 5 * 60
@@ -16,46 +15,70 @@ EVERY_SECONDS_WATCH = 5 * 60
 
 @asyncio.coroutine
 def periodically_convert():
-    """Call run() every EVERY_SECONDS_PERIODIC unless semaphore is locked."""
+    """Request a full run() every EVERY_SECONDS_PERIODIC. Merged with other requests made while a run is active."""
     log = logging.getLogger(__name__)
     while True:
-        yield from run()
+        yield from SCHEDULER.request()
         log.debug('periodically_convert() sleeping %d seconds.', EVERY_SECONDS_PERIODIC)
-        for _ in range(EVERY_SECONDS_PERIODIC):
-            yield from asyncio.sleep(1)
-            if SHUTDOWN.done():
-                log.debug('periodically_convert() saw shutdown signal.')
-                return
+        if (yield from wait_for_shutdown(EVERY_SECONDS_PERIODIC)):
+            log.debug('periodically_convert() saw shutdown signal.')
+            return
         log.debug('periodically_convert() waking up.')
 
 
+def watch_state():
+    """Get WatchState for the current configuration.
+
+    :return: WatchState instance.
+    :rtype: flash_air_music.convert.watch_state.WatchState
+    """
+    settings = {k: GLOBAL_MUTABLE_CONFIG[k] for k in ('--archive-dir', '--archive-profile', '--encoder-profile')}
+    return WatchState(GLOBAL_MUTABLE_CONFIG['--music-source'], GLOBAL_MUTABLE_CONFIG['--working-dir'], settings)
+
+
 @asyncio.coroutine
 def watch_directory():
     """Watch directory by recursing into it every EVERY_SECONDS_WATCH.
 
-    Compare size and mtimes between periods. Is responsible for converting on startup.
+    Compare size and mtimes between periods. Is responsible for converting on startup. Only directories that changed are
+    scanned by run() after the first pass. periodically_convert() catches anything missed with full scans.
+
+    Signatures are saved in the working directory after every run. On startup they're loaded instead of walking every
+    file so an unchanged library isn't scanned again after a restart (see watch_state). Directory mtimes are only read
+    when the state is loaded or saved. A change landing between signing and reading them is caught by the next pass.
+    Walking and signing run in the default executor.
     """
     log = logging.getLogger(__name__)
-    previous_hash = None
-    array = bytearray()
+    loop = asyncio.get_event_loop()
+    previous_signatures, previous_source_dir = None, None
     ramp_up = list(range(EVERY_SECONDS_WATCH, 15, -35))
     while True:
         sleep_for = ramp_up.pop() if ramp_up else EVERY_SECONDS_WATCH
         source_dir = GLOBAL_MUTABLE_CONFIG['--music-source']  # Keep in loop for when update_config() is called.
-        for i in sorted((p, s.st_size, s.st_mtime) for p, s in ((p, os.stat(p)) for p in walk_source(source_dir))):
-            array.extend(str(i).encode('utf-8'))
-        current_hash = hashlib.md5(array).hexdigest()
-        array.clear()
-        if current_hash != previous_hash:
+        state = watch_state()
+        current_signatures, mtimes = None, None
+        if source_dir != previous_source_dir:
+            previous_source_dir = source_dir
+            mtimes = yield from loop.run_in_executor(None, directory_mtimes, source_dir)
+            previous_signatures, current_signatures = yield from loop.run_in_executor(None, state.warm_start, mtimes)
+        if current_signatures is None:  # Full scan.
+            current_signatures = yield from loop.run_in_executor(None, source_signatures, source_dir)
+        if current_signatures != previous_signatures:
+            dirty = None
+            if previous_signatures is not None:
+                dirty = changed_directories(previous_signatures, current_signatures)
+                log.debug('watch_directory() %d director%s changed.', len(dirty), 'y' if len(dirty) == 1 else 'ies')
+            if mtimes is None:
+                mtimes = yield from loop.run_in_executor(None, directory_mtimes, source_dir)
             log.debug('watch_directory() file system changed, calling run().')
-            yield from run()
-            previous_hash = current_hash
+            scanned = yield from SCHEDULER.request(dirty)
+            previous_signatures = current_signatures
+            if scanned and not SHUTDOWN.done():  # Run may have been skipped or cut short.
+                state.save(current_signatures, mtimes)
         else:
             log.debug('watch_directory() no change in file system, not calling run().')
         log.debug('watch_directory() sleeping %d seconds.', sleep_for)
-        for _ in range(sleep_for):
-            yield from asyncio.sleep(1)
-            if SHUTDOWN.done():
-                log.debug('watch_directory() saw shutdown signal.')
-                return
+        if (yield from wait_for_shutdown(sleep_for)):
+            log.debug('watch_directory() saw shutdown signal.')
+            return
         log.debug('watch_directory() waking up.')
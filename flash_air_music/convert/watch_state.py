@@ -0,0 +1,119 @@
+"""Persist watch_directory()'s source signatures in the working directory so a restart can skip the first full scan.
+
+The state file holds one JSON document: the source directory, settings that decide what conversion produces, the mtime
+of every source directory when the signatures were computed, and the signatures themselves. At startup only directories
+are listed and stat'ed. Directories whose mtime differs (songs added, removed, or renamed) are signed again and scanned.
+Songs modified in place without touching their directory's mtime are picked up by the next periodic full scan.
+"""
+
+import json
+import logging
+import os
+
+from flash_air_music.convert.discover import source_signatures
+from flash_air_music.convert.journal import JOURNAL_NAME
+from flash_air_music.lib import walk_files
+
+STATE_NAME = '.fam_watch_state'
+
+
+def directory_mtimes(source_dir):
+    """Walk source directory reading only the mtime of each directory, not of the files in them. Blocking.
+
+    :param str source_dir: Source directory.
+
+    :return: mtimes (st_mtime_ns) keyed by directory path.
+    :rtype: dict
+    """
+    return {path: stat.st_mtime_ns for path, stat in walk_files(source_dir, (), directories=True)}
+
+
+class WatchState(object):
+    """Source signatures of the last completed conversion run.
+
+    :ivar str path: File path of the state file in the target directory.
+    :ivar dict settings: Settings the signatures are valid for. Songs must be converted again if any of these change.
+    :ivar str source_dir: Root absolute source directory path.
+    :ivar str target_dir: Root absolute target directory path.
+    """
+
+    def __init__(self, source_dir, target_dir, settings):
+        """Constructor.
+
+        :param str source_dir: Root absolute source directory path.
+        :param str target_dir: Root absolute target directory path.
+        :param dict settings: Settings the signatures are valid for (JSON serializable).
+        """
+        self.path = os.path.join(target_dir, STATE_NAME)
+        self.settings = settings
+        self.source_dir = source_dir
+        self.target_dir = target_dir
+
+    def load(self):
+        """Read the state file.
+
+        :return: Signatures and directory mtimes, or None if there is no usable state.
+        :rtype: tuple
+        """
+        log = logging.getLogger(__name__)
+        try:
+            with open(self.path) as handle:
+                data = json.load(handle)
+        except FileNotFoundError:
+            return None
+        except (IOError, ValueError):
+            log.warning('Ignoring corrupted watch state %s', self.path)
+            return None
+
+        try:
+            if data['source_dir'] != self.source_dir or data['settings'] != self.settings:
+                log.info('Ignoring watch state from different source directory or settings.')
+                return None
+            signatures = {str(k): int(v) for k, v in dict(data['signatures']).items()}
+            mtimes = {str(k): int(v) for k, v in dict(data['mtimes']).items()}
+        except (KeyError, TypeError, ValueError):
+            log.warning('Ignoring corrupted watch state %s', self.path)
+            return None
+        return signatures, mtimes
+
+    def save(self, signatures, mtimes):
+        """Replace the state file.
+
+        :param dict signatures: From source_signatures().
+        :param dict mtimes: From directory_mtimes(), read before the signatures were computed.
+        """
+        log = logging.getLogger(__name__)
+        data = dict(source_dir=self.source_dir, settings=self.settings, signatures=signatures, mtimes=mtimes)
+        temporary = self.path + '.tmp'
+        try:
+            with open(temporary, 'w') as handle:
+                json.dump(data, handle)
+            os.replace(temporary, self.path)
+        except IOError:
+            log.warning('Unable to write watch state %s', self.path)
+
+    def warm_start(self, mtimes):
+        """Load saved signatures and sign again only directories whose mtime changed since they were saved.
+
+        Nothing is used if an interrupted conversion run left a journal behind, so run() gets to resume it.
+
+        :param dict mtimes: Current directory_mtimes().
+
+        :return: Saved signatures and up to date signatures. Both None if there is no usable state.
+        :rtype: tuple
+        """
+        log = logging.getLogger(__name__)
+        if os.path.exists(os.path.join(self.target_dir, JOURNAL_NAME)):
+            log.info('Interrupted conversion run found, not using watch state.')
+            return None, None
+        loaded = self.load()
+        if loaded is None:
+            return None, None
+        signatures, saved_mtimes = loaded
+
+        dirty = {d for d in saved_mtimes.keys() | mtimes.keys() if saved_mtimes.get(d) != mtimes.get(d)}
+        current = {d: s for d, s in signatures.items() if d not in dirty}
+        current.update(source_signatures(self.source_dir, {d for d in dirty if d in mtimes}))
+        log.info('Loaded watch state, %d of %d source director%s changed since the last run.',
+                 len(dirty), len(mtimes), 'y' if len(mtimes) == 1 else 'ies')
+        return signatures, current
@@ -9,6 +9,10 @@ class ConfigError(BaseError):
     """Error while reading configuration data."""
 
 
+class ControlError(BaseError):
+    """Error while sending a command to the running service."""
+
+
 class CorruptedTargetFile(BaseError):
     """Error while operating on converted target file."""
 
@@ -2,26 +2,39 @@
 
 import asyncio
 import os
+import socket
+import stat
+
+try:
+    from os import scandir
+except ImportError:  # Python 3.4.
+    scandir = None
 
 SEMAPHORE = asyncio.Semaphore()  # Main semaphore shared by convert and upload coroutines/functions.
 SHUTDOWN = asyncio.Future()  # Signals service shutdown if future has result.
 
 
 class BaseSong(object):
-    """Base class to be subclassed by local and remote Song classes."""
+    """Base class to be subclassed by local and remote Song classes.
+
+    Uses __slots__ (as must subclasses) since large libraries create one instance per song during every scan.
+    """
+
+    __slots__ = ('live_metadata', 'source', 'stored_metadata', 'target')
 
-    def __init__(self, source, source_dir, target_dir):
+    def __init__(self, source, source_dir, target_dir, source_stat=None):
         """Constructor.
 
         :param str source: Absolute source file path.
         :param str source_dir: Root absolute source directory path.
         :param str target_dir: Root absolute target directory path.
+        :param os.stat_result source_stat: Stat of source file from walk_files() to avoid stat'ing it again.
         """
         self.live_metadata = dict()
         self.source = source
         self.stored_metadata = dict()
         self.target = self._generate_target_path(source_dir, target_dir)
-        self.refresh_live_metadata()
+        self.refresh_live_metadata(source_stat)
         self._refresh_stored_metadata()
 
     def __repr__(self):
@@ -53,8 +66,122 @@ class BaseSong(object):
         """Skip file if nothing has changed."""
         return self.live_metadata != self.stored_metadata
 
-    def refresh_live_metadata(self):
-        """Read current metadata of local file(s) right now."""
-        source_stat = os.stat(self.source)
+    def refresh_live_metadata(self, source_stat=None):
+        """Read current metadata of local file(s) right now.
+
+        :param os.stat_result source_stat: Use this instead of calling os.stat() on the source file.
+        """
+        if source_stat is None:
+            source_stat = os.stat(self.source)
         self.live_metadata['source_mtime'] = int(source_stat.st_mtime)
         self.live_metadata['source_size'] = int(source_stat.st_size)
+
+
+def bind_unix_socket(path, umask=None):
+    """Bind a UNIX socket, replacing a stale socket file left behind by a killed process.
+
+    A socket file nothing is listening on is removed first. One still answering is left alone so binding fails.
+
+    :raise OSError: When binding fails (e.g. another process is listening on `path`).
+
+    :param str path: Socket path.
+    :param int umask: Create the socket file with this umask instead of the process' (e.g. 0o177 for owner only).
+
+    :return: Bound socket.
+    :rtype: socket.socket
+    """
+    try:
+        is_socket = stat.S_ISSOCK(os.stat(path).st_mode)
+    except FileNotFoundError:
+        is_socket = False
+    if is_socket:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.remove(path)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    previous = None if umask is None else os.umask(umask)
+    try:
+        sock.bind(path)
+    except OSError:
+        sock.close()
+        raise
+    finally:
+        if previous is not None:
+            os.umask(previous)
+    return sock
+
+
+def walk_files(top, extensions, recursive=True, directories=False):
+    """Recursively walk a directory yielding files with matching extensions and their stat results.
+
+    Uses os.scandir() when available so directories are told apart from files without stat'ing them. Each matching file
+    is stat'ed exactly once. Files that disappear during the walk are skipped. Every directory's files are yielded
+    together, before its subdirectories.
+
+    :param str top: Directory to walk.
+    :param iter extensions: Lower case file extensions to yield (e.g. .mp3).
+    :param bool recursive: Also walk subdirectories. Otherwise only files directly in `top` are yielded.
+    :param bool directories: Also yield every walked directory (stat'ed before it's listed) ahead of its files.
+
+    :return: Yield file path and os.stat_result pairs.
+    :rtype: tuple
+    """
+    if scandir is None:
+        for root, _, files in os.walk(top):
+            if directories:
+                try:
+                    yield root, os.stat(root)
+                except FileNotFoundError:
+                    continue
+            for path in (os.path.join(root, f) for f in files if os.path.splitext(f)[1].lower() in extensions):
+                try:
+                    yield path, os.stat(path)
+                except FileNotFoundError:
+                    continue
+            if not recursive:
+                break
+        return
+
+    pending = [top]
+    while pending:
+        directory = pending.pop()
+        try:
+            directory_stat = os.stat(directory) if directories else None
+            entries = list(scandir(directory))
+        except OSError:
+            continue  # Same as os.walk().
+        if directory_stat is not None:
+            yield directory, directory_stat
+        subdirectories = list()
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirectories.append(entry.path)  # Don't follow symlinks, same as os.walk().
+                elif os.path.splitext(entry.name)[1].lower() in extensions:
+                    yield entry.path, entry.stat()
+            except FileNotFoundError:
+                continue
+        if recursive:
+            pending.extend(reversed(subdirectories))
+
+
+@asyncio.coroutine
+def wait_for_shutdown(seconds, wakeup=None):
+    """Sleep until `seconds` pass or service shutdown is initiated, whichever comes first.
+
+    Waits on the SHUTDOWN future itself instead of polling it so an idle service doesn't wake up periodically.
+
+    :param float seconds: Maximum number of seconds to sleep.
+    :param asyncio.Future wakeup: Also stop sleeping when this future is done.
+
+    :return: If service shutdown was initiated.
+    :rtype: bool
+    """
+    if not SHUTDOWN.done():
+        futures = [SHUTDOWN] if wakeup is None else [SHUTDOWN, wakeup]
+        yield from asyncio.wait(futures, timeout=seconds, return_when=asyncio.FIRST_COMPLETED)
+    return SHUTDOWN.done()
@@ -0,0 +1,305 @@
+"""Counters, gauges, and histograms exported in the Prometheus text exposition format.
+
+Every metric is defined here and updated by the modules doing the work, from the event loop, executor threads, and the
+watchdog thread. Each metric has a lock held while its values are updated or read, so concurrent updates aren't lost.
+serve() answers HTTP GET requests on the --metrics address from the event loop without blocking it.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+
+from flash_air_music.lib import bind_unix_socket, wait_for_shutdown
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+FACTOR_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+REGISTRY = list()
+REQUEST_TIMEOUT = 5  # Seconds.
+
+
+def escape(value):
+    """Escape a label value.
+
+    :param str value: Label value.
+
+    :return: Escaped value.
+    :rtype: str
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def parse_address(value):
+    """Parse a --metrics address.
+
+    :raise ValueError: On invalid address.
+
+    :param str value: Port, HOST:PORT, or absolute UNIX socket path.
+
+    :return: Host and port, or socket path and None.
+    :rtype: tuple
+    """
+    if value.startswith('/'):
+        return value, None
+    host, _, port = value.rpartition(':')
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError('Invalid metrics address: {}'.format(value))
+    return host.strip('[]') or '127.0.0.1', int(port)
+
+
+class Metric(object):
+    """Base class of all metrics. Registers itself in REGISTRY.
+
+    :ivar str help: Description.
+    :ivar tuple labels: Label names.
+    :ivar threading.Lock lock: Held while reading or updating values.
+    :ivar str name: Metric name.
+    :ivar dict values: Current value(s) keyed by label values.
+    """
+
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        """Constructor.
+
+        :param str name: Metric name.
+        :param str help_text: Description.
+        :param iter labels: Label names.
+        """
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.name = name
+        self.values = dict()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        """Label values in order.
+
+        :raise KeyError: When a label is missing.
+
+        :param dict labels: Label names and values.
+
+        :return: Label values.
+        :rtype: tuple
+        """
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def _selector(self, key, extra=()):
+        """Format labels of one sample.
+
+        :param tuple key: Label values.
+        :param iter extra: Additional label name and value pairs.
+
+        :return: Label set in braces, or empty string without labels.
+        :rtype: str
+        """
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(n, escape(v)) for n, v in pairs) + '}'
+
+    def samples(self):
+        """Yield exposition lines of current values.
+
+        :return: Lines.
+        :rtype: iter
+        """
+        with self.lock:
+            values = dict(self.values)
+        if not values and not self.labels:
+            yield '{} 0'.format(self.name)
+        for key, value in sorted(values.items()):
+            yield '{}{} {}'.format(self.name, self._selector(key), value)
+
+    def render(self):
+        """Format the metric.
+
+        :return: Lines in text exposition format.
+        :rtype: list
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """Value that only goes up."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Increment counter.
+
+        :param amount: Increment by this much.
+        :param labels: Label values.
+        """
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that goes up and down."""
+
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        """Increment gauge.
+
+        :param amount: Increment by this much (negative to decrement).
+        :param labels: Label values.
+        """
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Set gauge.
+
+        :param value: New value.
+        :param labels: Label values.
+        """
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """Distribution of observed values counted in buckets.
+
+    :ivar tuple buckets: Upper bounds of buckets in ascending order, +Inf is implied.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        """Constructor.
+
+        :param str name: Metric name.
+        :param str help_text: Description.
+        :param iter labels: Label names.
+        :param iter buckets: Upper bounds of buckets.
+        """
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Record one value.
+
+        :param value: Observed value.
+        :param labels: Label values.
+        """
+        key = self._key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ((0,) * len(self.buckets), 0, 0))
+            counts = tuple(c + 1 if value <= b else c for b, c in zip(self.buckets, counts))
+            self.values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        """Yield exposition lines of cumulative buckets, sum, and count.
+
+        :return: Lines.
+        :rtype: iter
+        """
+        with self.lock:
+            values = dict(self.values)
+        if not values and not self.labels:
+            values = {(): ((0,) * len(self.buckets), 0, 0)}
+        for key, (counts, total, count) in sorted(values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield '{}_bucket{} {}'.format(self.name, self._selector(key, [('le', bound)]), bucket_count)
+            yield '{}_bucket{} {}'.format(self.name, self._selector(key, [('le', '+Inf')]), count)
+            yield '{}_sum{} {}'.format(self.name, self._selector(key), total)
+            yield '{}_count{} {}'.format(self.name, self._selector(key), count)
+
+
+CARD_REACHABLE = Gauge('fam_card_reachable', 'If the FlashAir card accepted a connection at the last probe.')
+CONVERSION_QUEUE = Gauge('fam_conversion_queue_depth', 'Songs waiting for a free conversion worker.')
+CONVERSIONS = Counter('fam_conversions_total', 'Finished song conversions.', ['result'])
+FFMPEG_REALTIME_FACTOR = Histogram('fam_ffmpeg_realtime_factor', 'Seconds of audio converted per second.',
+                                   buckets=FACTOR_BUCKETS)
+FFMPEG_SECONDS = Histogram('fam_ffmpeg_seconds', 'Wall time of ffmpeg processes.')
+FLASHAIR_REQUEST_SECONDS = Histogram('fam_flashair_request_seconds', 'Latency of FlashAir HTTP requests.',
+                                     ['endpoint'])
+FLASHAIR_REQUESTS = Counter('fam_flashair_requests_total', 'FlashAir HTTP requests by response status.',
+                            ['endpoint', 'status'])
+LOOP_LAG_SECONDS = Histogram('fam_event_loop_lag_seconds', 'Time for the event loop to run a watchdog callback.',
+                             buckets=LAG_BUCKETS)
+LOOP_STALLS = Counter('fam_event_loop_stalls_total', 'Event loop stalls longer than --stall-threshold.')
+SCAN_SECONDS = Histogram('fam_scan_seconds', 'Duration of each scan phase.', ['phase'])
+SONGS_DISCOVERED = Counter('fam_songs_discovered_total', 'New or changed source songs found by scans.')
+UPLOAD_BYTES = Counter('fam_upload_bytes_total', 'Bytes uploaded to the FlashAir card.')
+UPLOAD_BYTES_PER_SECOND = Gauge('fam_upload_bytes_per_second', 'Rolling upload throughput estimate.')
+UPLOAD_RETRIES = Counter('fam_upload_retries_total', 'Sync attempts retried after losing the FlashAir card.')
+
+
+def render():
+    """Format every registered metric.
+
+    :return: Text exposition format document.
+    :rtype: str
+    """
+    return ''.join(line + '\n' for metric in REGISTRY for line in metric.render())
+
+
+@asyncio.coroutine
+def handle_request(reader, writer):
+    """Answer one HTTP request with all metrics. Only reads the request line and headers.
+
+    :param asyncio.StreamReader reader: Client stream reader.
+    :param asyncio.StreamWriter writer: Client stream writer.
+    """
+    try:
+        request_line = yield from asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+        for _ in range(100):
+            if (yield from asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)) in (b'\r\n', b'\n', b''):
+                break
+    except (asyncio.TimeoutError, ConnectionError, ValueError):
+        writer.close()
+        return
+
+    parts = request_line.split()
+    if len(parts) < 2 or parts[0] != b'GET':
+        status, body = '405 Method Not Allowed', b''
+    elif parts[1].split(b'?')[0] not in (b'/', b'/metrics'):
+        status, body = '404 Not Found', b''
+    else:
+        status, body = '200 OK', render().encode('utf-8')
+    header = 'HTTP/1.0 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'
+    writer.write(header.format(status, CONTENT_TYPE, len(body)).encode('ascii') + body)
+    try:
+        yield from writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+
+@asyncio.coroutine
+def serve(address):
+    """Serve metrics until shutdown.
+
+    :param str address: Value of --metrics.
+    """
+    log = logging.getLogger(__name__)
+    host, port = parse_address(address)
+    try:
+        if port is None:
+            server = yield from asyncio.start_unix_server(handle_request, sock=bind_unix_socket(host))
+        else:
+            server = yield from asyncio.start_server(handle_request, host, port)
+    except OSError as exc:
+        log.error('Unable to serve metrics on %s: %s', address, exc)
+        return
+    log.info('Serving metrics on %s', address)
+
+    yield from wait_for_shutdown(None)
+    server.close()
+    yield from server.wait_closed()
+    if port is None:
+        try:
+            os.remove(host)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,195 @@
+"""Live state of the conversion and upload pipeline, and switches to pause parts of it.
+
+Conversions and uploads report what they are doing here for the status command of the control socket. Pausing
+conversions stops (SIGSTOP) running ffmpeg processes and holds back queued songs, resuming continues them where they
+left off. Pausing uploads stops the sync after the file (or part of a large file) being sent, the rest is uploaded by
+the next sync after resuming.
+"""
+
+import asyncio
+import logging
+import signal
+import time
+
+from flash_air_music.lib import SHUTDOWN
+from flash_air_music.metrics import CONVERSION_QUEUE, SCAN_SECONDS
+
+TARGETS = ('convert', 'upload')
+
+
+class Pipeline(object):
+    """What the service is working on right now.
+
+    :ivar dict conversions: Running ffmpeg processes: pid -> song name, subprocess transport, time.monotonic() started.
+    :ivar set paused: Paused targets (items of TARGETS).
+    :ivar dict resumed: Futures done when a paused target is resumed, keyed by target.
+    :ivar dict scans: Duration in seconds of the last run of each scan phase.
+    :ivar dict upload: Source path, size, and bytes sent of the file being uploaded. None between uploads.
+    :ivar flash_air_music.upload.telemetry.CountingReader upload_reader: Reader of the upload request in progress.
+    :ivar asyncio.Future wakeup: Done when a sync is requested before watch_for_flashair()'s next check.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.conversions = dict()
+        self.paused = set()
+        self.resumed = dict()
+        self.scans = dict()
+        self.upload = None
+        self.upload_reader = None
+        self.wakeup = None
+
+    def conversion_finished(self, pid):
+        """Forget an ffmpeg process.
+
+        :param int pid: Process ID.
+        """
+        self.conversions.pop(pid, None)
+
+    def conversion_started(self, pid, name, transport):
+        """Record a running ffmpeg process. It is stopped right away if conversions are paused.
+
+        :param int pid: Process ID.
+        :param str name: Song name.
+        :param asyncio.SubprocessTransport transport: Transport of the process, used to stop and continue it.
+        """
+        self.conversions[pid] = (name, transport, time.monotonic())
+        if 'convert' in self.paused:
+            transport.send_signal(signal.SIGSTOP)
+
+    def is_paused(self, target):
+        """Check if a target is paused.
+
+        :param str target: Item of TARGETS.
+
+        :return: If paused.
+        :rtype: bool
+        """
+        return target in self.paused
+
+    def pause(self, targets):
+        """Pause conversions and/or uploads.
+
+        :param iter targets: Items of TARGETS.
+        """
+        log = logging.getLogger(__name__)
+        for target in (t for t in targets if t not in self.paused):
+            log.info('Pausing %s.', target)
+            self.paused.add(target)
+            if target == 'convert':
+                self._signal_conversions(signal.SIGSTOP)
+
+    def resume(self, targets):
+        """Resume paused conversions and/or uploads.
+
+        :param iter targets: Items of TARGETS.
+        """
+        log = logging.getLogger(__name__)
+        for target in (t for t in targets if t in self.paused):
+            log.info('Resuming %s.', target)
+            self.paused.discard(target)
+            if target == 'convert':
+                self._signal_conversions(signal.SIGCONT)
+            else:
+                self.wake_upload()
+            future = self.resumed.pop(target, None)
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    def scanned(self, phase, seconds):
+        """Record the duration of a scan phase here and in SCAN_SECONDS.
+
+        :param str phase: Scan phase name.
+        :param float seconds: Duration.
+        """
+        self.scans[phase] = seconds
+        SCAN_SECONDS.observe(seconds, phase=phase)
+
+    def snapshot(self):
+        """Current state for the status command.
+
+        :return: JSON serializable state.
+        :rtype: dict
+        """
+        now = time.monotonic()
+        conversions = [dict(pid=p, song=n, elapsed=now - s) for p, (n, _, s) in sorted(self.conversions.items())]
+        upload = None
+        if self.upload is not None:
+            upload = dict(self.upload)
+            reader = self.upload_reader
+            if reader is not None:
+                upload['sent'] += reader.count
+        return dict(
+            conversions=conversions,
+            paused=sorted(self.paused),
+            pending=CONVERSION_QUEUE.values.get((), 0),
+            scans=dict(self.scans),
+            upload=upload,
+        )
+
+    def upload_finished(self):
+        """Forget the file being uploaded."""
+        self.upload, self.upload_reader = None, None
+
+    def upload_sending(self, reader):
+        """Record the reader of an upload request about to be sent.
+
+        :param flash_air_music.upload.telemetry.CountingReader reader: Reader passed to the API.
+        """
+        self.upload_reader = reader
+
+    def upload_sent(self, count):
+        """Add bytes of a finished upload request (or a part left on the card by an earlier attempt) to the progress.
+
+        :param int count: Bytes.
+        """
+        if self.upload is not None:
+            self.upload['sent'] += count
+        self.upload_reader = None
+
+    def upload_started(self, source, size):
+        """Record the file about to be uploaded.
+
+        :param str source: Local file path.
+        :param int size: File size in bytes.
+        """
+        self.upload, self.upload_reader = dict(source=source, size=size, sent=0), None
+
+    def upload_wakeup(self):
+        """New future for watch_for_flashair() to sleep on, replacing the previous one.
+
+        :return: Future done when wake_upload() is called.
+        :rtype: asyncio.Future
+        """
+        self.wakeup = asyncio.Future()
+        return self.wakeup
+
+    @asyncio.coroutine
+    def wait_resumed(self, target):
+        """Wait until the target is not paused or service shutdown is initiated.
+
+        :param str target: Item of TARGETS.
+        """
+        while target in self.paused and not SHUTDOWN.done():
+            if target not in self.resumed:
+                self.resumed[target] = asyncio.Future()
+            yield from asyncio.wait([self.resumed[target], SHUTDOWN], return_when=asyncio.FIRST_COMPLETED)
+
+    def wake_upload(self):
+        """Have watch_for_flashair() check for the card right away."""
+        if self.wakeup is not None and not self.wakeup.done():
+            self.wakeup.set_result(None)
+
+    def _signal_conversions(self, signum):
+        """Send a signal to every running ffmpeg process.
+
+        :param int signum: Signal to send.
+        """
+        for pid, (_, transport, _) in list(self.conversions.items()):
+            try:
+                transport.send_signal(signum)
+            except ProcessLookupError:
+                logging.getLogger(__name__).debug('Process %d already exited.', pid)
+
+
+PIPELINE = Pipeline()
@@ -0,0 +1,150 @@
+"""Profile the running service on demand.
+
+SIGUSR1 starts a profiling session and the next SIGUSR1 stops it. Each session writes three files named after the time
+it started into the profiles directory in --working-dir:
+    .pstats: cProfile stats of the event loop thread (open with python -m pstats).
+    .samples.txt: Stacks of every other thread (scans and uploads run in executor threads) sampled every
+        SAMPLE_INTERVAL, in collapsed stack format (one "thread;frame;frame count" line per stack) for flame graphs.
+    .tracemalloc.txt: TOP_ALLOCATIONS lines with the largest growth in allocated memory during the session.
+"""
+
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+PROFILES_DIR = 'profiles'
+SAMPLE_INTERVAL = 0.01  # Seconds.
+TOP_ALLOCATIONS = 25
+
+
+class Sampler(threading.Thread):
+    """Thread sampling the stacks of all other threads except the event loop thread.
+
+    :ivar dict counts: Number of samples of each stack, keyed by thread name and frames (outermost first).
+    :ivar int skip_thread: Thread identifier of the thread not to sample.
+    :ivar threading.Event stopping: Set by stop().
+    """
+
+    def __init__(self, skip_thread):
+        """Constructor.
+
+        :param int skip_thread: Thread identifier of the thread not to sample (profiled by cProfile instead).
+        """
+        super().__init__(name='sampler', daemon=True)
+        self.counts = dict()
+        self.skip_thread = skip_thread
+        self.stopping = threading.Event()
+
+    def collapsed(self):
+        """Format samples in collapsed stack format.
+
+        :return: Lines, most sampled stacks first.
+        :rtype: list
+        """
+        ranked = sorted(self.counts.items(), key=lambda i: (-i[1], i[0]))
+        return ['{} {}'.format(';'.join((name,) + frames), count) for (name, frames), count in ranked]
+
+    def run(self):
+        """Sample until stop() is called."""
+        while not self.stopping.wait(SAMPLE_INTERVAL):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+                if ident in (self.ident, self.skip_thread):
+                    continue
+                frames = list()
+                while frame is not None:
+                    frames.append('{}:{}'.format(frame.f_globals.get('__name__', '?'), frame.f_code.co_name))
+                    frame = frame.f_back
+                key = (names.get(ident, str(ident)), tuple(reversed(frames)))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stop(self):
+        """Stop sampling and wait for the thread to exit."""
+        self.stopping.set()
+        if self.is_alive():
+            self.join()
+
+
+class Profiler(object):
+    """One profiling session at a time.
+
+    :ivar cProfile.Profile profile: Profiler of the event loop thread. None if no session is active.
+    :ivar Sampler sampler: Sampler of other threads.
+    :ivar tracemalloc.Snapshot snapshot: Allocations when the session started.
+    :ivar str started: Local time the session started, used in file names.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.profile = None
+        self.sampler = None
+        self.snapshot = None
+        self.started = None
+
+    @property
+    def active(self):
+        """If a session is active."""
+        return self.profile is not None
+
+    def start(self):
+        """Start a session. Must be called from the event loop thread."""
+        log = logging.getLogger(__name__)
+        self.started = time.strftime('%Y%m%d-%H%M%S')
+        tracemalloc.start()
+        self.snapshot = tracemalloc.take_snapshot()
+        self.sampler = Sampler(threading.get_ident())
+        self.sampler.start()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        log.info('Started profiling.')
+
+    def stop(self, directory):
+        """Stop the session and write its results.
+
+        :param str directory: Write files into this directory, created if missing.
+
+        :return: Paths of written files.
+        :rtype: list
+        """
+        log = logging.getLogger(__name__)
+        self.profile.disable()
+        self.sampler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        growth = snapshot.filter_traces(ignore).compare_to(self.snapshot.filter_traces(ignore), 'lineno')
+        prefix = os.path.join(directory, self.started)
+
+        paths = [prefix + '.pstats', prefix + '.samples.txt', prefix + '.tracemalloc.txt']
+        try:
+            os.makedirs(directory, exist_ok=True)
+            self.profile.dump_stats(paths[0])
+            with open(paths[1], 'w') as handle:
+                handle.writelines(line + '\n' for line in self.sampler.collapsed())
+            with open(paths[2], 'w') as handle:
+                handle.writelines(str(stat) + '\n' for stat in growth[:TOP_ALLOCATIONS])
+        except OSError as exc:
+            log.error('Unable to write profile to %s: %s', directory, exc)
+            paths = list()
+        else:
+            log.info('Stopped profiling, wrote %s.{pstats,samples.txt,tracemalloc.txt}', prefix)
+        finally:
+            self.__init__()
+        return paths
+
+    def toggle(self, directory):
+        """Start a session or stop the active one.
+
+        :param str directory: Passed to stop().
+        """
+        if self.active:
+            self.stop(directory)
+        else:
+            self.start()
+
+
+PROFILER = Profiler()
@@ -0,0 +1,71 @@
+"""Time windows limiting when heavy conversion and upload work runs at full speed.
+
+A window is a comma separated list of hour ranges in 24-hour local time. Ranges include the start hour and exclude the
+end hour, and may wrap around midnight. For example "22-7" is 10pm through 6:59am and "1-5,13-14" is 1am through
+4:59am plus 1pm through 1:59pm. An unset window (None) means always.
+"""
+
+import time
+
+
+def parse_hours(value):
+    """Parse a window string into the hours of the day it covers.
+
+    :raise ValueError: On invalid window.
+
+    :param str value: Window string (e.g. 22-7).
+
+    :return: Hours (0-23) inside the window.
+    :rtype: set
+    """
+    hours = set()
+    for item in value.split(','):
+        start, _, end = item.partition('-')
+        if not start.isdigit() or not end.isdigit() or int(start) > 23 or int(end) > 24 or int(start) == int(end):
+            raise ValueError('Invalid hour range: {}'.format(item))
+        if int(start) < int(end):
+            hours.update(range(int(start), int(end)))
+        else:
+            hours.update(range(int(start), 24))
+            hours.update(range(0, int(end)))
+    return hours
+
+
+def in_window(value, hour=None):
+    """Check if the current hour is inside a window.
+
+    :param str value: Window string or None for always.
+    :param int hour: Hour to check instead of the current local time.
+
+    :return: True if inside the window.
+    :rtype: bool
+    """
+    if not value:
+        return True
+    if hour is None:
+        hour = time.localtime().tm_hour
+    return hour in parse_hours(value)
+
+
+def seconds_left(value, now=None):
+    """Seconds until the current window ends.
+
+    :param str value: Window string or None for always.
+    :param time.struct_time now: Local time to check instead of the current local time.
+
+    :return: Seconds left (0 if outside the window), or None if the window never ends.
+    :rtype: int
+    """
+    if not value:
+        return None
+    hours = parse_hours(value)
+    if len(hours) == 24:
+        return None
+    if now is None:
+        now = time.localtime()
+    whole_hours = 0
+    while (now.tm_hour + whole_hours) % 24 in hours:
+        whole_hours += 1
+    if not whole_hours:
+        return 0
+    return whole_hours * 3600 - now.tm_min * 60 - now.tm_sec
@@ -0,0 +1,84 @@
+-- Join part files uploaded in chunks into `arg_destination`, verify its size, and remove the parts.
+--
+-- Runs on a FlashAir WiFi SD card.
+-- Example usage: http://flashair/MUSIC/_fam_join.lua?/MUSIC/_fam_part_0a1b2c3d_%203%202500000%20/MUSIC/_fam_staged.bin
+-- Parts are named `arg_prefix` followed by 000.bin, 001.bin, and so on. They are removed after joining whether or not
+-- the size is correct, so a bad join is retried from scratch by the FlashAirMusic server. Errors are reported in the
+-- "error" field of the JSON response (empty on success) along with a non-200 status.
+-- https://github.com/Robpol86/FlashAirMusic
+
+BLOCK_SIZE = 4096
+
+arg_prefix = (arg[1] or ''):gsub('^%s*(.-)%s*$', '%1')  -- FlashAir seems to add a newline on the last arg item.
+arg_count = (arg[2] or ''):gsub('^%s*(.-)%s*$', '%1')
+arg_size = (arg[3] or ''):gsub('^%s*(.-)%s*$', '%1')
+arg_destination = table.concat({select(4, unpack(arg))}, ' '):gsub('^%s*(.-)%s*$', '%1')
+return_data = {error='', arg_prefix=arg_prefix, arg_count=arg_count, arg_size=arg_size,
+               arg_destination=arg_destination}
+
+
+-- Terminate program early.
+function exit(status, message)
+    if message then return_data['error'] = message end
+    print(('HTTP/1.1 %s'):format(status))
+    print('Content-Type: application/json')
+    print('')
+    print(cjson.encode(return_data))
+    os.exit()  -- Calling os.anything causes script to exit/crash.
+end
+
+-- Path of one part file.
+function part_path(index)
+    return ('%s%03d.bin'):format(arg_prefix, index)
+end
+
+
+-- Error handling.
+if arg_prefix == '' then exit('400 Bad Request', 'arg_prefix (arg[1]) empty.') end
+if not tonumber(arg_count) then exit('400 Bad Request', 'arg_count not a number.') end
+if tonumber(arg_count) < 1 then exit('400 Bad Request', 'arg_count under 1.') end
+if not tonumber(arg_size) then exit('400 Bad Request', 'arg_size not a number.') end
+if arg_destination == '' then exit('400 Bad Request', 'arg_destination (arg[4:]) empty.') end
+for i = 0, tonumber(arg_count) - 1 do
+    if lfs.attributes(part_path(i), 'mode') ~= 'file' then exit('400 Bad Request', ('part %d not found.'):format(i)) end
+end
+
+
+-- Remove the incomplete destination file and terminate.
+function abort(message)
+    output:close()
+    fa.remove(arg_destination)
+    exit('500 Internal Server Error', message)
+end
+
+
+-- Join.
+output = io.open(arg_destination, 'wb')
+if not output then exit('500 Internal Server Error', 'unable to open arg_destination.') end
+for i = 0, tonumber(arg_count) - 1 do
+    local handle = io.open(part_path(i), 'rb')
+    if not handle then abort(('unable to open part %d.'):format(i)) end
+    while true do
+        local block = handle:read(BLOCK_SIZE)
+        if not block then break end
+        if not output:write(block) then
+            handle:close()
+            abort('unable to write arg_destination.')
+        end
+    end
+    handle:close()
+end
+output:close()
+for i = 0, tonumber(arg_count) - 1 do fa.remove(part_path(i)) end
+
+
+-- Verify.
+size = lfs.attributes(arg_destination, 'size')
+if size ~= tonumber(arg_size) then
+    fa.remove(arg_destination)
+    exit('500 Internal Server Error', ('joined size %d does not match arg_size.'):format(size or -1))
+end
+
+
+-- Success.
+exit('200 OK')
@@ -4,12 +4,33 @@ Make sure /SD_WLAN/CONFIG exists on the card and is configured to connect to you
 """
 
 import logging
+import os
+import re
+import time
 import urllib.parse
 
 import requests
 
 from flash_air_music import exceptions
 from flash_air_music.configuration import GLOBAL_MUTABLE_CONFIG
+from flash_air_music.metrics import FLASHAIR_REQUEST_SECONDS, FLASHAIR_REQUESTS
+
+
+def endpoint_name(url):
+    """Name a FlashAir API endpoint for metrics. Lua scripts are named by file name, command.cgi by op number.
+
+    :param str url: URL to query.
+
+    :return: Endpoint name (e.g. command.cgi?op=100 or upload.cgi).
+    :rtype: str
+    """
+    split = urllib.parse.urlsplit(url)
+    name = os.path.basename(split.path)
+    if name == 'command.cgi':
+        op = urllib.parse.parse_qs(split.query).get('op')
+        if op:
+            name += '?op={}'.format(op[0])
+    return name
 
 
 def http_get_post(url, stream=None, file_name=None):
@@ -25,6 +46,8 @@ def http_get_post(url, stream=None, file_name=None):
     :rtype: tuple
     """
     log = logging.getLogger(__name__)
+    endpoint = endpoint_name(url)
+    start_time = time.monotonic()
 
     try:
         if stream is None:
@@ -34,13 +57,17 @@ def http_get_post(url, stream=None, file_name=None):
             log.debug('POSTing to %s with file name %s', url, file_name)
             response = requests.post(url, files={'file': (file_name, stream)}, timeout=5)
     except requests.Timeout:
+        FLASHAIR_REQUESTS.inc(endpoint=endpoint, status='timeout')
         if GLOBAL_MUTABLE_CONFIG['--verbose']:
             log.exception('Handled exception:')
         raise exceptions.FlashAirNetworkError('Timed out reaching {}'.format(urllib.parse.urlsplit(url).netloc))
     except requests.ConnectionError:
+        FLASHAIR_REQUESTS.inc(endpoint=endpoint, status='error')
         if GLOBAL_MUTABLE_CONFIG['--verbose']:
             log.exception('Handled exception:')
         raise exceptions.FlashAirNetworkError('Unable to connect to {}'.format(urllib.parse.urlsplit(url).netloc))
+    FLASHAIR_REQUEST_SECONDS.observe(time.monotonic() - start_time, endpoint=endpoint)
+    FLASHAIR_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
 
     log.debug('Response code: %d', response.status_code)
     log.debug('Response text: %s', response.text)
@@ -79,6 +106,32 @@ def command_get_file_list(ip_addr, directory):
     return text
 
 
+def command_get_free_space(ip_addr):
+    """command.cgi?op=140: get free space on the card.
+
+    :raise FlashAirBadResponse: When API returns unexpected/malformed data.
+    :raise FlashAirHTTPError: When API returns non-200 HTTP status code.
+    :raise FlashAirNetworkError: When there is trouble reaching the API.
+
+    :param str ip_addr: IP address of FlashAir to connect to.
+
+    :return: Free sectors, total sectors, and bytes per sector.
+    :rtype: tuple
+    """
+    url = 'http://{}/command.cgi?op=140'.format(ip_addr)
+
+    # Hit API.
+    status_code, text = http_get_post(url)
+    if status_code != 200:
+        raise exceptions.FlashAirHTTPError(status_code, status_code, text)
+
+    # Parse response.
+    match = re.match(r'^(\d+)/(\d+),(\d+)$', text.strip())
+    if not match:
+        raise exceptions.FlashAirBadResponse(text, status_code, text)
+    return tuple(int(i) for i in match.groups())
+
+
 def command_get_time_zone(ip_addr):
     """command.cgi?op=221: get card's time zone.
 
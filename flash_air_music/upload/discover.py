@@ -5,7 +5,7 @@ import os
 import unicodedata
 
 from flash_air_music.exceptions import FlashAirDirNotFoundError, FlashAirError, FlashAirNetworkError, FlashAirURLTooLong
-from flash_air_music.lib import BaseSong, SHUTDOWN
+from flash_air_music.lib import BaseSong, SHUTDOWN, walk_files
 from flash_air_music.upload.interface import DO_NOT_DELETE, epoch_to_ftime, get_files, REMOTE_ROOT_DIRECTORY
 
 MAX_LENGTH = 255
@@ -22,7 +22,9 @@ class Song(BaseSong):
     :ivar str target: Target file path (absolute remote path to mp3 file).
     """
 
-    def __init__(self, source, source_dir, target_dir, remote_metadata, tzinfo):
+    __slots__ = ('remote_metadata', 'tzinfo')
+
+    def __init__(self, source, source_dir, target_dir, remote_metadata, tzinfo, source_stat=None):
         """Constructor.
 
         :param str source: Absolute source file path.
@@ -30,10 +32,11 @@ class Song(BaseSong):
         :param str target_dir: Root absolute target directory path.
         :param dict remote_metadata: File paths and file metadata from the FlashAir API [from get_remote_songs()].
         :param datetime.timezone tzinfo: Timezone the card is set to.
+        :param os.stat_result source_stat: Stat of source file from walk_source() to avoid stat'ing it again.
         """
         self.remote_metadata = remote_metadata
         self.tzinfo = tzinfo
-        super().__init__(source, source_dir, target_dir)
+        super().__init__(source, source_dir, target_dir, source_stat)
 
     def _generate_target_path(self, source_dir, target_dir):
         """Determine target path and translate invalid characters to valid ones. All paths are absolute.
@@ -78,9 +81,12 @@ class Song(BaseSong):
         mtime = epoch_to_ftime(self.live_metadata['source_mtime'], self.tzinfo)
         return self.source, self.target, mtime, self.live_metadata['source_size']
 
-    def refresh_live_metadata(self):
-        """Need to make number even due to half a second precision loss with FILETIME conversion."""
-        super().refresh_live_metadata()
+    def refresh_live_metadata(self, source_stat=None):
+        """Need to make number even due to half a second precision loss with FILETIME conversion.
+
+        :param os.stat_result source_stat: Use this instead of calling os.stat() on the source file.
+        """
+        super().refresh_live_metadata(source_stat)
         self.live_metadata['source_mtime'] &= ~1  # http://stackoverflow.com/a/22154943/1198943
 
 
@@ -89,51 +95,65 @@ def walk_source(source_dir):
 
     :param str source_dir: Source directory.
 
-    :return: Yield file paths.
-    :rtype: str
+    :return: Yield file paths and their os.stat_result.
+    :rtype: tuple
     """
-    for path in (os.path.join(root, f) for root, _, files in os.walk(source_dir) for f in files):
-        if os.path.splitext(path)[1].lower() == '.mp3':
-            yield path
+    yield from walk_files(source_dir, ('.mp3',))
 
 
-def get_songs(source_dir, ip_addr, tzinfo):
-    """Walk local source and remote target directories looking for files to transfer.
+def get_remote_files(ip_addr, tzinfo):
+    """Walk the remote target directory on the FlashAir card.
 
     :raise FlashAirNetworkError: When there is trouble reaching the API.
 
-    :param str source_dir: Source directory.
     :param str ip_addr: IP address of FlashAir to connect to.
     :param datetime.timezone tzinfo: Timezone the card is set to.
 
-    :return: Song instances, valid remote target files, all remote target files, and empty remote directories.
+    :return: Files dict and list of empty dirs from get_files(), or None on unexpected errors.
     :rtype: tuple
     """
     log = logging.getLogger(__name__)
-    target_dir = REMOTE_ROOT_DIRECTORY
-    valid_targets = list()
-    songs = list()
-
-    # First get remote files.
     try:
-        files, empty_dirs = get_files(ip_addr, tzinfo, REMOTE_ROOT_DIRECTORY)
+        return get_files(ip_addr, tzinfo, REMOTE_ROOT_DIRECTORY)
     except FlashAirNetworkError:
         raise  # To be handled (retired) in caller.
     except FlashAirDirNotFoundError:
         log.debug('Directory %s does not exist on FlashAir card.', REMOTE_ROOT_DIRECTORY)
-        files, empty_dirs = dict(), list()
+        return dict(), list()
     except FlashAirURLTooLong:
         log.exception('Got FlashAirURLTooLong, is %s too long?', REMOTE_ROOT_DIRECTORY)
-        return songs, valid_targets, dict(), list()
     except FlashAirError:
         log.exception('Unexpected exception.')
+    return None
+
+
+def get_songs(source_dir, ip_addr, tzinfo, remote=None):
+    """Walk local source and remote target directories looking for files to transfer.
+
+    :raise FlashAirNetworkError: When there is trouble reaching the API.
+
+    :param str source_dir: Source directory.
+    :param str ip_addr: IP address of FlashAir to connect to.
+    :param datetime.timezone tzinfo: Timezone the card is set to.
+    :param tuple remote: Files dict and empty dirs from a previous get_remote_files() instead of walking the card.
+
+    :return: Song instances, valid remote target files, all remote target files, and empty remote directories.
+    :rtype: tuple
+    """
+    target_dir = REMOTE_ROOT_DIRECTORY
+    valid_targets = list()
+    songs = list()
+
+    # First get remote files.
+    if remote is None:
+        remote = get_remote_files(ip_addr, tzinfo)
+    if remote is None or SHUTDOWN.done():
         return songs, valid_targets, dict(), list()
-    if SHUTDOWN.done():
-        return songs, valid_targets, dict(), list()
+    files, empty_dirs = remote
 
     # Get local files.
-    for path in walk_source(source_dir):
-        song = Song(path, source_dir, target_dir, files, tzinfo)
+    for path, source_stat in walk_source(source_dir):
+        song = Song(path, source_dir, target_dir, files, tzinfo, source_stat)
         valid_targets.append(song.target)
         if song.needs_action:
             songs.append(song)
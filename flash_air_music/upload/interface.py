@@ -1,18 +1,30 @@
 """Interface with the FlashAir card over WiFi. Parse API responses."""
 
 import datetime
+import io
+import json
 import logging
 import os
 import re
 import time
+import zlib
 
 from flash_air_music import exceptions
 from flash_air_music.lib import SHUTDOWN
+from flash_air_music.metrics import UPLOAD_BYTES, UPLOAD_BYTES_PER_SECOND
+from flash_air_music.pipeline import PIPELINE
 from flash_air_music.upload import api
+from flash_air_music.upload.remote import REMOTE_TREE
+from flash_air_music.upload.telemetry import CountingReader, THROUGHPUT
 
+# op=140 only reports sectors. Cards formatted to SD Association defaults have clusters of at most these sizes.
+CLUSTER_SIZES = ((32 * 1024 ** 3, 32 * 1024), (2 * 1024 ** 4, 128 * 1024))  # (Up to this card size, bytes per cluster).
 LUA_HELPER_SCRIPT = os.path.join(os.path.dirname(__file__), '_fam_move_touch.lua')
+LUA_JOIN_SCRIPT = os.path.join(os.path.dirname(__file__), '_fam_join.lua')
 REMOTE_ROOT_DIRECTORY = '/MUSIC'  # Must not be more than 1 level and have no spaces.
 DO_NOT_DELETE = (REMOTE_ROOT_DIRECTORY, '')
+UPLOAD_PART_SIZE = 1024 * 1024  # Larger files are uploaded in parts. A dropped connection only loses one part.
+UPLOAD_PART_PREFIX = '_fam_part_'
 UPLOAD_STAGE_NAME = '_fam_staged.bin'
 
 
@@ -74,6 +86,24 @@ def get_card_time_zone(ip_addr):
     return datetime.timezone(datetime.timedelta(hours=fifteen_min_offset / 4.0))
 
 
+def get_card_free_space(ip_addr):
+    """Get free space on the card.
+
+    :raise FlashAirBadResponse: When API returns unexpected/malformed data.
+    :raise FlashAirHTTPError: When API returns non-200 HTTP status code.
+    :raise FlashAirNetworkError: When there is trouble reaching the API.
+
+    :param str ip_addr: IP address of FlashAir to connect to.
+
+    :return: Free bytes and estimated bytes per allocation unit (cluster).
+    :rtype: tuple
+    """
+    free, total, sector_size = api.command_get_free_space(ip_addr)
+    total_bytes = total * sector_size
+    cluster_size = next((c for limit, c in CLUSTER_SIZES if total_bytes <= limit), CLUSTER_SIZES[-1][1])
+    return free * sector_size, max(cluster_size, sector_size)
+
+
 def get_files(ip_addr, tzinfo, directory):
     """Recursively get a list of MP3s currently on the SD card in a directory.
 
@@ -131,7 +161,7 @@ def get_files(ip_addr, tzinfo, directory):
 
 
 def delete_files_dirs(ip_addr, paths):
-    """Delete files and directories on the FlashAir card.
+    """Delete files and directories on the FlashAir card. Each deletion is recorded in REMOTE_TREE.
 
     :raise FlashAirHTTPError: When API returns non-200 HTTP status code.
     :raise FlashAirNetworkError: When there is trouble reaching the API.
@@ -147,6 +177,7 @@ def delete_files_dirs(ip_addr, paths):
             break
         log.info('Deleting: %s', path)
         api.upload_delete(ip_addr, path)
+        REMOTE_TREE.deleted(path)
 
 
 def initialize_upload(ip_addr, tzinfo):
@@ -154,7 +185,7 @@ def initialize_upload(ip_addr, tzinfo):
 
     Set the system clock on the card, set the upload directory, and enable write project on the host it's attached to.
 
-    Also upload the helper Lua script to the REMOTE_ROOT_DIRECTORY.
+    Also upload the helper Lua scripts to the REMOTE_ROOT_DIRECTORY.
 
     :raise FlashAirBadResponse: When API returns unexpected/malformed data.
     :raise FlashAirHTTPError: When API returns non-200 HTTP status code.
@@ -169,32 +200,150 @@ def initialize_upload(ip_addr, tzinfo):
     # Prepare card via upload.cgi.
     api.upload_ftime_updir_writeprotect(ip_addr, REMOTE_ROOT_DIRECTORY, epoch_to_ftime(0, tzinfo))
 
-    # Upload helper script if not there.
+    # Upload helper scripts if not there.
     try:
         text = api.command_get_file_list(ip_addr, REMOTE_ROOT_DIRECTORY)
     except exceptions.FlashAirDirNotFoundError:
-        pass
-    else:
-        if os.path.basename(LUA_HELPER_SCRIPT) in text:
-            return  # Script already there.
-    with open(LUA_HELPER_SCRIPT, mode='rb') as handle:
-        api.upload_upload_file(ip_addr, os.path.basename(handle.name), handle)
-
-    # Verify script uploaded successfully.
+        text = ''
+    missing = [p for p in (LUA_HELPER_SCRIPT, LUA_JOIN_SCRIPT) if os.path.basename(p) not in text]
+    if not missing:
+        return  # Scripts already there.
+    for path in missing:
+        with open(path, mode='rb') as handle:
+            api.upload_upload_file(ip_addr, os.path.basename(handle.name), handle)
+
+    # Verify scripts uploaded successfully.
+    text = api.command_get_file_list(ip_addr, REMOTE_ROOT_DIRECTORY)
+    for path in missing:
+        if '{},{}'.format(os.path.basename(path), os.stat(path).st_size) not in text:
+            log.error('Lua script upload failed!')
+            raise exceptions.FlashAirBadResponse(text, None)
+
+
+def get_staged_parts(ip_addr):
+    """Get part files left in REMOTE_ROOT_DIRECTORY by upload_chunked().
+
+    :raise FlashAirBadResponse: When API returns unexpected/malformed data.
+    :raise FlashAirHTTPError: When API returns non-200 HTTP status code.
+    :raise FlashAirNetworkError: When there is trouble reaching the API.
+
+    :param str ip_addr: IP address of FlashAir to connect to.
+
+    :return: File names and their sizes.
+    :rtype: dict
+    """
     text = api.command_get_file_list(ip_addr, REMOTE_ROOT_DIRECTORY)
-    if '{},{}'.format(os.path.basename(LUA_HELPER_SCRIPT), os.stat(LUA_HELPER_SCRIPT).st_size) not in text:
-        log.error('Lua script upload failed!')
-        raise exceptions.FlashAirBadResponse(text, None)
+    regex = re.compile(r'^.{%d},(%s.+?),(\d+),' % (len(REMOTE_ROOT_DIRECTORY), UPLOAD_PART_PREFIX), re.MULTILINE)
+    return {name: int(size) for name, size in (i.groups() for i in regex.finditer(text.replace('\r', '')))}
+
+
+def stop_reason():
+    """Check if uploading should stop before the next file or part.
+
+    :return: Why uploading should stop, or None to keep going.
+    :rtype: str
+    """
+    if SHUTDOWN.done():
+        return 'Service shutdown initiated'
+    if PIPELINE.is_paused('upload'):
+        return 'Uploads paused'
+    return None
+
+
+def upload_measured(ip_addr, file_name, handle):
+    """Upload one file to UPDIR and record how fast it went in THROUGHPUT.
+
+    :raise FlashAirHTTPError: When API returns non-200 HTTP status code.
+    :raise FlashAirNetworkError: When there is trouble reaching the API.
+
+    :param str ip_addr: IP address of FlashAir to connect to.
+    :param file_name: File name to write to on the card in UPDIR.
+    :param handle: Opened file handle (binary mode) to stream from.
+    """
+    reader = CountingReader(handle)
+    start_time = time.monotonic()
+    PIPELINE.upload_sending(reader)
+    api.upload_upload_file(ip_addr, file_name, reader)
+    PIPELINE.upload_sent(reader.count)
+    THROUGHPUT.record(reader.count, time.monotonic() - start_time)
+    UPLOAD_BYTES.inc(reader.count)
+    UPLOAD_BYTES_PER_SECOND.set(THROUGHPUT.bytes_per_second or 0)
+
+
+def upload_chunked(ip_addr, handle, destination, mtime, staged):
+    """Upload one file in UPLOAD_PART_SIZE parts and join them into UPLOAD_STAGE_NAME on the card.
+
+    Parts are named after the destination, size, and mtime of the file. Complete parts left on the card by an earlier
+    interrupted attempt are not sent again. Parts of any other file are deleted. `staged` is updated as parts are
+    deleted and joined so it can be reused for the next file.
+
+    :raise FlashAirBadResponse: When API returns unexpected/malformed data (including a join error).
+    :raise FlashAirHTTPError: When API returns non-200 HTTP status code (including a failed join).
+    :raise FlashAirNetworkError: When there is trouble reaching the API.
+
+    :param str ip_addr: IP address of FlashAir to connect to.
+    :param handle: Opened file handle (binary mode) to read from.
+    :param str destination: Absolute destination file path on the FlashAir card.
+    :param mtime: mtime of the file from `files_attrs` in upload_files().
+    :param dict staged: get_staged_parts() return value.
+
+    :return: False if service shutdown or pausing uploads interrupted the upload, True if joined.
+    :rtype: bool
+    """
+    log = logging.getLogger(__name__)
+    size = os.fstat(handle.fileno()).st_size
+    checksum = zlib.crc32('{} {} {}'.format(destination, size, mtime).encode('utf-8'))
+    prefix = '{}{:08x}_'.format(UPLOAD_PART_PREFIX, checksum)
+    parts = ['{}{:03d}.bin'.format(prefix, i) for i in range(-(-size // UPLOAD_PART_SIZE))]
+
+    # Remove parts of other files.
+    for name in sorted(n for n in staged if n not in parts):
+        log.debug('Deleting stale part %s', name)
+        api.upload_delete(ip_addr, '{}/{}'.format(REMOTE_ROOT_DIRECTORY, name))
+        staged.pop(name)
+
+    # Upload missing parts.
+    for index, name in enumerate(parts):
+        if stop_reason():
+            return False
+        handle.seek(index * UPLOAD_PART_SIZE)
+        chunk = handle.read(UPLOAD_PART_SIZE)
+        if staged.get(name) == len(chunk):
+            log.debug('Part %s already uploaded.', name)
+            PIPELINE.upload_sent(len(chunk))
+            continue
+        log.debug('Uploading part %d/%d to %s', index + 1, len(parts), name)
+        upload_measured(ip_addr, name, io.BytesIO(chunk))
+
+    # Join parts on the card.
+    script_path = '{}/{}'.format(REMOTE_ROOT_DIRECTORY, os.path.basename(LUA_JOIN_SCRIPT))
+    stage_path = '{}/{}'.format(REMOTE_ROOT_DIRECTORY, UPLOAD_STAGE_NAME)
+    log.debug('Joining %d parts into %s', len(parts), stage_path)
+    script_argv = '{}/{} {} {} {}'.format(REMOTE_ROOT_DIRECTORY, prefix, len(parts), size, stage_path)
+    text = api.lua_script_execute(ip_addr, script_path, script_argv)
+    for name in parts:
+        staged.pop(name, None)  # Removed by the script even if joining failed.
+    try:
+        error = json.loads(text)['error']
+    except (KeyError, TypeError, ValueError):
+        raise exceptions.FlashAirBadResponse(text, 200, text)
+    if error:
+        raise exceptions.FlashAirBadResponse('Joining parts failed: {}'.format(error), 200, text)
+    return True
 
 
 def upload_files(ip_addr, files_attrs):
-    """Upload files to the card one at a time.
+    """Upload files to the card one at a time. Each finished upload is recorded in REMOTE_TREE.
+
+    Files larger than UPLOAD_PART_SIZE are sent in parts by upload_chunked() so retries skip parts already sent. Parts
+    left on the card are listed once, before the first such file.
 
     Each item in the `files_attrs` list is a tuple of:
         1. Absolute source file path on this machine.
         2. Absolute destination file path on the FlashAir card.
         3. mtime of the file in seconds since epoch.
 
+    :raise FlashAirBadResponse: When API returns unexpected/malformed data.
     :raise FlashAirHTTPError: When API returns non-200 HTTP status code.
     :raise FlashAirNetworkError: When there is trouble reaching the API.
 
@@ -204,15 +353,44 @@ def upload_files(ip_addr, files_attrs):
     log = logging.getLogger(__name__)
     script_path = '{}/{}'.format(REMOTE_ROOT_DIRECTORY, os.path.basename(LUA_HELPER_SCRIPT))
     stage_path = '{}/{}'.format(REMOTE_ROOT_DIRECTORY, UPLOAD_STAGE_NAME)
-
-    for source, destination, mtime in files_attrs:
-        if SHUTDOWN.done():
-            logging.getLogger(__name__).info('Service shutdown initiated, stop uploading songs.')
+    files_attrs = list(files_attrs)
+    remaining_bytes = sum(os.stat(s).st_size for s, _, _ in files_attrs if os.path.isfile(s))
+    staged = None
+    THROUGHPUT.start_session()
+
+    for count, (source, destination, mtime) in enumerate(files_attrs, 1):
+        reason = stop_reason()
+        if reason:
+            log.info('%s, stop uploading songs.', reason)
             break
         log.info('Uploading file: %s', source)
-        log.debug('Uploading to %s', stage_path)
-        with open(source, mode='rb') as handle:
-            api.upload_upload_file(ip_addr, UPLOAD_STAGE_NAME, handle)
-        log.debug('Moving to %s and setting mtime %s', destination, mtime)
-        script_argv = '{} {} {}'.format(stage_path, mtime, destination)
-        api.lua_script_execute(ip_addr, script_path, script_argv)
+        try:
+            with open(source, mode='rb') as handle:
+                source_stat = os.fstat(handle.fileno())
+                PIPELINE.upload_started(source, source_stat.st_size)
+                if source_stat.st_size <= UPLOAD_PART_SIZE:
+                    log.debug('Uploading to %s', stage_path)
+                    upload_measured(ip_addr, UPLOAD_STAGE_NAME, handle)
+                else:
+                    if staged is None:
+                        staged = get_staged_parts(ip_addr)
+                    if not upload_chunked(ip_addr, handle, destination, mtime, staged):
+                        log.info('%s, stop uploading songs.', stop_reason())
+                        break
+            log.debug('Moving to %s and setting mtime %s', destination, mtime)
+            script_argv = '{} {} {}'.format(stage_path, mtime, destination)
+            api.lua_script_execute(ip_addr, script_path, script_argv)
+        finally:
+            PIPELINE.upload_finished()
+        REMOTE_TREE.uploaded(destination, source_stat.st_size, int(source_stat.st_mtime))
+
+        # Telemetry.
+        remaining_bytes = max(remaining_bytes - source_stat.st_size, 0)
+        eta = THROUGHPUT.eta(remaining_bytes)
+        if eta is not None:
+            log.debug('Upload speed %.1f KiB/s, %d song(s) left, ETA %d second(s).',
+                      THROUGHPUT.bytes_per_second / 1024, len(files_attrs) - count, eta)
+
+    if THROUGHPUT.session_bytes_per_second is not None:
+        log.info('Uploaded %d byte(s) in %.1f second(s) (%.1f KiB/s).', THROUGHPUT.session_bytes,
+                 THROUGHPUT.session_seconds, THROUGHPUT.session_bytes_per_second / 1024)
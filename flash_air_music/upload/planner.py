@@ -0,0 +1,142 @@
+"""Decide in which order songs are uploaded to the FlashAir card and which of them fit on it.
+
+With a slow link and syncs that get cut off, the order decides what is on the card when it leaves WiFi range. The order
+is a comma separated list of policies applied in the order given:
+    pinned: Songs in --pinned-dirs first.
+    newest: Most recently modified songs first.
+    size: Smallest songs first.
+    album: Keep songs in the same directory together. Albums are ranked by their best song according to the other
+        policies, so one album is finished before the next one is started. Position in the list does not matter.
+
+Examples: size, newest,size, pinned,album,newest,size
+"""
+
+import os
+
+DEFAULT_ORDER = 'size'
+FREE_SPACE_RESERVE = 4 * 1024 * 1024  # Left free for new directories and clusters larger than estimated.
+POLICIES = ('album', 'newest', 'pinned', 'size')
+
+
+def on_card(size, block_size):
+    """Space a file takes up on the card.
+
+    :param int size: File size in bytes.
+    :param int block_size: Files take up a multiple of this many bytes on the card.
+
+    :return: Size rounded up to a multiple of `block_size`.
+    :rtype: int
+    """
+    return -(-size // block_size) * block_size
+
+
+def parse_order(value):
+    """Parse an upload order string into policy names.
+
+    :raise ValueError: On invalid or repeated policy names.
+
+    :param str value: Upload order (e.g. pinned,album,size).
+
+    :return: Policy names.
+    :rtype: list
+    """
+    names = value.split(',')
+    if any(n not in POLICIES for n in names) or len(set(names)) != len(names):
+        raise ValueError('Invalid upload order: {}'.format(value))
+    return names
+
+
+def parse_pinned_dirs(value, source_dir, music_source):
+    """Parse colon separated pinned directories.
+
+    Songs are uploaded from the converted copy of the music source, so absolute directories in the music source are
+    moved to the same place under `source_dir`.
+
+    :raise ValueError: On absolute directories outside of `music_source`.
+
+    :param str value: Directories relative to `music_source` (or absolute in it), or None.
+    :param str source_dir: Local source directory of songs being uploaded.
+    :param str music_source: Music source directory `source_dir` mirrors.
+
+    :return: Absolute directory paths.
+    :rtype: tuple
+    """
+    if not value:
+        return tuple()
+    music_source = music_source.rstrip(os.sep) + os.sep
+    paths = list()
+    for path in (p for p in value.split(':') if p):
+        if os.path.isabs(path):
+            if not (path.rstrip(os.sep) + os.sep).startswith(music_source):
+                raise ValueError('Pinned directory not in music source: {}'.format(path))
+            path = os.path.relpath(path, music_source)
+        paths.append(os.path.normpath(os.path.join(source_dir, path)).rstrip(os.sep) + os.sep)
+    return tuple(paths)
+
+
+def plan(songs, policies, pinned_dirs=()):
+    """Sort songs in the order they should be uploaded.
+
+    :param iter songs: Song instances from get_songs().
+    :param iter policies: Policy names from parse_order().
+    :param iter pinned_dirs: Directories from parse_pinned_dirs().
+
+    :return: Sorted Song instances.
+    :rtype: list
+    """
+    def song_key(song):
+        """Sort key of one song from every policy except album.
+
+        :param flash_air_music.upload.discover.Song song: Song instance.
+
+        :return: Sort key.
+        :rtype: tuple
+        """
+        key = list()
+        for name in policies:
+            if name == 'pinned':
+                key.append(0 if song.source.startswith(tuple(pinned_dirs)) else 1)
+            elif name == 'newest':
+                key.append(-song.live_metadata['source_mtime'])
+            elif name == 'size':
+                key.append(song.live_metadata['source_size'])
+        return tuple(key)
+
+    keyed = [(song_key(s), s) for s in songs]
+    if 'album' not in policies:
+        return [s for _, s in sorted(keyed, key=lambda i: i[0])]
+
+    # Rank albums by their best song.
+    best = dict()
+    for key, song in keyed:
+        album = os.path.dirname(song.source)
+        best[album] = min(best.get(album, key), key)
+    ranked = sorted(keyed, key=lambda i: (best[os.path.dirname(i[1].source)], os.path.dirname(i[1].source), i[0]))
+    return [s for _, s in ranked]
+
+
+def fit_capacity(songs, free_bytes, block_size, chunk_size):
+    """Split songs (in upload order) into those that fit in the free space on the card and those that don't.
+
+    A song needs room for its staged copy while the old version (if any) is still on the card, twice that if it is
+    larger than `chunk_size` since its parts exist until they are joined. The old version is freed after the move.
+
+    :param iter songs: Song instances from plan().
+    :param int free_bytes: Free space on the card.
+    :param int block_size: Files take up a multiple of this many bytes on the card.
+    :param int chunk_size: Files larger than this are uploaded in parts.
+
+    :return: Songs that fit and songs left out, both in upload order.
+    :rtype: tuple
+    """
+    fits, left_out = list(), list()
+    for song in songs:
+        size = song.live_metadata['source_size']
+        peak = on_card(size, block_size) * (2 if size > chunk_size else 1)
+        if peak > free_bytes:
+            left_out.append(song)
+            continue
+        fits.append(song)
+        old_size = song.remote_metadata[song.target][0] if song.target in song.remote_metadata else 0
+        free_bytes -= on_card(size, block_size) - on_card(old_size, block_size)
+    return fits, left_out
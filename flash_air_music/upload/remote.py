@@ -0,0 +1,91 @@
+"""In-memory model of the music files on the FlashAir card.
+
+Listing every directory on the card is slow (one API call per directory). The listing from the last walk is kept here
+and updated as files are uploaded and deleted, so retries after a network error and syncs within the configured TTL
+don't have to walk the card again.
+"""
+
+import time
+
+
+class RemoteTree(object):
+    """Remote files and empty directories from the last get_files() walk, updated by our own writes.
+
+    :ivar int block_size: Bytes per allocation unit on the card, files take up a multiple of this.
+    :ivar list empty_dirs: Empty remote directories.
+    :ivar dict files: Remote MP3 file paths and their (size, mtime) like get_files() returns.
+    :ivar int free_bytes: Free space on the card from the last scan. None if unknown.
+    :ivar str ip_addr: IP address of the FlashAir card walked. None if there is no usable listing.
+    :ivar float timestamp: time.monotonic() of the walk.
+    :ivar datetime.timezone tzinfo: Timezone the card is set to.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.block_size = 1
+        self.empty_dirs = list()
+        self.files = dict()
+        self.free_bytes = None
+        self.ip_addr = None
+        self.timestamp = 0.0
+        self.tzinfo = None
+
+    @property
+    def age(self):
+        """Seconds since the card was walked."""
+        return time.monotonic() - self.timestamp
+
+    def deleted(self, path):
+        """Forget a deleted remote file or directory (and everything in it).
+
+        :param str path: Remote path.
+        """
+        path = path.rstrip('/')
+        prefix = path + '/'
+        for file_path in [p for p in self.files if p == path or p.startswith(prefix)]:
+            self.files.pop(file_path)
+        self.empty_dirs = [p for p in self.empty_dirs if p != path and not p.startswith(prefix)]
+
+    def invalidate(self):
+        """Drop the listing. The next scan walks the card again."""
+        self.__init__()
+
+    def is_fresh(self, ip_addr, ttl):
+        """Check if the listing can be used instead of walking the card.
+
+        :param str ip_addr: IP address of FlashAir to connect to.
+        :param int ttl: Maximum age in seconds. None for any age.
+
+        :return: If the listing is usable.
+        :rtype: bool
+        """
+        if self.ip_addr is None or self.ip_addr != ip_addr:
+            return False
+        return ttl is None or self.age < ttl
+
+    def store(self, ip_addr, tzinfo, files, empty_dirs):
+        """Replace the listing with the results of a new walk.
+
+        :param str ip_addr: IP address of FlashAir walked.
+        :param datetime.timezone tzinfo: Timezone the card is set to.
+        :param dict files: Files dict from get_files().
+        :param iter empty_dirs: Empty dirs from get_files().
+        """
+        self.empty_dirs = list(empty_dirs)
+        self.files = files
+        self.ip_addr = ip_addr
+        self.timestamp = time.monotonic()
+        self.tzinfo = tzinfo
+
+    def uploaded(self, path, size, mtime):
+        """Record a file moved into place on the card. Its parent directories are no longer empty.
+
+        :param str path: Remote file path.
+        :param int size: File size in bytes.
+        :param int mtime: Source file mtime in seconds since epoch.
+        """
+        self.files[path] = (size, mtime)
+        self.empty_dirs = [p for p in self.empty_dirs if not path.startswith(p.rstrip('/') + '/')]
+
+
+REMOTE_TREE = RemoteTree()
@@ -1,4 +1,8 @@
-"""Main functions/coroutines that fire directory walking, song uploads, file/dir deletion, and retry logic."""
+"""Main functions/coroutines that fire directory walking, song uploads, file/dir deletion, and retry logic.
+
+scan() and upload_cleanup() block on HTTP requests for as long as the sync takes. They run in the event loop's default
+executor so conversions, the control socket, and signal handlers keep running meanwhile.
+"""
 
 import asyncio
 import logging
@@ -7,18 +11,30 @@ import time
 from flash_air_music.configuration import GLOBAL_MUTABLE_CONFIG
 from flash_air_music.exceptions import FlashAirError, FlashAirNetworkError, FlashAirURLTooLong
 from flash_air_music.lib import SEMAPHORE, SHUTDOWN
-from flash_air_music.upload.discover import files_dirs_to_delete, get_songs
-from flash_air_music.upload.interface import delete_files_dirs, get_card_time_zone, initialize_upload, upload_files
+from flash_air_music.metrics import UPLOAD_RETRIES
+from flash_air_music.pipeline import PIPELINE
+from flash_air_music.schedule import seconds_left
+from flash_air_music.upload.discover import files_dirs_to_delete, get_remote_files, get_songs
+from flash_air_music.upload.interface import delete_files_dirs, get_card_free_space, get_card_time_zone
+from flash_air_music.upload.interface import initialize_upload, upload_files, UPLOAD_PART_SIZE
+from flash_air_music.upload.planner import fit_capacity, FREE_SPACE_RESERVE, on_card, parse_order, parse_pinned_dirs
+from flash_air_music.upload.planner import plan
+from flash_air_music.upload.remote import REMOTE_TREE
+from flash_air_music.upload.telemetry import THROUGHPUT
 
 GIVE_UP_AFTER = 300  # Retry for 5 minutes when network errors occur (packet loss, etc).
 
 
-def scan(ip_addr):
+def scan(ip_addr, retry=False):
     """Walk source and remote directories for new songs and files/dirs to delete. Get card timezone too.
 
+    The remote listing is reused instead of walking the card again when retrying after a network error or when it is
+    younger than --remote-cache-ttl.
+
     :raise FlashAirNetworkError: When there is trouble reaching the API.
 
     :param str ip_addr: IP address of FlashAir to connect to.
+    :param bool retry: Previous attempt in this run failed, reuse the remote listing regardless of its age.
 
     :return: 3 item tuple: Song instances (list), files/dirs to delete (set), timezone info.
     :rtype: tuple
@@ -27,24 +43,53 @@ def scan(ip_addr):
     source_dir = GLOBAL_MUTABLE_CONFIG['--working-dir']
     log.debug('Scanning for local and remote songs in %s', source_dir)
 
-    # First get timezone.
+    # Reuse remote listing.
+    if REMOTE_TREE.is_fresh(ip_addr, None if retry else int(GLOBAL_MUTABLE_CONFIG['--remote-cache-ttl'])):
+        log.debug('Reusing FlashAir card file listing from %d second(s) ago.', REMOTE_TREE.age)
+        tzinfo = REMOTE_TREE.tzinfo
+        remote = REMOTE_TREE.files, REMOTE_TREE.empty_dirs
+    else:
+        # First get timezone.
+        REMOTE_TREE.invalidate()
+        try:
+            tzinfo = get_card_time_zone(ip_addr)
+        except FlashAirNetworkError:
+            raise  # To be handled in caller.
+        except FlashAirError:
+            log.exception('Unexpected exception.')
+            return list(), set(), None
+
+        # Walk card.
+        start_time = time.monotonic()
+        remote = get_remote_files(ip_addr, tzinfo)
+        PIPELINE.scanned('upload_remote', time.monotonic() - start_time)
+        if remote is None:
+            return list(), set(), None
+        REMOTE_TREE.store(ip_addr, tzinfo, *remote)
+
+    # Get free space.
     try:
-        tzinfo = get_card_time_zone(ip_addr)
+        REMOTE_TREE.free_bytes, REMOTE_TREE.block_size = get_card_free_space(ip_addr)
     except FlashAirNetworkError:
         raise  # To be handled in caller.
     except FlashAirError:
-        log.exception('Unexpected exception.')
-        return list(), set(), None
+        log.warning('Unable to get free space on FlashAir card, not checking if songs fit.')
+        REMOTE_TREE.free_bytes, REMOTE_TREE.block_size = None, 1
 
     # Get songs to upload and items to delete.
-    songs, valid_targets, files, empty_dirs = get_songs(source_dir, ip_addr, tzinfo)
+    start_time = time.monotonic()
+    songs, valid_targets, files, empty_dirs = get_songs(source_dir, ip_addr, tzinfo, remote)
     delete_paths = files_dirs_to_delete(valid_targets, files, empty_dirs)
+    PIPELINE.scanned('upload_local', time.monotonic() - start_time)
 
     return songs, delete_paths, tzinfo
 
 
 def upload_cleanup(ip_addr, songs, delete_paths, tzinfo):
-    """Remove remote files/directories and upload new/changed songs. Upload smallest files first.
+    """Remove remote files/directories and upload new/changed songs in the order chosen by --upload-order.
+
+    Songs that don't fit in the free space on the card (minus FREE_SPACE_RESERVE) are left out. When --sync-hours is set
+    only the songs estimated (from the measured upload speed) to finish in time are uploaded, but always at least one.
 
     :raise FlashAirNetworkError: When there is trouble reaching the API.
 
@@ -54,7 +99,33 @@ def upload_cleanup(ip_addr, songs, delete_paths, tzinfo):
     :param datetime.timezone tzinfo: Timezone the card is set to.
     """
     log = logging.getLogger(__name__)
-    files_attrs = [j[:3] for j in sorted((s.attrs for s in songs), key=lambda i: i[-1])]
+    pinned_dirs = parse_pinned_dirs(GLOBAL_MUTABLE_CONFIG['--pinned-dirs'], GLOBAL_MUTABLE_CONFIG['--working-dir'],
+                                    GLOBAL_MUTABLE_CONFIG['--music-source'])
+    policies = parse_order(GLOBAL_MUTABLE_CONFIG['--upload-order'])
+    songs = plan(songs, policies, pinned_dirs)
+
+    # Only upload what fits on the card after deleting.
+    if REMOTE_TREE.free_bytes is not None:
+        block_size = REMOTE_TREE.block_size
+        freed = sum(on_card(REMOTE_TREE.files[p][0], block_size) for p in delete_paths if p in REMOTE_TREE.files)
+        free_bytes = REMOTE_TREE.free_bytes + freed - FREE_SPACE_RESERVE
+        songs, left_out = fit_capacity(songs, free_bytes, block_size, UPLOAD_PART_SIZE)
+        if left_out:
+            log.warning('Not enough free space on the FlashAir card for %d song(s) (%d bytes), skipping them.',
+                        len(left_out), sum(s.live_metadata['source_size'] for s in left_out))
+            for song in left_out:
+                log.debug('Skipping %s', song.source)
+    attrs = [s.attrs for s in songs]
+
+    # Only upload what is estimated to finish before sync hours end.
+    fits = THROUGHPUT.fit((a[-1] for a in attrs), seconds_left(GLOBAL_MUTABLE_CONFIG['--sync-hours']))
+    if fits < len(attrs):
+        log.info('Only %d of %d song(s) estimated to fit in the remaining sync hours.', fits, len(attrs))
+        attrs = attrs[:fits]
+    eta = THROUGHPUT.eta(sum(a[-1] for a in attrs))
+    if attrs and eta is not None:
+        log.info('Estimated upload time %d second(s) at %.1f KiB/s.', eta, THROUGHPUT.bytes_per_second / 1024)
+    files_attrs = [a[:3] for a in attrs]
 
     # Lock card to prevent host from making changes and copy helper Lua script.
     try:
@@ -63,15 +134,17 @@ def upload_cleanup(ip_addr, songs, delete_paths, tzinfo):
         if delete_paths:
             log.info('Deleting %d file(s)/dir(s) on the FlashAir card.', len(delete_paths))
             delete_files_dirs(ip_addr, delete_paths)
-        if songs:
-            log.info('Uploading %d song(s).', len(songs))
+        if files_attrs:
+            log.info('Uploading %d song(s).', len(files_attrs))
             upload_files(ip_addr, files_attrs)
     except FlashAirURLTooLong:
         log.exception('Lua script path is too long for some reason???')
+        REMOTE_TREE.invalidate()
     except FlashAirNetworkError:
         raise  # To be handled in caller.
     except FlashAirError:
         log.exception('Unexpected exception.')
+        REMOTE_TREE.invalidate()
 
 
 @asyncio.coroutine
@@ -85,9 +158,11 @@ def run(ip_addr):
     """
     log = logging.getLogger(__name__)
     log.debug('Waiting for semaphore...')
+    loop = asyncio.get_event_loop()
     sleep_for = 2
     success = False
     changed = False
+    retry = False
     with (yield from SEMAPHORE):
         log.debug('Got semaphore lock.')
         start_time = time.time()
@@ -95,15 +170,20 @@ def run(ip_addr):
             if SHUTDOWN.done():
                 log.info('Service shutdown initiated, stop trying to update FlashAir card.')
                 break
+            if PIPELINE.is_paused('upload'):
+                log.info('Uploads paused, stop trying to update FlashAir card.')
+                break
             try:
-                songs, delete_paths, tzinfo = scan(ip_addr)
+                songs, delete_paths, tzinfo = yield from loop.run_in_executor(None, scan, ip_addr, retry)
                 if songs or delete_paths:
-                    upload_cleanup(ip_addr, songs, delete_paths, tzinfo)
+                    yield from loop.run_in_executor(None, upload_cleanup, ip_addr, songs, delete_paths, tzinfo)
                     changed = True
             except FlashAirNetworkError:
                 log.warning('Lost connection to FlashAir card. Retrying in %s seconds...', sleep_for)
+                UPLOAD_RETRIES.inc()
                 yield from asyncio.sleep(sleep_for)
                 sleep_for += 1
+                retry = True
             else:
                 success = True
                 break
@@ -0,0 +1,128 @@
+"""Measure how fast files are uploaded to the FlashAir card and estimate how long the remaining uploads will take.
+
+Each upload.cgi POST is one sample. The estimate is the total bytes over the total seconds of the last few samples so
+it follows changes in WiFi signal without jumping around on one slow request. Samples are kept between syncs so the
+next sync can be planned before anything is uploaded.
+"""
+
+import collections
+
+SAMPLE_WINDOW = 20
+
+
+class CountingReader(object):
+    """Wrap a binary file handle and count bytes read from it.
+
+    :ivar int count: Bytes read so far.
+    :ivar handle: Wrapped file handle.
+    """
+
+    def __init__(self, handle):
+        """Constructor.
+
+        :param handle: Opened file handle (binary mode).
+        """
+        self.count = 0
+        self.handle = handle
+
+    def __getattr__(self, name):
+        """Pass everything else (name, seek, etc.) through to the wrapped handle.
+
+        :param str name: Attribute name.
+        """
+        return getattr(self.handle, name)
+
+    def read(self, size=-1):
+        """Read from the wrapped handle.
+
+        :param int size: Maximum bytes to read, all if negative.
+
+        :return: Data read.
+        :rtype: bytes
+        """
+        data = self.handle.read(size)
+        self.count += len(data)
+        return data
+
+
+class Throughput(object):
+    """Rolling upload bandwidth estimate plus totals for the current sync session.
+
+    :ivar collections.deque samples: Bytes and seconds of the last SAMPLE_WINDOW uploads.
+    :ivar int session_bytes: Bytes uploaded since start_session().
+    :ivar float session_seconds: Seconds spent uploading since start_session().
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.samples = collections.deque(maxlen=SAMPLE_WINDOW)
+        self.session_bytes = 0
+        self.session_seconds = 0.0
+
+    @property
+    def bytes_per_second(self):
+        """Rolling bandwidth estimate. None until something has been uploaded."""
+        num_bytes, seconds = sum(b for b, _ in self.samples), sum(s for _, s in self.samples)
+        if not num_bytes or not seconds:
+            return None
+        return num_bytes / seconds
+
+    @property
+    def session_bytes_per_second(self):
+        """Average bandwidth of the current session. None until something has been uploaded."""
+        if not self.session_bytes or not self.session_seconds:
+            return None
+        return self.session_bytes / self.session_seconds
+
+    def eta(self, remaining_bytes):
+        """Estimate seconds needed to upload more data.
+
+        :param int remaining_bytes: Bytes left to upload.
+
+        :return: Seconds, or None without an estimate.
+        :rtype: float
+        """
+        bytes_per_second = self.bytes_per_second
+        if bytes_per_second is None:
+            return None
+        return remaining_bytes / bytes_per_second
+
+    def fit(self, sizes, seconds):
+        """Count how many files can be uploaded in order before time runs out.
+
+        The first file is always allowed while there is time left. Otherwise an estimate from one slow sync would stop
+        all uploads, and without uploads it would never be replaced by new samples.
+
+        :param iter sizes: File sizes in upload order.
+        :param int seconds: Time available, None for unlimited.
+
+        :return: Number of leading files that fit (all of them without a bandwidth estimate).
+        :rtype: int
+        """
+        sizes = list(sizes)
+        if seconds is None or self.bytes_per_second is None:
+            return len(sizes)
+        total = 0
+        for count, size in enumerate(sizes):
+            total += size
+            if self.eta(total) > seconds:
+                return max(count, 1 if seconds > 0 else 0)
+        return len(sizes)
+
+    def record(self, num_bytes, seconds):
+        """Add one upload sample.
+
+        :param int num_bytes: Bytes uploaded.
+        :param float seconds: Seconds it took.
+        """
+        self.samples.append((num_bytes, seconds))
+        self.session_bytes += num_bytes
+        self.session_seconds += seconds
+
+    def start_session(self):
+        """Reset session totals. Rolling samples are kept."""
+        self.session_bytes = 0
+        self.session_seconds = 0.0
+
+
+THROUGHPUT = Throughput()
@@ -2,34 +2,72 @@
 
 import asyncio
 import logging
-from socket import error, socket
 
 from flash_air_music.configuration import GLOBAL_MUTABLE_CONFIG
-from flash_air_music.lib import SHUTDOWN
+from flash_air_music.lib import wait_for_shutdown
+from flash_air_music.metrics import CARD_REACHABLE
+from flash_air_music.pipeline import PIPELINE
+from flash_air_music.schedule import in_window
+from flash_air_music.upload.remote import REMOTE_TREE
 from flash_air_music.upload.run import run
 
 EVERY_SECONDS_CHECK = 5
+MAX_ABSENT_SLEEP = 60
 SUCCESS_SLEEP = 5 * 60
 
 
+@asyncio.coroutine
+def probe(ip_addr, timeout, port=80):
+    """Check if the FlashAir card accepts connections without blocking the event loop.
+
+    :param str ip_addr: IP address of FlashAir to connect to.
+    :param float timeout: Give up after this many seconds.
+    :param int port: TCP port to connect to.
+
+    :return: If the card is reachable.
+    :rtype: bool
+    """
+    try:
+        writer = (yield from asyncio.wait_for(asyncio.open_connection(ip_addr, port), timeout))[1]
+    except (asyncio.TimeoutError, OSError):
+        return False
+    writer.close()
+    return True
+
+
 @asyncio.coroutine
 def watch_for_flashair():
-    """Try to connect to FlashAir card every EVERY_SECONDS_CHECK. Runs coroutine if card responds."""
+    """Try to connect to FlashAir card every EVERY_SECONDS_CHECK. Runs coroutine if card responds.
+
+    While the card stays unreachable the time between checks doubles up to MAX_ABSENT_SLEEP. It goes back to
+    EVERY_SECONDS_CHECK as soon as the card answers again.
+    """
     log = logging.getLogger(__name__)
+    absent_sleep = EVERY_SECONDS_CHECK
 
     while True:
         sleep_for = EVERY_SECONDS_CHECK
 
         # Check if card is reachable.
-        if GLOBAL_MUTABLE_CONFIG['--ip-addr']:
-            try:
-                with socket() as sock:
-                    sock.connect((GLOBAL_MUTABLE_CONFIG['--ip-addr'], 80))
-            except error:
-                success = False
+        if PIPELINE.is_paused('upload'):
+            log.debug('Uploads paused. Skipping watch_for_flashair().')
+            success = True  # Resuming wakes up this coroutine.
+        elif not in_window(GLOBAL_MUTABLE_CONFIG['--sync-hours']):
+            log.debug('Outside of sync hours. Skipping watch_for_flashair().')
+            success = True  # Sleep longer.
+        elif GLOBAL_MUTABLE_CONFIG['--ip-addr']:
+            ip_addr = GLOBAL_MUTABLE_CONFIG['--ip-addr']
+            reachable = yield from probe(ip_addr, float(GLOBAL_MUTABLE_CONFIG['--probe-timeout']))
+            CARD_REACHABLE.set(int(reachable))
+            if reachable:
+                absent_sleep = EVERY_SECONDS_CHECK
+                log.debug('%s is reachable. calling run().', ip_addr)
+                success = yield from run(ip_addr)
             else:
-                log.debug('%s is reachable. calling run().', GLOBAL_MUTABLE_CONFIG['--ip-addr'])
-                success = yield from run(GLOBAL_MUTABLE_CONFIG['--ip-addr'])
+                REMOTE_TREE.invalidate()  # Card may be changed by its host while unreachable.
+                sleep_for, absent_sleep = absent_sleep, min(absent_sleep * 2, MAX_ABSENT_SLEEP)
+                log.debug('%s not reachable, next check in %d second(s).', ip_addr, sleep_for)
+                success = False
         else:
             log.debug('No IP address specified. Skipping watch_for_flashair().')
             success = True
@@ -38,9 +76,7 @@ def watch_for_flashair():
         if success:
             sleep_for = SUCCESS_SLEEP
 
-        # Sleep.
-        for _ in range(sleep_for):
-            if SHUTDOWN.done():
-                log.debug('watch_for_flashair() saw shutdown signal.')
-                return
-            yield from asyncio.sleep(1)
+        # Sleep until the next check or until a sync is requested.
+        if (yield from wait_for_shutdown(sleep_for, PIPELINE.upload_wakeup())):
+            log.debug('watch_for_flashair() saw shutdown signal.')
+            return
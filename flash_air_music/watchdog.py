@@ -0,0 +1,109 @@
+"""Detect and attribute event loop stalls caused by blocking calls.
+
+A helper thread schedules a callback on the event loop PROBES_PER_THRESHOLD times every --stall-threshold seconds and
+measures how long it takes to run. A stall starts when the first unanswered callback was scheduled. As soon as it lasts
+longer than the threshold the thread grabs and logs the stack of the event loop thread, which shows the call blocking
+it, then logs the stall duration once the loop runs again. Probing wakes up the event loop, so the watchdog only runs
+when --stall-threshold is set.
+"""
+
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from flash_air_music.metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+PROBES_PER_THRESHOLD = 4  # A stall is reported at most 1/4 threshold late and its duration at most that much short.
+
+
+class Watchdog(threading.Thread):
+    """Thread probing the event loop.
+
+    :ivar asyncio.AbstractEventLoop loop: Event loop to watch.
+    :ivar int loop_thread: Thread identifier of the thread running the loop.
+    :ivar threading.Event ran: Set when the callback of the current probe runs, or by stop() so it won't wait for it.
+    :ivar threading.Event stopping: Set by stop().
+    :ivar float threshold: Log stalls longer than this many seconds.
+    """
+
+    def __init__(self, loop, threshold):
+        """Constructor. Must be called from the thread running the loop.
+
+        :param asyncio.AbstractEventLoop loop: Event loop to watch.
+        :param float threshold: Log stalls longer than this many seconds.
+        """
+        super().__init__(name='watchdog', daemon=True)
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.ran = threading.Event()
+        self.stopping = threading.Event()
+        self.threshold = threshold
+
+    def loop_stack(self):
+        """Format the current stack of the event loop thread.
+
+        :return: Formatted stack, most recent call last.
+        :rtype: str
+        """
+        frame = sys._current_frames().get(self.loop_thread)  # pylint: disable=protected-access
+        if frame is None:
+            return 'Event loop thread not running.\n'
+        return ''.join(traceback.format_stack(frame))
+
+    def probe(self):
+        """Measure one event loop round trip. Log the loop thread's stack as soon as it exceeds the threshold.
+
+        :return: Seconds it took the loop to run the callback. None if stopped or the loop closed meanwhile.
+        :rtype: float
+        """
+        log = logging.getLogger(__name__)
+        answered = list()
+        self.ran = ran = threading.Event()
+        if self.stopping.is_set():
+            return None  # stop() may have set the previous event.
+
+        def answer():
+            """Runs on the event loop."""
+            answered.append(time.monotonic())
+            ran.set()
+
+        sent = time.monotonic()
+        try:
+            self.loop.call_soon_threadsafe(answer)
+        except RuntimeError:  # Loop closed.
+            return None
+        if ran.wait(self.threshold) and answered:
+            return answered[0] - sent
+        if self.stopping.is_set():
+            return None  # Loop stopped running before answering, not a stall.
+
+        # Stalled since the callback was scheduled.
+        LOOP_STALLS.inc()
+        stack = self.loop_stack()
+        log.warning('Event loop blocked for %.2f seconds. Stack:\n%s', time.monotonic() - sent, stack.rstrip())
+        ran.wait()
+        if not answered:
+            return None  # Stopped.
+        lag = answered[0] - sent
+        log.warning('Event loop was blocked for %.2f seconds.', lag)
+        return lag
+
+    def run(self):
+        """Probe until stop() is called."""
+        log = logging.getLogger(__name__)
+        log.debug('Watching for event loop stalls longer than %.2f seconds.', self.threshold)
+        while not self.stopping.wait(self.threshold / PROBES_PER_THRESHOLD):
+            lag = self.probe()
+            if lag is None:
+                break
+            LOOP_LAG_SECONDS.observe(lag)
+        log.debug('Watchdog stopped.')
+
+    def stop(self):
+        """Stop probing and wait for the thread to exit."""
+        self.stopping.set()
+        self.ran.set()
+        if self.is_alive():
+            self.join()
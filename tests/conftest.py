@@ -30,11 +30,13 @@ def shutdown_future(monkeypatch):
     """
     shutdown = asyncio.Future()
     monkeypatch.setattr('flash_air_music.__main__.SHUTDOWN', shutdown)
+    monkeypatch.setattr('flash_air_music.convert.run.SHUTDOWN', shutdown)
+    monkeypatch.setattr('flash_air_music.convert.scheduler.SHUTDOWN', shutdown)
     monkeypatch.setattr('flash_air_music.convert.transcode.SHUTDOWN', shutdown)
     monkeypatch.setattr('flash_air_music.convert.triggers.SHUTDOWN', shutdown)
     monkeypatch.setattr('flash_air_music.lib.SHUTDOWN', shutdown)
+    monkeypatch.setattr('flash_air_music.pipeline.SHUTDOWN', shutdown)
     monkeypatch.setattr('flash_air_music.upload.discover.SHUTDOWN', shutdown)
     monkeypatch.setattr('flash_air_music.upload.interface.SHUTDOWN', shutdown)
     monkeypatch.setattr('flash_air_music.upload.run.SHUTDOWN', shutdown)
-    monkeypatch.setattr('flash_air_music.upload.triggers.SHUTDOWN', shutdown)
     return shutdown
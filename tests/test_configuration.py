@@ -74,6 +74,32 @@ def test_config_file(monkeypatch, tmpdir, caplog, bad):
     assert messages[-1] == 'Config file specified but invalid: Unable to parse config file.'
 
 
+def test_client_config(monkeypatch, tmpdir):
+    """Test initialize_config() with a command talking to the running service. Must not validate or open --log.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+    logging_config = list()
+    monkeypatch.setattr(configuration, 'setup_logging', logging_config.append)
+    monkeypatch.chdir(tmpdir)
+
+    # Setup argv.
+    argv.extend(['status', '--log', str(tmpdir.join('dne', 'logfile.log')), '--music-source', 'dne', '--working-dir',
+                 'working', '--ffmpeg-bin', 'dne'])
+
+    # Run.
+    configuration.initialize_config(doc)
+
+    # Verify.
+    assert config['status'] is True
+    assert config['--working-dir'] == str(tmpdir.join('working'))
+    assert config['--music-source'] == 'dne'  # Not resolved.
+    assert config['--log'] == str(tmpdir.join('dne', 'logfile.log'))
+    assert logging_config[0]['--log'] is None
+
+
 @pytest.mark.parametrize('mode', ['not_used', 'used', 'no_parent', 'dir_perm', 'file_perm'])
 def test_validate_config_log(monkeypatch, tmpdir, caplog, mode):
     """Test _validate_config() --log validation via initialize_config().
@@ -216,6 +242,85 @@ def test_validate_config_working_dir(monkeypatch, tmpdir, caplog, mode):
         assert messages[-1] == 'Music source dir cannot be in working directory.'
 
 
+@pytest.mark.parametrize('mode', ['missing', 'specified', 'dne', 'perm', 'collision1', 'collision2', 'bad profile'])
+def test_validate_config_archive(monkeypatch, tmpdir, caplog, mode):
+    """Test _validate_config() --archive-dir and --archive-profile validation via initialize_config().
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+
+    # Setup argv.
+    argv.extend(['run', '--music-source', str(tmpdir.ensure_dir('source'))])
+    if mode == 'collision1':
+        argv.extend(['--archive-dir', str(tmpdir.ensure_dir('source', 'archive'))])
+    elif mode == 'collision2':
+        argv.extend(['--archive-dir', str(tmpdir)])
+    elif mode != 'missing':
+        argv.extend(['--archive-dir', str(tmpdir.join('archive'))])
+    if mode == 'bad profile':
+        argv.extend(['--archive-profile', 'V11'])
+
+    # Populate tmpdir.
+    if mode != 'dne':
+        tmpdir.ensure_dir('archive')
+    if mode == 'perm':
+        tmpdir.join('archive').chmod(0o444)
+
+    # Run.
+    if mode in ('missing', 'specified'):
+        configuration.initialize_config(doc)
+        assert config['--archive-dir'] == (None if mode == 'missing' else str(tmpdir.join('archive')))
+        assert config['--archive-profile'] == 'V0'
+        return
+
+    # Run.
+    with pytest.raises(exceptions.ConfigError):
+        configuration.initialize_config(doc)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    if mode == 'dne':
+        assert messages[-1].startswith('Archive directory does not exist')
+    elif mode == 'perm':
+        assert messages[-1].startswith('No access to archive directory')
+    elif mode == 'bad profile':
+        assert messages[-1] == 'Invalid encoder profile: V11'
+    else:
+        assert messages[-1] == 'Archive dir cannot be in or contain music source/working dirs.'
+
+
+@pytest.mark.parametrize('profile', [None, 'V5', 'CBR128+mono+22050', 'CBR128+22050+mono', 'V10', 'CBR100',
+                                     'V5+mono+mono', 'v5'])
+def test_validate_config_encoder_profile(monkeypatch, tmpdir, caplog, profile):
+    """Test _validate_config() --encoder-profile validation via initialize_config().
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str profile: Value of --encoder-profile.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+    argv.extend(['run', '--music-source', str(tmpdir.ensure_dir('source'))])
+    if profile:
+        argv.extend(['--encoder-profile', profile])
+
+    # Run.
+    if profile in (None, 'V5', 'CBR128+mono+22050', 'CBR128+22050+mono'):
+        configuration.initialize_config(doc)
+        assert config['--encoder-profile'] == ('CBR128+mono+22050' if profile and '+' in profile else profile or 'V0')
+        return
+    with pytest.raises(exceptions.ConfigError):
+        configuration.initialize_config(doc)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    assert messages[-1] == 'Invalid encoder profile: {}'.format(profile)
+
+
 @pytest.mark.parametrize('mode', ['missing', 'ip', 'hostname', 'bad'])
 def test_validate_config_ip_addr(monkeypatch, tmpdir, caplog, mode):
     """Test _validate_config() --ip-addr validation via initialize_config().
@@ -285,6 +390,310 @@ def test_validate_config_threads(monkeypatch, tmpdir, caplog, mode):
     assert messages[-1] == 'Thread count must be a number: {}'.format(mode)
 
 
+@pytest.mark.parametrize('mode', ['default', 'valid', 'bad cpu', 'bad nice', 'negative nice', 'bad ionice', 'platform'])
+def test_validate_config_priority(monkeypatch, tmpdir, caplog, mode):
+    """Test _validate_config() --cpu-affinity, --nice, and --ionice validation via initialize_config().
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+    monkeypatch.setattr(configuration.platform, 'machine', lambda: 'sparc' if mode == 'platform' else 'x86_64')
+
+    # Setup argv.
+    argv.extend(['run', '--music-source', str(tmpdir.ensure_dir('source'))])
+    if mode != 'default':
+        argv.extend(['--cpu-affinity', '0-999' if mode == 'bad cpu' else '0'])
+        argv.extend(['--nice', {'bad nice': '20', 'negative nice': '-1'}.get(mode, '10')])
+        argv.extend(['--ionice', 'realtime' if mode == 'bad ionice' else 'idle'])
+
+    # Run.
+    if mode in ('default', 'valid'):
+        configuration.initialize_config(doc)
+        expected = [None, None, None] if mode == 'default' else ['0', '10', 'idle']
+        assert [config['--cpu-affinity'], config['--nice'], config['--ionice']] == expected
+        return
+
+    # Run.
+    with pytest.raises(exceptions.ConfigError):
+        configuration.initialize_config(doc)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    if mode == 'bad cpu':
+        assert messages[-1] == 'Invalid CPU list: 0-999'
+    elif mode == 'bad ionice':
+        assert messages[-1] == 'Invalid I/O scheduling class: realtime'
+    elif mode == 'platform':
+        assert messages[-1] == 'I/O scheduling class not supported on sparc.'
+    else:
+        assert messages[-1].startswith('Nice level must be 0 through 19: ')
+
+
+@pytest.mark.parametrize('mode', ['default', 'valid', 'bad full speed', 'bad sync', 'bad reduced', 'zero reduced'])
+def test_validate_config_schedule(monkeypatch, tmpdir, caplog, mode):
+    """Test _validate_config() --full-speed-hours, --sync-hours, and --reduced-threads validation.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+
+    # Setup argv.
+    argv.extend(['run', '--music-source', str(tmpdir.ensure_dir('source'))])
+    if mode != 'default':
+        argv.extend(['--full-speed-hours', '22-25' if mode == 'bad full speed' else '22-7'])
+        argv.extend(['--sync-hours', '1' if mode == 'bad sync' else '1-6'])
+        argv.extend(['--reduced-threads', {'bad reduced': 'a', 'zero reduced': '0'}.get(mode, '2')])
+
+    # Run.
+    if mode in ('default', 'valid'):
+        configuration.initialize_config(doc)
+        expected = [None, None, '1'] if mode == 'default' else ['22-7', '1-6', '2']
+        assert [config['--full-speed-hours'], config['--sync-hours'], config['--reduced-threads']] == expected
+        return
+
+    # Run.
+    with pytest.raises(exceptions.ConfigError):
+        configuration.initialize_config(doc)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    if mode == 'bad full speed':
+        assert messages[-1] == 'Invalid hours for --full-speed-hours: 22-25'
+    elif mode == 'bad sync':
+        assert messages[-1] == 'Invalid hours for --sync-hours: 1'
+    else:
+        assert messages[-1].startswith('Reduced thread count must be 1 or more: ')
+
+
+@pytest.mark.parametrize('mode', ['default', '4', '0', 'a'])
+def test_validate_config_discovery_threads(monkeypatch, tmpdir, caplog, mode):
+    """Test _validate_config() --discovery-threads validation via initialize_config().
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+    argv.extend(['run', '--music-source', str(tmpdir.ensure_dir('source'))])
+    if mode != 'default':
+        argv.extend(['--discovery-threads', mode])
+
+    # Run.
+    if mode in ('default', '4'):
+        configuration.initialize_config(doc)
+        assert config['--discovery-threads'] == ('1' if mode == 'default' else mode)
+        return
+    with pytest.raises(exceptions.ConfigError):
+        configuration.initialize_config(doc)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    assert messages[-1] == 'Discovery thread count must be 1 or more: {}'.format(mode)
+
+
+@pytest.mark.parametrize('mode', ['default', '900', '-1', 'a'])
+def test_validate_config_remote_cache_ttl(monkeypatch, tmpdir, caplog, mode):
+    """Test _validate_config() --remote-cache-ttl validation via initialize_config().
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+    argv.extend(['run', '--music-source', str(tmpdir.ensure_dir('source'))])
+    if mode != 'default':
+        argv.extend(['--remote-cache-ttl', mode])
+
+    # Run.
+    if mode in ('default', '900'):
+        configuration.initialize_config(doc)
+        assert config['--remote-cache-ttl'] == ('0' if mode == 'default' else mode)
+        return
+    with pytest.raises(exceptions.ConfigError):
+        configuration.initialize_config(doc)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    assert messages[-1] == 'Remote cache TTL must be 0 or more seconds: {}'.format(mode)
+
+
+@pytest.mark.parametrize('mode', ['default', '9099', 'localhost:9099', '/tmp/fam.sock', '99999', 'localhost'])
+def test_validate_config_metrics(monkeypatch, tmpdir, caplog, mode):
+    """Test _validate_config() --metrics validation via initialize_config().
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+    argv.extend(['run', '--music-source', str(tmpdir.ensure_dir('source'))])
+    if mode != 'default':
+        argv.extend(['--metrics', mode])
+
+    # Run.
+    if mode not in ('99999', 'localhost'):
+        configuration.initialize_config(doc)
+        assert config['--metrics'] == (None if mode == 'default' else mode)
+        return
+    with pytest.raises(exceptions.ConfigError):
+        configuration.initialize_config(doc)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    assert messages[-1] == 'Invalid metrics address: {}'.format(mode)
+
+
+@pytest.mark.parametrize('mode', ['default', '0.5', '0', 'a'])
+def test_validate_config_stall_threshold(monkeypatch, tmpdir, caplog, mode):
+    """Test _validate_config() --stall-threshold validation via initialize_config().
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+    argv.extend(['run', '--music-source', str(tmpdir.ensure_dir('source'))])
+    if mode != 'default':
+        argv.extend(['--stall-threshold', mode])
+
+    # Run.
+    if mode in ('default', '0.5'):
+        configuration.initialize_config(doc)
+        assert config['--stall-threshold'] == (None if mode == 'default' else mode)
+        return
+    with pytest.raises(exceptions.ConfigError):
+        configuration.initialize_config(doc)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    assert messages[-1] == 'Stall threshold must be more than 0 seconds: {}'.format(mode)
+
+
+@pytest.mark.parametrize('mode', ['default', 'set', 'relative', 'dne'])
+def test_validate_config_control_socket(monkeypatch, tmpdir, caplog, mode):
+    """Test _validate_config() --control-socket validation via initialize_config().
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+    argv.extend(['run', '--music-source', str(tmpdir.ensure_dir('source'))])
+    if mode == 'set':
+        argv.extend(['--control-socket', str(tmpdir.join('control.sock'))])
+    elif mode == 'relative':
+        monkeypatch.chdir(tmpdir)
+        argv.extend(['--control-socket', 'control.sock'])
+    elif mode == 'dne':
+        argv.extend(['--control-socket', str(tmpdir.join('dne', 'control.sock'))])
+
+    # Run.
+    if mode != 'dne':
+        configuration.initialize_config(doc)
+        assert config['run'] is True
+        assert config['--control-socket'] == (None if mode == 'default' else str(tmpdir.join('control.sock')))
+        return
+    with pytest.raises(exceptions.ConfigError):
+        configuration.initialize_config(doc)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    assert messages[-1] == 'Control socket parent directory {} not a directory.'.format(tmpdir.join('dne'))
+
+
+@pytest.mark.parametrize('mode', ['default', 'pinned,album,newest,size', 'size,size', 'largest', ''])
+def test_validate_config_upload_order(monkeypatch, tmpdir, caplog, mode):
+    """Test _validate_config() --upload-order validation via initialize_config().
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+    argv.extend(['run', '--music-source', str(tmpdir.ensure_dir('source'))])
+    if mode != 'default':
+        argv.extend(['--upload-order', mode])
+
+    # Run.
+    if mode in ('default', 'pinned,album,newest,size'):
+        configuration.initialize_config(doc)
+        assert config['--upload-order'] == ('size' if mode == 'default' else mode)
+        return
+    with pytest.raises(exceptions.ConfigError):
+        configuration.initialize_config(doc)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    assert messages[-1] == 'Invalid upload order: {}'.format(mode)
+
+
+@pytest.mark.parametrize('mode', ['default', 'relative', 'absolute', 'outside'])
+def test_validate_config_pinned_dirs(monkeypatch, tmpdir, caplog, mode):
+    """Test _validate_config() --pinned-dirs validation via initialize_config().
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+    argv.extend(['run', '--music-source', str(tmpdir.ensure_dir('source'))])
+    value = {'relative': 'Podcasts', 'absolute': str(tmpdir.join('source', 'Podcasts')), 'outside': str(tmpdir)}
+    if mode != 'default':
+        argv.extend(['--pinned-dirs', value[mode]])
+
+    # Run.
+    if mode != 'outside':
+        configuration.initialize_config(doc)
+        assert config['--pinned-dirs'] == value.get(mode)
+        return
+    with pytest.raises(exceptions.ConfigError):
+        configuration.initialize_config(doc)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    assert messages[-1] == 'Pinned directories must be in the music source: {}'.format(tmpdir)
+
+
+@pytest.mark.parametrize('mode', ['default', '0.5', '0', 'a'])
+def test_validate_config_probe_timeout(monkeypatch, tmpdir, caplog, mode):
+    """Test _validate_config() --probe-timeout validation via initialize_config().
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    argv, config = common_init(monkeypatch, tmpdir)[:2]
+    argv.extend(['run', '--music-source', str(tmpdir.ensure_dir('source'))])
+    if mode != 'default':
+        argv.extend(['--probe-timeout', mode])
+
+    # Run.
+    if mode in ('default', '0.5'):
+        configuration.initialize_config(doc)
+        assert config['--probe-timeout'] == ('2' if mode == 'default' else mode)
+        return
+    with pytest.raises(exceptions.ConfigError):
+        configuration.initialize_config(doc)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    assert messages[-1] == 'Probe timeout must be more than 0 seconds: {}'.format(mode)
+
+
 @pytest.mark.parametrize('mode', ['specified', 'default', 'default missing', 'dne', 'perm'])
 def test_validate_config_ffmpeg_bin(monkeypatch, tmpdir, caplog, mode):
     """Test _validate_config() --ffmpeg-bin validation via initialize_config().
@@ -0,0 +1,190 @@
+"""Test flash_air_music.control functions/classes."""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import stat
+
+import pytest
+
+from flash_air_music import control, exceptions
+from flash_air_music.pipeline import Pipeline
+
+CONFIG = {
+    '--control-socket': None,
+    '--working-dir': '/tmp/working',
+    'convert': False,
+    'pause': False,
+    'resume': False,
+    'status': False,
+    'sync-now': False,
+    'upload': False,
+}
+
+STATUS = dict(
+    conversions=[dict(pid=100, song='Artist/song1.flac', elapsed=12.34)],
+    paused=['upload'],
+    pending=2,
+    scans=dict(convert_discover=0.5, upload_local=1.25),
+    upload=dict(source='/tmp/working/song.mp3', size=4000, sent=1000),
+)
+
+
+def test_socket_path():
+    """Test socket_path()."""
+    assert control.socket_path(CONFIG) == '/tmp/working/.fam_control.sock'
+    assert control.socket_path(dict(CONFIG, **{'--control-socket': '/run/fam.sock'})) == '/run/fam.sock'
+
+
+@pytest.mark.parametrize('request_, expected, paused', [
+    (dict(command='pause'), dict(message='Paused convert, upload.'), {'convert', 'upload'}),
+    (dict(command='pause', targets=['upload']), dict(message='Paused upload.'), {'upload'}),
+    (dict(command='pause', targets=['cpu']), dict(error="Invalid targets: ['cpu']"), set()),
+    (dict(command='pause', targets='upload'), dict(error='Invalid targets: upload'), set()),
+    (dict(command='resume', targets=['convert']), dict(message='Resumed convert.'), set()),
+    (dict(command='sync-now'), dict(message='Sync requested.'), set()),
+    (dict(command='run'), dict(error='Unknown command: run'), set()),
+    (dict(), dict(error='Unknown command: None'), set()),
+])
+def test_execute(monkeypatch, request_, expected, paused):
+    """Test execute().
+
+    :param monkeypatch: pytest fixture.
+    :param dict request_: Request to send.
+    :param dict expected: Expected response.
+    :param set paused: Expected paused targets.
+    """
+    state, requested = Pipeline(), list()
+    monkeypatch.setattr(control, 'PIPELINE', state)
+    monkeypatch.setattr(control.SCHEDULER, 'request', lambda: requested.append(True))
+    wakeup = state.upload_wakeup()
+
+    assert control.execute(request_) == expected
+    assert state.paused == paused
+    assert bool(requested) is (request_.get('command') == 'sync-now')
+    assert wakeup.done() is (request_.get('command') == 'sync-now')
+
+
+def test_serve_send(monkeypatch, tmpdir, caplog, shutdown_future):
+    """Test serve() and send() end to end.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param shutdown_future: conftest fixture.
+    """
+    state = Pipeline()
+    monkeypatch.setattr(control, 'PIPELINE', state)
+    path = str(tmpdir.join('control.sock'))
+    socket.socket(socket.AF_UNIX).bind(path)  # Stale socket left behind by a killed process.
+    loop = asyncio.get_event_loop()
+    task = loop.create_task(control.serve(path))
+    for _ in range(50):
+        if caplog.records and caplog.records[-1].message.startswith('Listening'):
+            break
+        loop.run_until_complete(asyncio.sleep(0.02))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    # Client blocks, run it in a thread.
+    response = loop.run_until_complete(loop.run_in_executor(None, control.send, path, dict(command='pause')))
+    assert response == dict(message='Paused convert, upload.')
+    response = loop.run_until_complete(loop.run_in_executor(None, control.send, path, dict(command='status')))
+    assert response['paused'] == ['convert', 'upload']
+    assert response['upload'] is None
+
+    # Invalid request.
+    reader, writer = loop.run_until_complete(asyncio.open_unix_connection(path))
+    writer.write(b'[1, 2]\n')
+    assert json.loads(loop.run_until_complete(reader.readline()).decode('utf-8')) == dict(error='Invalid request.')
+    writer.close()
+
+    # Shutdown.
+    shutdown_future.set_result(signal.SIGTERM)
+    loop.run_until_complete(asyncio.wait_for(task, 5))
+    assert not os.path.exists(path)
+
+
+def test_serve_error(tmpdir, caplog, shutdown_future):
+    """Test serve() with a socket path that can't be bound.
+
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param shutdown_future: conftest fixture.
+    """
+    path = str(tmpdir.join('dne', 'control.sock'))
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(asyncio.wait_for(control.serve(path), 5))
+    assert not shutdown_future.done()
+    messages = [r.message for r in caplog.records]
+    assert messages[-1].startswith('Unable to listen for control requests on {}: '.format(path))
+
+
+def test_format_status():
+    """Test format_status()."""
+    expected = (
+        'Paused: upload\n'
+        'Converting 1 song(s), 2 waiting.\n'
+        '        12.3s  Artist/song1.flac (pid 100)\n'
+        'Uploading /tmp/working/song.mp3: 1000 of 4000 bytes (25%).\n'
+        'Last scans:\n'
+        '        0.50s  convert_discover\n'
+        '        1.25s  upload_local'
+    )
+    assert control.format_status(STATUS) == expected
+
+    idle = dict(conversions=list(), paused=list(), pending=0, scans=dict(), upload=None)
+    expected = 'Paused: nothing\nConverting 0 song(s), 0 waiting.\nNot uploading.\nNo scans yet.'
+    assert control.format_status(idle) == expected
+
+
+@pytest.mark.parametrize('mode', ['status', 'pause', 'unreachable', 'invalid', 'rejected'])
+def test_client(monkeypatch, capsys, caplog, mode):
+    """Test client().
+
+    :param monkeypatch: pytest fixture.
+    :param capsys: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    sent = list()
+
+    def send(path, request):
+        """Fake send().
+
+        :param str path: Socket path.
+        :param dict request: Request.
+        """
+        sent.append((path, request))
+        if mode == 'unreachable':
+            raise FileNotFoundError(2, 'No such file or directory')
+        if mode == 'invalid':
+            raise ValueError
+        if mode == 'rejected':
+            return dict(error='Invalid targets: []')
+        return STATUS if mode == 'status' else dict(message='Paused upload.')
+
+    monkeypatch.setattr(control, 'send', send)
+    config = dict(CONFIG, **{'status': mode == 'status', 'pause': mode != 'status', 'upload': mode != 'status'})
+
+    # Run.
+    if mode in ('status', 'pause'):
+        control.client(config)
+        stdout = capsys.readouterr()[0]
+        assert stdout == (control.format_status(STATUS) if mode == 'status' else 'Paused upload.') + '\n'
+        expected = dict(command='status') if mode == 'status' else dict(command='pause', targets=['upload'])
+        assert sent == [('/tmp/working/.fam_control.sock', expected)]
+        return
+    with pytest.raises(exceptions.ControlError):
+        control.client(config)
+
+    # Verify.
+    messages = [r.message for r in caplog.records]
+    if mode == 'unreachable':
+        expected = 'Unable to reach the service on /tmp/working/.fam_control.sock: [Errno 2] No such file or directory'
+    elif mode == 'invalid':
+        expected = 'Invalid response from the service on /tmp/working/.fam_control.sock'
+    else:
+        expected = 'Service rejected the request: Invalid targets: []'
+    assert messages[-1] == expected
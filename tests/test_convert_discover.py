@@ -101,10 +101,12 @@ def test_get_songs(tmpdir):
     assert sorted(valid_targets) == [str(target_dir.join('song1.mp3')), str(target_dir.join('song2.mp3'))]
 
 
-def test_get_songs_subdirectories(tmpdir):
+@pytest.mark.parametrize('threads', [1, 3])
+def test_get_songs_subdirectories(tmpdir, threads):
     """Test get_songs() with nested subdirectories.
 
     :param tmpdir: pytest fixture.
+    :param int threads: Discovery thread count.
     """
     # Setup directory structure.
     source_dir = tmpdir.ensure_dir('source')
@@ -122,7 +124,7 @@ def test_get_songs_subdirectories(tmpdir):
     HERE.join('1khz_sine_2.mp3').copy(source_dir_d.join('song5.mp3'))
 
     # Test those files.
-    songs, valid_targets = discover.get_songs(str(source_dir), str(target_dir))
+    songs, valid_targets = discover.get_songs(str(source_dir), str(target_dir), threads=threads)
     assert len(songs) == 5
     assert len(valid_targets) == 5
     expected = {
@@ -144,6 +146,126 @@ def test_get_songs_subdirectories(tmpdir):
     assert sorted(valid_targets) == sorted(expected)
 
 
+def test_get_songs_extra_outputs(tmpdir):
+    """Test get_songs() with an additional output directory and profile.
+
+    :param tmpdir: pytest fixture.
+    """
+    source_dir = tmpdir.ensure_dir('source')
+    target_dir = tmpdir.ensure_dir('target')
+    archive_dir = tmpdir.ensure_dir('archive')
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.join('song1.mp3'))
+    extra_outputs = [('V0', str(archive_dir))]
+
+    # Neither output exists.
+    songs, valid_targets = discover.get_songs(str(source_dir), str(target_dir), 'V5', extra_outputs)
+    assert len(songs) == 1
+    assert songs[0].profile == 'V5'
+    assert [(s.profile, s.target) for s in songs[0].extra_outputs] == [('V0', str(archive_dir.join('song1.mp3')))]
+    assert songs[0].pending_outputs == [songs[0]] + list(songs[0].extra_outputs)
+    assert not hasattr(songs[0], '__dict__')  # __slots__ everywhere in the class hierarchy.
+    assert sorted(valid_targets) == [str(archive_dir.join('song1.mp3')), str(target_dir.join('song1.mp3'))]
+
+    # Archive copy is up to date.
+    HERE.join('1khz_sine_2.mp3').copy(archive_dir.join('song1.mp3'))
+    id3_flac_tags.write_stored_metadata(songs[0].extra_outputs[0])
+    songs = discover.get_songs(str(source_dir), str(target_dir), 'V5', extra_outputs)[0]
+    assert len(songs) == 1
+    assert songs[0].pending_outputs == [songs[0]]
+
+    # Both up to date.
+    HERE.join('1khz_sine_2.mp3').copy(target_dir.join('song1.mp3'))
+    id3_flac_tags.write_stored_metadata(songs[0])
+    songs = discover.get_songs(str(source_dir), str(target_dir), 'V5', extra_outputs)[0]
+    assert not songs
+
+    # Encoder profile changed.
+    songs = discover.get_songs(str(source_dir), str(target_dir), 'V7+mono', extra_outputs)[0]
+    assert len(songs) == 1
+    assert songs[0].pending_outputs == [songs[0]]
+    assert songs[0].stored_metadata['profile'] == 'V5'
+
+
+@pytest.mark.parametrize('threads', [1, 2])
+def test_get_songs_stat_once(monkeypatch, tmpdir, threads):
+    """Test that get_songs() stats every source and target file at most once.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param int threads: Discovery thread count.
+    """
+    source_dir = tmpdir.ensure_dir('source')
+    for i in range(3):
+        HERE.join('1khz_sine_2.mp3').copy(source_dir.ensure_dir(str(i)).join('song.mp3'))
+    HERE.join('1khz_sine_2.mp3').copy(tmpdir.ensure_dir('target', '0').join('song.mp3'))
+    calls = list()
+    real_stat = os.stat
+    monkeypatch.setattr(os, 'stat', lambda path, *a, **kw: calls.append(path) or real_stat(path, *a, **kw))
+
+    # Run.
+    extra_outputs = [('V0', str(tmpdir.ensure_dir('archive')))]
+    songs = discover.get_songs(str(source_dir), str(tmpdir.join('target')), 'V0', extra_outputs, threads)[0]
+
+    # Verify.
+    assert len(songs) == 3
+    assert len(calls) == len(set(calls))
+
+
+def test_get_songs_directories(tmpdir):
+    """Test get_songs() scoped to some source directories.
+
+    :param tmpdir: pytest fixture.
+    """
+    source_dir = tmpdir.ensure_dir('source')
+    target_dir = tmpdir.ensure_dir('target')
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.join('song1.mp3'))
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.ensure_dir('a').join('song2.mp3'))
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.ensure_dir('a', 'b').join('song3.mp3'))
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.ensure_dir('c').join('song4.mp3'))
+
+    # Run.
+    directories = {str(source_dir.join('a')), str(source_dir.join('c')), str(source_dir.join('removed'))}
+    songs, valid_targets = discover.get_songs(str(source_dir), str(target_dir), directories=directories)
+
+    # Verify.
+    expected = [str(source_dir.join('a', 'song2.mp3')), str(source_dir.join('c', 'song4.mp3'))]
+    assert sorted(s.source for s in songs) == expected
+    assert sorted(valid_targets) == [str(target_dir.join('a', 'song2.mp3')), str(target_dir.join('c', 'song4.mp3'))]
+
+
+def test_source_signatures(tmpdir):
+    """Test source_signatures() and changed_directories().
+
+    :param tmpdir: pytest fixture.
+    """
+    tmpdir.ensure('song1.mp3').write('\x00')
+    tmpdir.ensure('a', 'song2.flac').write('\x00')
+    tmpdir.ensure('a', 'song3.flac').write('\x00')
+    tmpdir.ensure('a', 'ignore.txt')
+    tmpdir.ensure('b', 'c', 'song4.mp3').write('\x00')
+    tmpdir.ensure_dir('d')
+
+    # Initial.
+    previous = discover.source_signatures(str(tmpdir))
+    assert sorted(previous) == [str(tmpdir), str(tmpdir.join('a')), str(tmpdir.join('b', 'c'))]
+    assert all(0 <= s < 2 ** 64 for s in previous.values())
+    assert discover.source_signatures(str(tmpdir)) == previous
+    assert not discover.changed_directories(previous, previous)
+
+    # Change one file, add one directory, remove another, touch a non-song.
+    tmpdir.join('a', 'song2.flac').write('\x00\x00')
+    tmpdir.ensure('d', 'song5.mp3')
+    tmpdir.join('b').remove()
+    tmpdir.join('a', 'ignore.txt').write('changed')
+    current = discover.source_signatures(str(tmpdir))
+    expected = {str(tmpdir.join('a')), str(tmpdir.join('b', 'c')), str(tmpdir.join('d'))}
+    assert discover.changed_directories(previous, current) == expected
+
+    # Rename within directory.
+    tmpdir.join('a', 'song3.flac').rename(tmpdir.join('a', 'song6.flac'))
+    assert discover.changed_directories(current, discover.source_signatures(str(tmpdir))) == {str(tmpdir.join('a'))}
+
+
 def test_files_dirs_to_delete(tmpdir):
     """Test files_dirs_to_delete() function.
 
@@ -176,3 +298,9 @@ def test_files_dirs_to_delete(tmpdir):
     delete_files, remove_dirs = discover.files_dirs_to_delete(str(target_dir), valid_targets)
     assert delete_files == expected_delete
     assert remove_dirs == expected_remove
+
+    # Test scoped to some directories.
+    directories = {str(target_dir.join('remove_this_dir')), str(target_dir.join('keep_this')), str(tmpdir.join('dne'))}
+    delete_files, remove_dirs = discover.files_dirs_to_delete(str(target_dir), valid_targets, directories)
+    assert delete_files == {str(target_dir.join('remove_this_dir', 'remove_me.mp3'))}
+    assert remove_dirs == {str(target_dir.join('remove_this_dir'))}
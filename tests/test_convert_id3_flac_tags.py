@@ -11,7 +11,10 @@ from flash_air_music.exceptions import CorruptedTargetFile
 from tests import HERE
 
 
-@pytest.mark.parametrize('mode', ['dne', 'empty', 'corrupted', 'no comment', 'bad comment', 'partial', 'good'])
+MODES = ['dne', 'empty', 'corrupted', 'no comment', 'bad comment', 'partial', 'good', 'profile']
+
+
+@pytest.mark.parametrize('mode', MODES)
 def test_read_stored_metadata(tmpdir, caplog, mode):
     """Test read_stored_metadata().
 
@@ -37,7 +40,10 @@ def test_read_stored_metadata(tmpdir, caplog, mode):
         text = json.dumps(dict(source_mtime=123))
     elif mode == 'good':
         text = json.dumps(dict(source_mtime=123, source_size=456, target_mtime=123, target_size=456))
-        expected = dict(source_mtime=123, source_size=456, target_mtime=123, target_size=456)
+        expected = dict(profile='V0', source_mtime=123, source_size=456, target_mtime=123, target_size=456)
+    elif mode == 'profile':
+        text = json.dumps(dict(profile='V5+22050+mono', source_mtime=1, source_size=2, target_mtime=3, target_size=4))
+        expected = dict(profile='V5+mono+22050', source_mtime=1, source_size=2, target_mtime=3, target_size=4)
     if text:
         id3 = ID3(str(path))
         id3.add(COMM(desc=id3_flac_tags.COMMENT_DESCRIPTION, encoding=3, lang='eng', text=text))
@@ -49,7 +55,7 @@ def test_read_stored_metadata(tmpdir, caplog, mode):
     # Verify.
     assert actual == expected
     messages = [r.message for r in caplog.records]
-    if mode in ('good', 'dne'):
+    if mode in ('good', 'profile', 'dne'):
         assert not messages
     elif mode in ('empty', 'corrupted'):
         assert messages[-1].startswith('Corrupted mp3 file')
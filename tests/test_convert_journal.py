@@ -0,0 +1,76 @@
+"""Test functions in module."""
+
+import pytest
+
+from flash_air_music.convert.journal import Journal
+
+
+class FakeSong(object):
+    """Minimal stand-in for discover.Song."""
+
+    def __init__(self, source):
+        """Constructor.
+
+        :param str source: Source file path.
+        """
+        self.source = source
+
+
+def test_plan_mark_done_pending(tmpdir):
+    """Test writing and reading back a journal.
+
+    :param tmpdir: pytest fixture.
+    """
+    songs = [FakeSong('/source/song{}.flac'.format(i)) for i in range(5)]
+    journal = Journal('/source', str(tmpdir))
+    assert journal.pending() == []
+
+    # Plan and finish two.
+    journal.plan(songs)
+    journal.mark_done(songs[1])
+    journal.mark_done(songs[3])
+    journal.close(remove=False)
+    assert not tmpdir.join('.fam_convert_journal.tmp').check()
+
+    # Simulate being killed while writing a line.
+    tmpdir.join('.fam_convert_journal').write('"/source/so', mode='a')
+
+    # Read back in a new instance.
+    expected = ['/source/song0.flac', '/source/song2.flac', '/source/song4.flac']
+    assert Journal('/source', str(tmpdir)).pending() == expected
+
+    # Remove.
+    journal.close(remove=True)
+    assert not tmpdir.join('.fam_convert_journal').check()
+    assert journal.pending() == []
+
+
+@pytest.mark.parametrize('mode', ['empty', 'not json', 'no planned', 'other source'])
+def test_pending_ignored(tmpdir, caplog, mode):
+    """Test unusable journals.
+
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    path = tmpdir.join('.fam_convert_journal')
+    if mode == 'empty':
+        path.write('')
+    elif mode == 'not json':
+        path.write('\x00\x00\x00\n')
+    elif mode == 'no planned':
+        path.write('{{"source_dir": "/source", "target_dir": "{}"}}\n'.format(tmpdir))
+    else:
+        other = Journal('/other', str(tmpdir))
+        other.plan([FakeSong('/other/song.flac')])
+        other.close(remove=False)
+
+    # Run.
+    assert Journal('/source', str(tmpdir)).pending() == []
+
+    # Verify.
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+    if mode == 'other source':
+        assert messages[-1] == 'Ignoring journal from different source/target directories.'
+    else:
+        assert messages[-1] == 'Ignoring corrupted journal {}'.format(path)
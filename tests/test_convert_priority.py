@@ -0,0 +1,82 @@
+"""Test functions in module."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from flash_air_music.convert import priority
+
+
+@pytest.mark.parametrize('value,expected', [('0', {0}), ('0,0', {0}), ('0-0', {0}), ('0,1', {0, 1}), ('0-1', {0, 1})])
+def test_parse_cpu_list(monkeypatch, value, expected):
+    """Test parse_cpu_list() with valid values.
+
+    :param monkeypatch: pytest fixture.
+    :param str value: CPU list.
+    :param set expected: Expected return value.
+    """
+    monkeypatch.setattr(priority.os, 'cpu_count', lambda: 2)
+    assert priority.parse_cpu_list(value) == expected
+
+
+@pytest.mark.parametrize('value', ['', ',', 'a', '-1', '1-0', '0-', '0,,1', '2', '0-2'])
+def test_parse_cpu_list_invalid(monkeypatch, value):
+    """Test parse_cpu_list() with invalid values.
+
+    :param monkeypatch: pytest fixture.
+    :param str value: CPU list.
+    """
+    monkeypatch.setattr(priority.os, 'cpu_count', lambda: 2)
+    with pytest.raises(ValueError):
+        priority.parse_cpu_list(value)
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('idle', 3 << 13),
+    ('best-effort:0', 2 << 13),
+    ('best-effort:7', 2 << 13 | 7),
+])
+def test_parse_ionice(value, expected):
+    """Test parse_ionice() with valid values.
+
+    :param str value: I/O scheduling class.
+    :param int expected: Expected return value.
+    """
+    assert priority.parse_ionice(value) == expected
+
+
+@pytest.mark.parametrize('value', ['', 'realtime', 'best-effort', 'best-effort:', 'best-effort:8', 'idle:0'])
+def test_parse_ionice_invalid(value):
+    """Test parse_ionice() with invalid values.
+
+    :param str value: I/O scheduling class.
+    """
+    with pytest.raises(ValueError):
+        priority.parse_ionice(value)
+
+
+@pytest.mark.parametrize('mode', ['nothing', 'everything', 'exited'])
+def test_apply_priority(mode):
+    """Test priority_settings() and apply_priority() on a running child process.
+
+    :param str mode: Scenario to test for.
+    """
+    if mode == 'nothing':
+        assert priority.priority_settings(None, None, None) is None
+        return
+
+    settings = priority.priority_settings('0', '3', 'best-effort:7')
+    assert settings == ({0}, 3, (priority.IOPRIO_CLASS_BE << priority.IOPRIO_CLASS_SHIFT) | 7)
+    script = 'import os, sys; sys.stdin.readline(); print(os.nice(0), sorted(os.sched_getaffinity(0)))'
+    process = subprocess.Popen([sys.executable, '-c', script], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    if mode == 'exited':
+        process.communicate(b'\n')
+        with pytest.raises(ProcessLookupError):
+            priority.apply_priority(process.pid, settings)
+        return
+
+    priority.apply_priority(process.pid, settings)
+    output = process.communicate(b'\n')[0]
+    assert output.decode('utf-8').split(None, 1) == [str(os.nice(0) + 3), '[0]\n']
@@ -0,0 +1,53 @@
+"""Test functions in module."""
+
+import pytest
+
+from flash_air_music.convert import profiles
+
+
+@pytest.mark.parametrize('name,expected', [
+    ('V0', ['-qscale:a', '0']),
+    ('V9', ['-qscale:a', '9']),
+    ('CBR32', ['-b:a', '32k']),
+    ('CBR320', ['-b:a', '320k']),
+    ('V5+mono', ['-qscale:a', '5', '-ac', '1']),
+    ('CBR96+22050', ['-b:a', '96k', '-ar', '22050']),
+    ('V7+44100+mono', ['-qscale:a', '7', '-ar', '44100', '-ac', '1']),
+])
+def test_codec_arguments(name, expected):
+    """Test codec_arguments() with valid profiles.
+
+    :param str name: Profile name.
+    :param list expected: Expected ffmpeg arguments.
+    """
+    assert profiles.codec_arguments(name) == expected
+    assert profiles.is_valid(name)
+
+
+@pytest.mark.parametrize('name,expected', [
+    ('V0', 'V0'),
+    ('V5+mono', 'V5+mono'),
+    ('V5+22050+mono', 'V5+mono+22050'),
+    ('CBR96+mono+22050', 'CBR96+mono+22050'),
+    ('V0+stereo+mono', 'V0+mono+stereo'),
+])
+def test_normalize(name, expected):
+    """Test normalize().
+
+    :param str name: Profile name.
+    :param str expected: Expected normalized name.
+    """
+    assert profiles.normalize(name) == expected
+    assert profiles.normalize(expected) == expected
+
+
+@pytest.mark.parametrize('name', ['', 'v0', 'V00', 'V10', 'V-1', 'CBR', 'CBR100', 'CBR0320', 'V0+', 'V0+stereo',
+                                  'V0+mono+mono', 'V0+22050+44100', 'V0+22051', 'mono'])
+def test_codec_arguments_invalid(name):
+    """Test codec_arguments() with invalid profiles.
+
+    :param str name: Profile name.
+    """
+    with pytest.raises(ValueError):
+        profiles.codec_arguments(name)
+    assert not profiles.is_valid(name)
@@ -3,6 +3,7 @@
 import asyncio
 import re
 import signal
+import time
 from textwrap import dedent
 
 import pytest
@@ -10,6 +11,7 @@ import pytest
 from flash_air_music.__main__ import shutdown
 from flash_air_music.configuration import FFMPEG_DEFAULT_BINARY
 from flash_air_music.convert import discover, run, transcode
+from flash_air_music.convert.journal import Journal, JOURNAL_NAME
 from tests import HERE
 
 
@@ -40,6 +42,24 @@ def shutdown_after_start(loop, caplog, signum):
     yield from shutdown(loop, signum)
 
 
+@asyncio.coroutine
+def max_loop_lag(coro):
+    """Run a coroutine and measure the longest the event loop was blocked meanwhile.
+
+    :param coro: Coroutine to run.
+
+    :return: Coroutine's return value and seconds of the longest gap between 10 millisecond ticks minus 10 milliseconds.
+    :rtype: tuple
+    """
+    task = asyncio.get_event_loop().create_task(coro)
+    lag = 0.0
+    while not task.done():
+        start = time.monotonic()
+        yield from asyncio.sleep(0.01)
+        lag = max(lag, time.monotonic() - start - 0.01)
+    return task.result(), lag
+
+
 @pytest.mark.parametrize('mode', ['none', 'static', 'wait'])
 def test_scan_wait(monkeypatch, tmpdir, caplog, mode):
     """Test scan_wait() function.
@@ -50,8 +70,13 @@ def test_scan_wait(monkeypatch, tmpdir, caplog, mode):
     :param str mode: Scenario to test for.
     """
     source_file = tmpdir.ensure_dir('source').join('song.mp3')
-    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG',
-                        {'--music-source': source_file.dirname, '--working-dir': str(tmpdir.ensure_dir('working'))})
+    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG', {
+        '--archive-dir': None,
+        '--discovery-threads': '1',
+        '--encoder-profile': 'V0',
+        '--music-source': source_file.dirname,
+        '--working-dir': str(tmpdir.ensure_dir('working')),
+    })
     if mode != 'none':
         HERE.join('1khz_sine_2.mp3').copy(source_file)
 
@@ -61,12 +86,13 @@ def test_scan_wait(monkeypatch, tmpdir, caplog, mode):
         nested_results = loop.run_until_complete(asyncio.wait([
             write_to_file_slowly(caplog, str(source_file)), run.scan_wait()
         ], timeout=30))
-        songs, delete_files, remove_dirs = [s for s in nested_results[0] if s.result()][0].result()
+        songs, delete_files, remove_dirs, changing = [s for s in nested_results[0] if s.result()][0].result()
     else:
-        songs, delete_files, remove_dirs = loop.run_until_complete(run.scan_wait())
+        songs, delete_files, remove_dirs, changing = loop.run_until_complete(run.scan_wait())
 
     # Verify.
-    assert [s.source for s in songs] == ([] if mode == 'none' else [str(source_file)])
+    assert [s.source for s in songs] == ([str(source_file)] if mode == 'static' else [])
+    assert [s.source for s in changing] == ([str(source_file)] if mode == 'wait' else [])
     assert not delete_files
     assert not remove_dirs
 
@@ -79,11 +105,170 @@ def test_scan_wait(monkeypatch, tmpdir, caplog, mode):
         assert 'Found: 1 new source song, 0 orphaned target songs, 0 empty directories.' in messages
         if mode == 'wait':
             assert 'Size/mtime changed for {}'.format(source_file) in messages
-            assert '1 song still being written to, waiting 0.5 seconds...'
         else:
             assert 'Size/mtime changed for {}'.format(source_file) not in messages
 
 
+def test_scan_wait_directories(monkeypatch, tmpdir, caplog):
+    """Test scan_wait() scoped to some source directories.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    """
+    source_dir = tmpdir.ensure_dir('source')
+    working_dir = tmpdir.ensure_dir('working')
+    archive_dir = tmpdir.ensure_dir('archive')
+    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG', {
+        '--archive-dir': str(archive_dir),
+        '--archive-profile': 'V0',
+        '--discovery-threads': '1',
+        '--encoder-profile': 'V0',
+        '--music-source': str(source_dir),
+        '--working-dir': str(working_dir),
+    })
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.ensure_dir('a').join('song1.mp3'))
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.ensure_dir('b').join('song2.mp3'))
+    for root in (working_dir, archive_dir):
+        root.ensure('a', 'orphan.mp3')
+        root.ensure('b', 'orphan.mp3')
+        root.ensure('removed', 'orphan.mp3')
+
+    # Run.
+    directories = {str(source_dir.join('a')), str(source_dir.join('removed')), str(tmpdir)}  # tmpdir is ignored.
+    loop = asyncio.get_event_loop()
+    songs, delete_files, remove_dirs, changing = loop.run_until_complete(run.scan_wait(directories))
+
+    # Verify.
+    assert [s.source for s in songs] == [str(source_dir.join('a', 'song1.mp3'))]
+    assert not changing
+    expected = {str(r.join(d, 'orphan.mp3')) for r in (working_dir, archive_dir) for d in ('a', 'removed')}
+    assert delete_files == expected
+    # a/ only holds orphans until song1 is converted. Same as full scans, os.rmdir() fails harmlessly after conversion.
+    assert remove_dirs == {str(r.join(d)) for r in (working_dir, archive_dir) for d in ('a', 'removed')}
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+    assert 'Scanning for new/changed songs in 2 directories...' in messages
+
+
+def test_scan_wait_responsive(monkeypatch, tmpdir):
+    """Test event loop keeps running while a 50k file library is scanned and its orphans deleted.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    """
+    source_dir = tmpdir.ensure_dir('source')
+    working_dir = tmpdir.ensure_dir('working')
+    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG', {
+        '--archive-dir': None,
+        '--discovery-threads': '1',
+        '--encoder-profile': 'V0',
+        '--music-source': str(source_dir),
+        '--working-dir': str(working_dir),
+    })
+    for i in range(100):
+        source_sub, working_sub = str(source_dir.ensure_dir(str(i))), str(working_dir.ensure_dir(str(i)))
+        for j in range(250):
+            open('{}/{}.mp3'.format(source_sub, j), 'w').close()
+            open('{}/orphan{}.mp3'.format(working_sub, j), 'w').close()
+    monkeypatch.setattr(run, 'CHANGE_WAIT', 0)
+    monkeypatch.setattr(run, 'convert_songs', asyncio.coroutine(lambda *_: None))
+
+    # Scan.
+    loop = asyncio.get_event_loop()
+    (songs, delete_files, remove_dirs, _), lag = loop.run_until_complete(max_loop_lag(run.scan_wait()))
+    assert len(songs) == 25000
+    assert len(delete_files) == 25000
+    assert len(remove_dirs) == 100
+    assert lag < 0.2
+
+    # Delete.
+    lag = loop.run_until_complete(max_loop_lag(run.convert_cleanup([], delete_files, remove_dirs)))[1]
+    assert working_dir.listdir() == []
+    assert lag < 0.2
+
+
+def test_split_settled(tmpdir, caplog):
+    """Test split_settled() function.
+
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    """
+    source_dir = tmpdir.ensure_dir('source')
+    for name in ('done.mp3', 'growing.mp3', 'removed.mp3'):
+        source_dir.join(name).write('.')
+    songs = sorted(discover.get_songs(str(source_dir), str(tmpdir.ensure_dir('target')))[0], key=lambda s: s.source)
+    source_dir.join('growing.mp3').write('..')
+    source_dir.join('removed.mp3').remove()
+
+    settled, changing = run.split_settled(songs)
+    assert [s.source for s in settled] == [str(source_dir.join('done.mp3'))]
+    assert [s.source for s in changing] == [str(source_dir.join('growing.mp3'))]
+    assert changing[0].live_metadata['source_size'] == 2
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+    assert messages == [
+        'Size/mtime changed for {}'.format(source_dir.join('growing.mp3')),
+        'Source file removed while being written to: {}'.format(source_dir.join('removed.mp3')),
+    ]
+
+    # Next check.
+    assert run.split_settled(changing) == (changing, [])
+
+
+@pytest.mark.skipif(str(FFMPEG_DEFAULT_BINARY is None))
+def test_convert_cleanup_changing(monkeypatch, tmpdir, caplog):
+    """Test convert_cleanup() converting settled songs while another one is still being written to.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    """
+    monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', {
+        '--cpu-affinity': None,
+        '--ffmpeg-bin': FFMPEG_DEFAULT_BINARY,
+        '--full-speed-hours': None,
+        '--ionice': None,
+        '--nice': None,
+        '--reduced-threads': '1',
+        '--threads': '2',
+    })
+    monkeypatch.setattr(run, 'CHANGE_WAIT', 0.2)
+    source_dir = tmpdir.ensure_dir('source')
+    target_dir = tmpdir.ensure_dir('target')
+    data = HERE.join('1khz_sine_2.mp3').read_binary()
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.join('song1.mp3'))
+    source_dir.join('song2.mp3').write_binary(data[:1])
+    songs = sorted(discover.get_songs(str(source_dir), str(target_dir))[0], key=lambda s: s.source)
+
+    @asyncio.coroutine
+    def write_until_converted():
+        """Keep appending to song2.mp3 until song1.mp3 is converted, then write the rest of it."""
+        with source_dir.join('song2.mp3').open('ab') as handle:
+            for i in range(1, len(data)):
+                if any(r.message == 'Storing metadata in song1.mp3' for r in caplog.records):
+                    handle.write(data[i:])
+                    return
+                handle.write(data[i:i + 1])
+                handle.flush()
+                yield from asyncio.sleep(0.05)
+
+    # Run.
+    journal = Journal(str(source_dir), str(target_dir))
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(asyncio.wait([
+        write_until_converted(),
+        run.convert_cleanup(songs[:1], [], [], journal, songs[1:]),
+    ], timeout=30))
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+
+    # Verify.
+    assert target_dir.join('song1.mp3').check(file=True)
+    assert target_dir.join('song2.mp3').check(file=True)
+    assert messages.index('Storing metadata in song1.mp3') < messages.index('Adding 1 file(s) done being written to.')
+    assert messages.index('Adding 1 file(s) done being written to.') < messages.index('Storing metadata in song2.mp3')
+    assert 'Done converting 2 file(s) (0 failed).' in messages
+    assert not target_dir.join(JOURNAL_NAME).check()
+
+
 @pytest.mark.skipif(str(FFMPEG_DEFAULT_BINARY is None))
 @pytest.mark.parametrize('mode', ['nothing', 'normal', 'error'])
 def test_convert_cleanup(monkeypatch, tmpdir, caplog, mode):
@@ -94,7 +279,15 @@ def test_convert_cleanup(monkeypatch, tmpdir, caplog, mode):
     :param caplog: pytest extension fixture.
     :param str mode: Scenario to test for.
     """
-    monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', {'--ffmpeg-bin': FFMPEG_DEFAULT_BINARY, '--threads': '2'})
+    monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', {
+        '--cpu-affinity': None,
+        '--ffmpeg-bin': FFMPEG_DEFAULT_BINARY,
+        '--full-speed-hours': None,
+        '--ionice': None,
+        '--nice': None,
+        '--reduced-threads': '1',
+        '--threads': '2',
+    })
     loop = asyncio.get_event_loop()
 
     if mode == 'nothing':
@@ -138,7 +331,7 @@ def test_convert_cleanup(monkeypatch, tmpdir, caplog, mode):
 
 
 @pytest.mark.skipif(str(FFMPEG_DEFAULT_BINARY is None))
-@pytest.mark.parametrize('mode', ['nothing', 'something'])
+@pytest.mark.parametrize('mode', ['nothing', 'something', 'resume'])
 def test_run(monkeypatch, tmpdir, mode):
     """Test run() function.
 
@@ -148,8 +341,16 @@ def test_run(monkeypatch, tmpdir, mode):
     """
     source_file = tmpdir.ensure('source', 'song.mp3')
     config = {
+        '--archive-dir': None,
+        '--cpu-affinity': None,
+        '--discovery-threads': '1',
+        '--encoder-profile': 'V0',
         '--ffmpeg-bin': FFMPEG_DEFAULT_BINARY,
+        '--full-speed-hours': None,
+        '--ionice': None,
         '--music-source': source_file.dirname,
+        '--nice': None,
+        '--reduced-threads': '1',
         '--threads': '2',
         '--working-dir': str(tmpdir),
     }
@@ -160,16 +361,25 @@ def test_run(monkeypatch, tmpdir, mode):
     monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', config)
 
     if mode == 'nothing':
-        loop.run_until_complete(run.run())
+        assert loop.run_until_complete(run.run()) is True
         assert not semaphore.locked()
         assert not tmpdir.join('song.mp3').check()
         return
 
     HERE.join('1khz_sine_2.mp3').copy(source_file)
+    if mode == 'resume':  # Interrupted run planned song.mp3, song2.mp3 in a subdirectory was added since.
+        journal = Journal(source_file.dirname, str(tmpdir))
+        journal.plan(discover.get_songs(source_file.dirname, str(tmpdir))[0])
+        journal.close(remove=False)
+        HERE.join('1khz_sine_2.mp3').copy(source_file.dirpath().ensure('sub', 'song2.mp3'))
     assert not tmpdir.join('song.mp3').check()
-    loop.run_until_complete(run.run())
+    directories = {str(source_file.dirpath('sub'))} if mode == 'resume' else None
+    assert loop.run_until_complete(run.run(directories)) is True
     assert not semaphore.locked()
     assert tmpdir.join('song.mp3').check(file=True)
+    if mode == 'resume':
+        assert tmpdir.join('sub', 'song2.mp3').check(file=True)
+        assert not tmpdir.join(JOURNAL_NAME).check()
 
 
 @pytest.mark.usefixtures('shutdown_future')
@@ -199,8 +409,16 @@ def test_run_cancel(monkeypatch, tmpdir, caplog, signum):
         source_dir.ensure('song{}.mp3'.format(i))
 
     config = {
+        '--archive-dir': None,
+        '--cpu-affinity': None,
+        '--discovery-threads': '1',
+        '--encoder-profile': 'V0',
         '--ffmpeg-bin': str(ffmpeg),
+        '--full-speed-hours': None,
+        '--ionice': None,
         '--music-source': str(source_dir),
+        '--nice': None,
+        '--reduced-threads': '1',
         '--threads': '2',
         '--working-dir': str(tmpdir),
     }
@@ -220,3 +438,47 @@ def test_run_cancel(monkeypatch, tmpdir, caplog, signum):
     killed = [i for i in messages if re.match(r'Process \d+ exited {}'.format(signum), i)]
     skipped = [i for i in messages if i == 'Skipping due to shutdown signal.']
     assert len(killed) + len(skipped) == 10
+
+    # Verify journal kept for next startup.
+    pending = Journal(str(source_dir), str(tmpdir)).pending()
+    assert sorted(pending) == sorted(str(source_dir.join('song{}.mp3'.format(i))) for i in range(10))
+
+
+@pytest.mark.parametrize('mode', ['no journal', 'pending', 'all done', 'source gone'])
+def test_resume(tmpdir, caplog, mode):
+    """Test resume() function.
+
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    source_dir = tmpdir.ensure_dir('source')
+    target_dir = tmpdir.ensure_dir('target')
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.join('song1.mp3'))
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.join('song2.mp3'))
+    target_dir.join('song2.mp3').write('partial')  # Left behind by killed ffmpeg.
+    journal = Journal(str(source_dir), str(target_dir))
+    if mode != 'no journal':
+        songs = discover.get_songs(str(source_dir), str(target_dir))[0]
+        journal.plan(songs)
+        if mode == 'all done':
+            for song in songs:
+                journal.mark_done(song)
+        journal.close(remove=False)
+    if mode == 'source gone':
+        source_dir.join('song1.mp3').remove()
+        source_dir.join('song2.mp3').remove()
+
+    # Run.
+    songs = run.resume(journal)
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+
+    # Verify.
+    if mode != 'pending':
+        assert not songs
+        assert not tmpdir.join('target', '.fam_convert_journal').check()
+        return
+    assert sorted(s.name for s in songs) == ['song1.mp3', 'song2.mp3']
+    assert not target_dir.join('song2.mp3').check()
+    assert 'Removing stale partial file {}'.format(target_dir.join('song2.mp3')) in messages
+    assert 'Resuming interrupted run: 2 songs left to convert.' in messages
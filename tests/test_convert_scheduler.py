@@ -0,0 +1,144 @@
+"""Test functions in module."""
+
+import asyncio
+
+import pytest
+
+from flash_air_music.convert import scheduler
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Replace run() with a coroutine recording scopes and blocking until released.
+
+    :param monkeypatch: pytest fixture.
+
+    :return: Recorded scopes and event releasing the current run.
+    :rtype: tuple
+    """
+    scopes, release = list(), asyncio.Event()
+
+    @asyncio.coroutine
+    def run(directories=None):
+        """Fake run().
+
+        :param iter directories: Scope.
+
+        :return: Scanned.
+        :rtype: bool
+        """
+        scopes.append(directories)
+        yield from release.wait()
+        release.clear()
+        if directories == {'bad'}:
+            raise RuntimeError('bad')
+        return True
+
+    monkeypatch.setattr(scheduler, 'run', run)
+    return scopes, release
+
+
+@asyncio.coroutine
+def release_all(futures, release):
+    """Release runs one at a time until all futures are done.
+
+    :param iter futures: Futures from Scheduler.request().
+    :param asyncio.Event release: Event from runs fixture.
+    """
+    while not all(f.done() for f in futures):
+        yield from asyncio.sleep(0.01)
+        release.set()
+
+
+@pytest.mark.usefixtures('shutdown_future')
+@pytest.mark.parametrize('later,expected', [
+    ([{'b'}, {'c'}], {'b', 'c'}),
+    ([{'b'}, None, {'c'}], None),
+    ([None], None),
+])
+def test_coalesce(runs, later, expected):
+    """Test requests made during an active run merging into one follow-up run.
+
+    :param runs: runs fixture.
+    :param list later: Scopes requested while the first run is active.
+    :param expected: Expected scope of the follow-up run.
+    """
+    scopes, release = runs
+    instance = scheduler.Scheduler()
+    loop = asyncio.get_event_loop()
+
+    first = instance.request({'a'})
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert scopes == [{'a'}]
+    assert instance.active is not None
+    futures = [instance.request(s) for s in later]
+    assert all(f is futures[0] for f in futures)
+    assert futures[0] is not first
+
+    loop.run_until_complete(release_all([first] + futures, release))
+    assert scopes == [{'a'}, expected]
+    assert first.result() is True
+    assert futures[0].result() is True
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert instance.active is None
+    assert instance.pending is None
+
+
+@pytest.mark.usefixtures('shutdown_future')
+def test_idle(runs):
+    """Test requests made while idle starting a run right away, one after another.
+
+    :param runs: runs fixture.
+    """
+    scopes, release = runs
+    instance = scheduler.Scheduler()
+    loop = asyncio.get_event_loop()
+
+    for scope in ({'a'}, None):
+        future = instance.request(scope)
+        loop.run_until_complete(release_all([future], release))
+        loop.run_until_complete(asyncio.sleep(0.01))
+        assert instance.active is None
+    assert scopes == [{'a'}, None]
+
+
+@pytest.mark.usefixtures('shutdown_future')
+def test_exception(runs):
+    """Test run() raising an exception.
+
+    :param runs: runs fixture.
+    """
+    scopes, release = runs
+    instance = scheduler.Scheduler()
+    loop = asyncio.get_event_loop()
+
+    first = instance.request({'bad'})
+    loop.run_until_complete(asyncio.sleep(0.01))
+    second = instance.request()
+    loop.run_until_complete(release_all([first, second], release))
+    assert scopes == [{'bad'}, None]
+    with pytest.raises(RuntimeError):
+        first.result()
+    assert second.result() is True
+
+
+def test_shutdown(monkeypatch, runs, caplog):
+    """Test no more runs after shutdown.
+
+    :param monkeypatch: pytest fixture.
+    :param runs: runs fixture.
+    :param caplog: pytest extension fixture.
+    """
+    scopes = runs[0]
+    shutdown = asyncio.Future()
+    shutdown.set_result(15)
+    monkeypatch.setattr(scheduler, 'SHUTDOWN', shutdown)
+    instance = scheduler.Scheduler()
+    loop = asyncio.get_event_loop()
+
+    future = instance.request()
+    loop.run_until_complete(future)
+    assert future.result() is False
+    assert not scopes
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+    assert 'Service shutting down, skipping requested conversion run.' in messages
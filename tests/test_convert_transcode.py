@@ -4,13 +4,16 @@ import asyncio
 import itertools
 import re
 import signal
+import time
 from textwrap import dedent
 
 import pytest
 
 from flash_air_music.configuration import FFMPEG_DEFAULT_BINARY
+from flash_air_music import metrics
 from flash_air_music.convert import transcode
 from flash_air_music.convert.discover import get_songs, Song
+from flash_air_music.pipeline import Pipeline
 from tests import HERE
 
 
@@ -29,6 +32,8 @@ def test_convert_file_success(monkeypatch, tmpdir, caplog):
     HERE.join('1khz_sine_2.mp3').copy(source_dir.join('song1.mp3'))
     song = Song(str(source_dir.join('song1.mp3')), str(source_dir), str(target_dir))
     assert song.needs_action is True
+    succeeded = metrics.CONVERSIONS.values.get(('succeeded',), 0)
+    factors = metrics.FFMPEG_REALTIME_FACTOR.values.get((), (None, 0, 0))[2]
 
     # Run.
     loop = asyncio.get_event_loop()
@@ -37,6 +42,8 @@ def test_convert_file_success(monkeypatch, tmpdir, caplog):
 
     # Verify.
     assert exit_status == 0
+    assert metrics.CONVERSIONS.values[('succeeded',)] == succeeded + 1
+    assert metrics.FFMPEG_REALTIME_FACTOR.values[()][2] == factors + 1
     assert target_dir.join('song1.mp3').check(file=True)
     assert Song(str(source_dir.join('song1.mp3')), str(source_dir), str(target_dir)).needs_action is False
 
@@ -48,6 +55,62 @@ def test_convert_file_success(monkeypatch, tmpdir, caplog):
     assert any(re.match(r'^Process \d+ exited 0$', m) for m in messages)
 
 
+@pytest.mark.parametrize('stderr,expected', [
+    (b'Input #0, mp3, from \'song.mp3\':\n  Duration: 00:00:02.04, start: 0.025057, bitrate: 67 kb/s\n', 2.04),
+    (b'  Duration: 01:02:03.50, start: 0.000000, bitrate: 1411 kb/s\n', 3723.5),
+    (b'  Duration: N/A, bitrate: N/A\n', None),
+    (b'', None),
+])
+def test_parse_duration(stderr, expected):
+    """Test parse_duration() function.
+
+    :param bytes stderr: Test input.
+    :param float expected: Expected return value.
+    """
+    assert transcode.parse_duration(stderr) == expected
+
+
+@pytest.mark.skipif(str(FFMPEG_DEFAULT_BINARY is None))
+@pytest.mark.parametrize('archived', [False, True])
+def test_convert_file_extra_outputs(monkeypatch, tmpdir, caplog, archived):
+    """Test convert_file() encoding into two directories with one ffmpeg process.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param bool archived: Archive copy already up to date.
+    """
+    monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', {'--ffmpeg-bin': FFMPEG_DEFAULT_BINARY})
+    monkeypatch.setattr(transcode, 'SLEEP_FOR', 0.1)
+    source_dir = tmpdir.ensure_dir('source')
+    target_dir = tmpdir.ensure_dir('target')
+    archive_dir = tmpdir.join('archive')
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.ensure('sub', 'song1.mp3'))
+    extra_outputs = [('V0', str(archive_dir))]
+    if archived:
+        song = Song(str(source_dir.join('sub', 'song1.mp3')), str(source_dir), str(archive_dir), 'V0')
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(transcode.convert_file(song))
+        caplog.clear()
+    song = Song(str(source_dir.join('sub', 'song1.mp3')), str(source_dir), str(target_dir), 'V9', extra_outputs)
+
+    # Run.
+    loop = asyncio.get_event_loop()
+    command, exit_status = loop.run_until_complete(transcode.convert_file(song))[1:]
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+
+    # Verify.
+    assert exit_status == 0
+    assert command.count('-i') == 1
+    assert command[command.index(str(target_dir.join('sub', 'song1.mp3'))) - 5:][:2] == ['-qscale:a', '9']
+    assert (str(archive_dir.join('sub', 'song1.mp3')) in command) is not archived
+    assert target_dir.join('sub', 'song1.mp3').check(file=True)
+    assert archive_dir.join('sub', 'song1.mp3').check(file=True)
+    song = Song(str(source_dir.join('sub', 'song1.mp3')), str(source_dir), str(target_dir), 'V9', extra_outputs)
+    assert song.pending_outputs == []
+    assert messages.count('Storing metadata in song1.mp3') == (1 if archived else 2)
+
+
 @pytest.mark.skipif(str(FFMPEG_DEFAULT_BINARY is None))
 @pytest.mark.parametrize('delete', [False, True])
 def test_convert_file_failure(monkeypatch, tmpdir, caplog, delete):
@@ -214,7 +277,15 @@ def test_convert_songs_errors(monkeypatch, tmpdir, caplog, mode):
         ffmpeg $@
         """))
         ffmpeg.chmod(0o0755)
-    monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', {'--ffmpeg-bin': str(ffmpeg), '--threads': '2'})
+    monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', {
+        '--cpu-affinity': None,
+        '--ffmpeg-bin': str(ffmpeg),
+        '--full-speed-hours': None,
+        '--ionice': None,
+        '--nice': None,
+        '--reduced-threads': '1',
+        '--threads': '2',
+    })
     monkeypatch.setenv('ERROR_ON', 'song1.mp3' if mode == 'failure' else '')
     source_dir = tmpdir.ensure_dir('source')
     target_dir = tmpdir.ensure_dir('target')
@@ -249,14 +320,25 @@ def test_convert_songs_errors(monkeypatch, tmpdir, caplog, mode):
 
 
 @pytest.mark.skipif(str(FFMPEG_DEFAULT_BINARY is None))
-def test_convert_songs_single(monkeypatch, tmpdir, caplog):
+@pytest.mark.parametrize('full_speed', [True, False])
+def test_convert_songs_single(monkeypatch, tmpdir, caplog, full_speed):
     """Test convert_songs() with one file.
 
     :param monkeypatch: pytest fixture.
     :param tmpdir: pytest fixture.
     :param caplog: pytest extension fixture.
+    :param bool full_speed: Run inside or outside of --full-speed-hours.
     """
-    monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', {'--ffmpeg-bin': FFMPEG_DEFAULT_BINARY, '--threads': '2'})
+    hour = time.localtime().tm_hour
+    monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', {
+        '--cpu-affinity': None,
+        '--ffmpeg-bin': FFMPEG_DEFAULT_BINARY,
+        '--full-speed-hours': None if full_speed else '{}-{}'.format((hour + 1) % 24, hour),
+        '--ionice': None,
+        '--nice': None,
+        '--reduced-threads': '1',
+        '--threads': '2',
+    })
     source_dir = tmpdir.ensure_dir('source')
     target_dir = tmpdir.ensure_dir('target')
     HERE.join('1khz_sine_2.mp3').copy(source_dir.join('song1.mp3'))
@@ -270,8 +352,60 @@ def test_convert_songs_single(monkeypatch, tmpdir, caplog):
     # Verify.
     assert target_dir.join('song1.mp3').check(file=True)
     assert 'Storing metadata in song1.mp3' in messages
-    assert any(re.match(r'Beginning to convert 1 file\(s\) up to 2 at a time\.$', m) for m in messages)
+    assert any(re.match(r'Beginning to convert 1 file\(s\) up to {} at a time\.$'.format(2 if full_speed else 1), m)
+               for m in messages)
     assert any(re.match(r'Done converting 1 file\(s\) \(0 failed\)\.$', m) for m in messages)
+    assert ('Outside of full speed hours, using reduced worker count.' in messages) is not full_speed
+
+
+def test_workers(monkeypatch, caplog):
+    """Test Workers following --full-speed-hours while songs wait.
+
+    :param monkeypatch: pytest fixture.
+    :param caplog: pytest extension fixture.
+    """
+    window = [False]
+    monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', {
+        '--full-speed-hours': '0-1',
+        '--reduced-threads': '1',
+        '--threads': '3',
+    })
+    monkeypatch.setattr(transcode, 'in_window', lambda _: window[0])
+    workers = transcode.Workers()
+    loop = asyncio.get_event_loop()
+
+    # Reduced.
+    loop.run_until_complete(workers.acquire())
+    waiting = [loop.create_task(workers.acquire()) for _ in range(3)]
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert workers.active == 1
+    assert not any(t.done() for t in waiting)
+
+    # Window opens, next release lets two more songs in.
+    window[0] = True
+    loop.run_until_complete(workers.release())
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert workers.active == 3
+    assert sum(t.done() for t in waiting) == 3
+
+    # Window closes, running conversions continue and new ones wait.
+    window[0] = False
+    waiting = loop.create_task(workers.acquire())
+    loop.run_until_complete(workers.release())
+    loop.run_until_complete(workers.release())
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert workers.active == 1
+    assert not waiting.done()
+    loop.run_until_complete(workers.release())
+    loop.run_until_complete(asyncio.wait_for(waiting, 1))
+    assert workers.active == 1
+
+    messages = [r.message for r in caplog.records if r.name == transcode.__name__]
+    assert messages == [
+        'Outside of full speed hours, using reduced worker count.',
+        'Inside full speed hours, using full worker count.',
+        'Outside of full speed hours, using reduced worker count.',
+    ]
 
 
 @pytest.mark.skipif(str(FFMPEG_DEFAULT_BINARY is None))
@@ -290,7 +424,15 @@ def test_convert_songs_semaphore(monkeypatch, tmpdir, caplog):
     python3 -c "import time; print('$(basename $2) END_TIME:', time.time())"
     """))
     ffmpeg.chmod(0o0755)
-    monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', {'--ffmpeg-bin': str(ffmpeg), '--threads': '2'})
+    monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', {
+        '--cpu-affinity': None,
+        '--ffmpeg-bin': str(ffmpeg),
+        '--full-speed-hours': None,
+        '--ionice': None,
+        '--nice': None,
+        '--reduced-threads': '1',
+        '--threads': '2',
+    })
     source_dir = tmpdir.ensure_dir('source')
     target_dir = tmpdir.ensure_dir('target')
     HERE.join('1khz_sine_2.mp3').copy(source_dir.join('song1.mp3'))
@@ -323,3 +465,66 @@ def test_convert_songs_semaphore(monkeypatch, tmpdir, caplog):
         if intervals[b][0] < intervals[a][0] < intervals[b][1] or intervals[a][0] < intervals[b][0] < intervals[a][1]:
             overlaps += 1
     assert overlaps <= 3
+
+
+def test_convert_songs_paused(monkeypatch, tmpdir, caplog):
+    """Test pausing and resuming conversions.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    """
+    ffmpeg = tmpdir.join('ffmpeg')
+    ffmpeg.write(dedent("""\
+    #!/usr/bin/env python
+    import shutil, sys, time
+    time.sleep(0.5)
+    shutil.copy(sys.argv[2], sys.argv[-1])
+    """))
+    ffmpeg.chmod(0o0755)
+    monkeypatch.setattr(transcode, 'GLOBAL_MUTABLE_CONFIG', {
+        '--cpu-affinity': None,
+        '--ffmpeg-bin': str(ffmpeg),
+        '--full-speed-hours': None,
+        '--ionice': None,
+        '--nice': None,
+        '--reduced-threads': '1',
+        '--threads': '1',
+    })
+    monkeypatch.setattr(transcode, 'SLEEP_FOR', 0.1)
+    monkeypatch.setattr(transcode, 'TIMEOUT', 0.8)
+    state = Pipeline()
+    monkeypatch.setattr(transcode, 'PIPELINE', state)
+    source_dir = tmpdir.ensure_dir('source')
+    target_dir = tmpdir.ensure_dir('target')
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.join('song1.mp3'))
+    HERE.join('1khz_sine_2.mp3').copy(source_dir.join('song2.mp3'))
+    songs = get_songs(str(source_dir), str(target_dir))[0]
+
+    # Start and pause once the first ffmpeg process runs.
+    loop = asyncio.get_event_loop()
+    task = loop.create_task(transcode.convert_songs(songs))
+    for _ in range(50):
+        if state.conversions:
+            break
+        loop.run_until_complete(asyncio.sleep(0.02))
+    state.pause(['convert'])
+    pid = list(state.conversions)[0]
+    loop.run_until_complete(asyncio.sleep(1))
+
+    # Verify paused. Stopped process is not timed out and the second song waits.
+    with open('/proc/{}/stat'.format(pid)) as handle:
+        assert handle.read().split(') ')[-1][0] == 'T'
+    assert len(state.conversions) == 1
+    assert state.snapshot()['pending'] == 1
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+    assert not [m for m in messages if m.startswith('Timeout exceeded')]
+
+    # Resume.
+    state.resume(['convert'])
+    loop.run_until_complete(asyncio.wait_for(task, 10))
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+    assert not [m for m in messages if m.startswith('Timeout exceeded')]
+    assert any(re.match(r'Done converting 2 file\(s\) \(0 failed\)\.$', m) for m in messages)
+    assert state.conversions == dict()
+    assert target_dir.join('song2.mp3').check(file=True)
@@ -6,7 +6,10 @@ import signal
 import pytest
 
 from flash_air_music.__main__ import shutdown
-from flash_air_music.convert.triggers import periodically_convert, watch_directory
+from flash_air_music.convert.discover import source_signatures
+from flash_air_music.convert.journal import JOURNAL_NAME
+from flash_air_music.convert.triggers import periodically_convert, watch_directory, watch_state
+from flash_air_music.convert.watch_state import directory_mtimes, STATE_NAME
 
 
 @asyncio.coroutine
@@ -82,7 +85,15 @@ def test_periodically_convert(monkeypatch, tmpdir, caplog):
     :param caplog: pytest extension fixture.
     """
     config = {
+        '--archive-dir': None,
+        '--cpu-affinity': None,
+        '--discovery-threads': '1',
+        '--encoder-profile': 'V0',
+        '--full-speed-hours': None,
+        '--ionice': None,
         '--music-source': str(tmpdir.ensure_dir('source')),
+        '--nice': None,
+        '--reduced-threads': '1',
         '--threads': '2',
         '--working-dir': str(tmpdir),
     }
@@ -114,8 +125,19 @@ def test_watch_directory(monkeypatch, tmpdir, caplog):
     tmpdir.ensure('subdir', 'subdir2', 'song4.mp3').write('\x00\x00\x00')
 
     monkeypatch.setattr('flash_air_music.convert.triggers.EVERY_SECONDS_WATCH', 1)
-    monkeypatch.setattr('flash_air_music.convert.triggers.GLOBAL_MUTABLE_CONFIG', {'--music-source': str(tmpdir)})
-    monkeypatch.setattr('flash_air_music.convert.run.scan_wait', asyncio.coroutine(lambda: (None, None, None)))
+    config = {
+        '--archive-dir': None,
+        '--archive-profile': 'V0',
+        '--discovery-threads': '1',
+        '--encoder-profile': 'V0',
+        '--music-source': str(tmpdir),
+        '--working-dir': str(tmpdir.ensure_dir('working')),
+    }
+    monkeypatch.setattr('flash_air_music.convert.triggers.GLOBAL_MUTABLE_CONFIG', config)
+    monkeypatch.setattr('flash_air_music.convert.run.GLOBAL_MUTABLE_CONFIG', config)
+    scanned = list()
+    monkeypatch.setattr('flash_air_music.convert.run.scan_wait',
+                        asyncio.coroutine(lambda d: scanned.append(d) or (None, None, None, None)))
     loop = asyncio.get_event_loop()
 
     nested_results = loop.run_until_complete(asyncio.wait([
@@ -128,4 +150,80 @@ def test_watch_directory(monkeypatch, tmpdir, caplog):
         result.result()  # Will raise exception if there's a bug.
         assert not result.exception()
     assert messages.count('watch_directory() file system changed, calling run().') == 4
+    assert scanned == [
+        None,
+        {str(tmpdir)},
+        {str(tmpdir.join('subdir', 'subdir2', 'subdir3'))},
+        {str(tmpdir.join('subdir'))},
+    ]
     assert messages.count('watch_directory() no change in file system, not calling run().') >= 2
+    assert tmpdir.join('working', STATE_NAME).check(file=True)
+
+
+@pytest.mark.usefixtures('shutdown_future')
+@pytest.mark.parametrize('mode', ['unchanged', 'added', 'no state', 'journal', 'not scanned'])
+def test_watch_directory_warm_start(monkeypatch, tmpdir, caplog, mode):
+    """Test watch_directory() after a restart.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    source_dir = tmpdir.ensure_dir('source')
+    working_dir = tmpdir.ensure_dir('working')
+    source_dir.join('song1.mp3').write('\x00')
+    source_dir.ensure('subdir', 'song2.mp3').write('\x00\x00')
+    config = {
+        '--archive-dir': None,
+        '--archive-profile': 'V0',
+        '--discovery-threads': '1',
+        '--encoder-profile': 'V0',
+        '--music-source': str(source_dir),
+        '--working-dir': str(working_dir),
+    }
+    monkeypatch.setattr('flash_air_music.convert.triggers.EVERY_SECONDS_WATCH', 1)
+    monkeypatch.setattr('flash_air_music.convert.triggers.GLOBAL_MUTABLE_CONFIG', config)
+    monkeypatch.setattr('flash_air_music.convert.run.GLOBAL_MUTABLE_CONFIG', config)
+    scanned = list()
+    monkeypatch.setattr('flash_air_music.convert.run.scan_wait',
+                        asyncio.coroutine(lambda d: scanned.append(d) or (None, None, None, None)))
+    if mode == 'not scanned':  # E.g. run() resumed an interrupted run instead.
+        monkeypatch.setattr('flash_air_music.convert.scheduler.run', asyncio.coroutine(lambda _: False))
+
+    # State saved by the previous process.
+    if mode not in ('no state', 'not scanned'):
+        state = watch_state()
+        mtimes = directory_mtimes(str(source_dir))
+        state.save(source_signatures(str(source_dir)), mtimes)
+    if mode == 'added':
+        source_dir.join('subdir', 'song3.mp3').write('\x00\x00\x00')
+        source_dir.join('subdir').setmtime(source_dir.join('subdir').mtime() + 10)
+    elif mode == 'journal':
+        working_dir.join(JOURNAL_NAME).write('')
+
+    # Run.
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(asyncio.wait([
+        shutdown_after_string(loop, caplog, 'watch_directory() sleeping 1 seconds.'),
+        watch_directory(),
+    ], timeout=30))
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+
+    # Verify.
+    if mode == 'unchanged':
+        assert scanned == []
+        assert 'Loaded watch state, 0 of 2 source directories changed since the last run.' in messages
+        assert 'watch_directory() no change in file system, not calling run().' in messages
+    elif mode == 'added':
+        assert scanned == [{str(source_dir.join('subdir'))}]
+        assert 'Loaded watch state, 1 of 2 source directories changed since the last run.' in messages
+    elif mode == 'not scanned':
+        assert scanned == []
+        assert 'watch_directory() file system changed, calling run().' in messages
+        assert not working_dir.join(STATE_NAME).check()
+        return
+    else:
+        assert scanned == [None]
+        assert ('Interrupted conversion run found, not using watch state.' in messages) is (mode == 'journal')
+    assert working_dir.join(STATE_NAME).check(file=True)
@@ -0,0 +1,94 @@
+"""Test functions in module."""
+
+import pytest
+
+from flash_air_music.convert.watch_state import directory_mtimes, STATE_NAME, WatchState
+
+SETTINGS = {'--archive-dir': None, '--archive-profile': 'V0', '--encoder-profile': 'V0'}
+
+
+def test_directory_mtimes(tmpdir):
+    """Test directory_mtimes() function.
+
+    :param tmpdir: pytest fixture.
+    """
+    tmpdir.ensure('a', 'b', 'song.mp3')
+    tmpdir.ensure('c', 'song.mp3')
+    actual = directory_mtimes(str(tmpdir))
+    assert sorted(actual) == sorted(str(p) for p in (tmpdir, tmpdir.join('a'), tmpdir.join('a', 'b'), tmpdir.join('c')))
+    assert actual[str(tmpdir.join('c'))] == tmpdir.join('c').stat().mtime_ns
+
+
+@pytest.mark.parametrize('mode', ['good', 'missing', 'corrupted', 'bad value', 'source_dir', 'settings'])
+def test_load_save(tmpdir, caplog, mode):
+    """Test WatchState.load() and WatchState.save().
+
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param str mode: Scenario to test for.
+    """
+    signatures, mtimes = {'/source/a': 2 ** 64 - 1}, {'/source': 1, '/source/a': 2}
+    WatchState('/source', str(tmpdir), SETTINGS).save(signatures, mtimes)
+    assert not tmpdir.join(STATE_NAME + '.tmp').check()
+
+    source_dir, settings = '/source', dict(SETTINGS)
+    if mode == 'missing':
+        tmpdir.join(STATE_NAME).remove()
+    elif mode == 'corrupted':
+        tmpdir.join(STATE_NAME).write('{"source_dir": "/sou')
+    elif mode == 'bad value':
+        tmpdir.join(STATE_NAME).write(tmpdir.join(STATE_NAME).read().replace('18446744073709551615', '"x"'))
+    elif mode == 'source_dir':
+        source_dir = '/other'
+    elif mode == 'settings':
+        settings['--encoder-profile'] = 'V2'
+
+    actual = WatchState(source_dir, str(tmpdir), settings).load()
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+    if mode == 'good':
+        assert actual == (signatures, mtimes)
+    else:
+        assert actual is None
+    if mode in ('corrupted', 'bad value'):
+        assert messages == ['Ignoring corrupted watch state {}'.format(tmpdir.join(STATE_NAME))]
+    elif mode in ('source_dir', 'settings'):
+        assert messages == ['Ignoring watch state from different source directory or settings.']
+    else:
+        assert not messages
+
+
+def test_save_error(tmpdir, caplog):
+    """Test WatchState.save() with a missing target directory.
+
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    """
+    WatchState('/source', str(tmpdir.join('dne')), SETTINGS).save(dict(), dict())
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+    assert messages == ['Unable to write watch state {}'.format(tmpdir.join('dne', STATE_NAME))]
+
+
+def test_warm_start(tmpdir):
+    """Test WatchState.warm_start() only signing changed directories.
+
+    :param tmpdir: pytest fixture.
+    """
+    source_dir = tmpdir.ensure_dir('source')
+    source_dir.ensure('a', 'song.mp3').write('\x00')
+    source_dir.ensure('b', 'song.mp3').write('\x00')
+    state = WatchState(str(source_dir), str(tmpdir), SETTINGS)
+    state.save({str(source_dir.join('a')): 1, str(source_dir.join('b')): 2}, directory_mtimes(str(source_dir)))
+
+    # Signatures are trusted for unchanged directories.
+    assert state.warm_start(directory_mtimes(str(source_dir)))[1] == {
+        str(source_dir.join('a')): 1,
+        str(source_dir.join('b')): 2,
+    }
+
+    # Changed directories are signed again. Removed ones are dropped.
+    source_dir.join('a').setmtime(source_dir.join('a').mtime() + 10)
+    source_dir.join('b').remove()
+    saved, current = state.warm_start(directory_mtimes(str(source_dir)))
+    assert saved == {str(source_dir.join('a')): 1, str(source_dir.join('b')): 2}
+    assert list(current) == [str(source_dir.join('a'))]
+    assert current[str(source_dir.join('a'))] not in (1, 2)
@@ -0,0 +1,210 @@
+"""Test functions in module."""
+
+import asyncio
+import os
+import socket
+import stat
+
+import pytest
+
+from flash_air_music import lib
+from flash_air_music.convert import scheduler
+from flash_air_music.convert import triggers as convert_triggers
+from flash_air_music.upload import triggers as upload_triggers
+
+
+@pytest.mark.parametrize('mode', ['new', 'stale', 'listening', 'file'])
+def test_bind_unix_socket(tmpdir, mode):
+    """Test bind_unix_socket().
+
+    :param tmpdir: pytest fixture.
+    :param str mode: Scenario to test for.
+    """
+    path = str(tmpdir.join('test.sock'))
+    other = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if mode == 'stale':
+        other.bind(path)
+        other.close()
+    elif mode == 'listening':
+        other.bind(path)
+        other.listen(1)
+    elif mode == 'file':
+        tmpdir.join('test.sock').write('')
+
+    umask = os.umask(0o022)
+
+    # Run.
+    try:
+        if mode in ('listening', 'file'):
+            with pytest.raises(OSError):
+                lib.bind_unix_socket(path, 0o177)
+            assert os.path.exists(path)
+            return
+        sock = lib.bind_unix_socket(path, 0o177)
+    finally:
+        other.close()
+        assert os.umask(umask) == 0o022  # Restored.
+
+    # Verify.
+    sock.close()
+    assert stat.S_ISSOCK(os.stat(path).st_mode)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+@pytest.mark.parametrize('use_scandir', [True, False])
+def test_walk_files(monkeypatch, tmpdir, use_scandir):
+    """Test walk_files() with and without os.scandir().
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param bool use_scandir: Use os.scandir() or fall back to os.walk().
+    """
+    if not use_scandir:
+        monkeypatch.setattr(lib, 'scandir', None)
+    elif lib.scandir is None:
+        return pytest.skip('os.scandir() not available.')
+    tmpdir.ensure('a.mp3').write('aa')
+    tmpdir.ensure('b.FLAC')
+    tmpdir.ensure('c.txt')
+    tmpdir.ensure('sub', 'd.mp3')
+    tmpdir.ensure('sub', 'e.flac')
+    tmpdir.ensure('sub', 'deeper', 'f.mp3')
+    tmpdir.ensure_dir('empty')
+    tmpdir.ensure_dir('dir.mp3')
+    tmpdir.join('link').mksymlinkto(tmpdir.join('sub'))  # Not followed.
+    tmpdir.join('broken.mp3').mksymlinkto(tmpdir.join('dne'))  # Skipped.
+
+    # Run.
+    actual = list(lib.walk_files(str(tmpdir), ('.flac', '.mp3')))
+
+    # Verify.
+    paths = [p for p, _ in actual]
+    expected = ['a.mp3', 'b.FLAC', 'sub/d.mp3', 'sub/deeper/f.mp3', 'sub/e.flac']
+    assert sorted(os.path.relpath(p, str(tmpdir)) for p in paths) == expected
+    assert dict(actual)[str(tmpdir.join('a.mp3'))].st_size == 2
+
+    # Each directory's files are yielded together.
+    directories = [os.path.dirname(p) for p in paths]
+    assert directories == sorted(directories, key=directories.index)
+
+
+def test_walk_files_dne(tmpdir):
+    """Test walk_files() on missing directory.
+
+    :param tmpdir: pytest fixture.
+    """
+    assert list(lib.walk_files(str(tmpdir.join('dne')), ('.mp3',))) == []
+
+
+@pytest.mark.parametrize('use_scandir', [True, False])
+def test_walk_files_not_recursive(monkeypatch, tmpdir, use_scandir):
+    """Test walk_files() with recursive=False.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param bool use_scandir: Use os.scandir() or fall back to os.walk().
+    """
+    if not use_scandir:
+        monkeypatch.setattr(lib, 'scandir', None)
+    elif lib.scandir is None:
+        return pytest.skip('os.scandir() not available.')
+    tmpdir.ensure('a.mp3')
+    tmpdir.ensure('sub', 'b.mp3')
+
+    actual = [p for p, _ in lib.walk_files(str(tmpdir), ('.mp3',), recursive=False)]
+    assert actual == [str(tmpdir.join('a.mp3'))]
+
+
+@pytest.mark.parametrize('use_scandir', [True, False])
+def test_walk_files_directories(monkeypatch, tmpdir, use_scandir):
+    """Test walk_files() with directories=True.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param bool use_scandir: Use os.scandir() or fall back to os.walk().
+    """
+    if not use_scandir:
+        monkeypatch.setattr(lib, 'scandir', None)
+    elif lib.scandir is None:
+        return pytest.skip('os.scandir() not available.')
+    tmpdir.ensure('a.mp3')
+    tmpdir.ensure('sub', 'b.mp3')
+    tmpdir.ensure_dir('empty')
+
+    actual = list(lib.walk_files(str(tmpdir), ('.mp3',), directories=True))
+    paths = [os.path.relpath(p, str(tmpdir)) for p, _ in actual]
+    assert sorted(paths) == ['.', 'a.mp3', 'empty', 'sub', 'sub/b.mp3']
+    assert paths.index('sub') < paths.index('sub/b.mp3')
+    assert dict(actual)[str(tmpdir.join('sub'))].st_mtime_ns == tmpdir.join('sub').stat().mtime_ns
+
+    # Directories only.
+    actual = [os.path.relpath(p, str(tmpdir)) for p, _ in lib.walk_files(str(tmpdir), (), directories=True)]
+    assert sorted(actual) == ['.', 'empty', 'sub']
+
+
+@pytest.mark.parametrize('shutdown', [False, True])
+def test_wait_for_shutdown(shutdown_future, shutdown):
+    """Test wait_for_shutdown().
+
+    :param shutdown_future: conftest fixture.
+    :param bool shutdown: Initiate shutdown while waiting.
+    """
+    loop = asyncio.get_event_loop()
+    if shutdown:
+        loop.call_later(0.1, shutdown_future.set_result, True)
+    start_time = loop.time()
+    assert loop.run_until_complete(lib.wait_for_shutdown(0.5 if shutdown else 0.2)) is shutdown
+    assert loop.time() - start_time < 0.4
+
+
+def test_idle_wake_ups(monkeypatch, shutdown_future):
+    """Count event loop iterations while all triggers are idle. Should be no more than with nothing running.
+
+    :param monkeypatch: pytest fixture.
+    :param shutdown_future: conftest fixture.
+    """
+    loop = asyncio.get_event_loop()
+    monkeypatch.setattr(convert_triggers, 'GLOBAL_MUTABLE_CONFIG', {
+        '--archive-dir': None,
+        '--archive-profile': 'V0',
+        '--encoder-profile': 'V0',
+        '--music-source': '/dne',
+        '--working-dir': '/dne',
+    })
+    monkeypatch.setattr(convert_triggers, 'SCHEDULER', scheduler.Scheduler())
+    monkeypatch.setattr(scheduler, 'run', asyncio.coroutine(lambda *_: None))
+    monkeypatch.setattr(convert_triggers, 'source_signatures', lambda _: dict())
+    monkeypatch.setattr(upload_triggers, 'GLOBAL_MUTABLE_CONFIG', {'--ip-addr': None, '--sync-hours': None})
+
+    # Count event loop iterations.
+    iterations = list()
+    original = loop._run_once
+
+    def run_once():
+        """Count and run one event loop iteration."""
+        iterations.append(True)
+        original()
+    monkeypatch.setattr(loop, '_run_once', run_once)
+
+    # Baseline without triggers.
+    loop.run_until_complete(asyncio.sleep(1.5))
+    baseline = len(iterations)
+
+    # Start triggers and let every one of them reach its first sleep.
+    tasks = [
+        loop.create_task(convert_triggers.periodically_convert()),
+        loop.create_task(convert_triggers.watch_directory()),
+        loop.create_task(upload_triggers.watch_for_flashair()),
+    ]
+    loop.run_until_complete(asyncio.sleep(0.1))
+
+    # Idle.
+    del iterations[:]
+    loop.run_until_complete(asyncio.sleep(1.5))
+    idle = len(iterations)
+
+    # Shut down.
+    shutdown_future.set_result(True)
+    loop.run_until_complete(asyncio.wait(tasks, timeout=1))
+    assert all(t.done() for t in tasks)
+    assert idle == baseline
@@ -95,6 +95,156 @@ def test_sighup(tmpdir):
     assert 'BUG!' not in stdout
 
 
+@pytest.mark.skipif(str(FFMPEG_DEFAULT_BINARY is None))
+def test_sigusr2(tmpdir):
+    """Test scanning for songs right away.
+
+    :param tmpdir: pytest fixture.
+    """
+    config_file = tmpdir.join('config.ini')
+    config_file.write(dedent("""\
+    [FlashAirMusic]
+    music-source = {}
+    verbose = true
+    working-dir = {}
+    """).format(tmpdir.ensure_dir('source'), tmpdir.ensure_dir('working')))
+    command = [find_executable('FlashAirMusic'), 'run', '--config', str(config_file)]
+
+    # Run.
+    stdout_file = tmpdir.join('stdout.log')
+    process = subprocess.Popen(command, stderr=subprocess.STDOUT, stdout=stdout_file.open('w'))
+    for _ in range(100):
+        if 'watch_directory() sleeping' in stdout_file.read() or process.poll() is not None:
+            break
+        time.sleep(0.1)
+
+    # Sync now.
+    if process.poll() is None:
+        process.send_signal(signal.SIGUSR2)
+        for _ in range(100):
+            if stdout_file.read().count('Released lock.') > 1 or process.poll() is not None:
+                break
+            time.sleep(0.1)
+
+    # Stop.
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+    # Verify.
+    stdout = stdout_file.read()
+    print(stdout, file=sys.stderr)
+    assert re.search(r'Caught signal \d+ \([\w/_]+\)\. Scanning for songs now\.', stdout)
+    assert stdout.count('Scanning for new/changed songs...') == 2
+    assert 'Traceback' not in stdout
+    assert 'ERROR' not in stdout
+    assert 'BUG!' not in stdout
+
+
+def test_sigusr1(tmpdir):
+    """Test profiling on demand.
+
+    :param tmpdir: pytest fixture.
+    """
+    config_file = tmpdir.join('config.ini')
+    config_file.write(dedent("""\
+    [FlashAirMusic]
+    music-source = {}
+    verbose = true
+    working-dir = {}
+    """).format(tmpdir.ensure_dir('source'), tmpdir.ensure_dir('working')))
+    command = [find_executable('FlashAirMusic'), 'run', '--config', str(config_file)]
+
+    # Run.
+    stdout_file = tmpdir.join('stdout.log')
+    process = subprocess.Popen(command, stderr=subprocess.STDOUT, stdout=stdout_file.open('w'))
+    for _ in range(100):
+        if 'watch_directory() sleeping' in stdout_file.read() or process.poll() is not None:
+            break
+        time.sleep(0.1)
+
+    # Start and stop profiling.
+    for expected in ('Started profiling.', 'Stopped profiling, wrote'):
+        if process.poll() is None:
+            process.send_signal(signal.SIGUSR1)
+            for _ in range(100):
+                if expected in stdout_file.read() or process.poll() is not None:
+                    break
+                time.sleep(0.1)
+
+    # Stop.
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+    # Verify.
+    stdout = stdout_file.read()
+    print(stdout, file=sys.stderr)
+    assert re.search(r'Caught signal \d+ \([\w/_]+\)\. Starting profiling\.', stdout)
+    assert re.search(r'Caught signal \d+ \([\w/_]+\)\. Stopping profiling\.', stdout)
+    extensions = sorted(p.basename.split('.', 1)[1] for p in tmpdir.join('working', 'profiles').listdir())
+    assert extensions == ['pstats', 'samples.txt', 'tracemalloc.txt']
+    assert 'Traceback' not in stdout
+    assert 'ERROR' not in stdout
+    assert 'BUG!' not in stdout
+
+
+def test_control_commands(tmpdir):
+    """Test status, pause, resume, and sync-now subcommands talking to the running service.
+
+    :param tmpdir: pytest fixture.
+    """
+    config_file = tmpdir.join('config.ini')
+    config_file.write(dedent("""\
+    [FlashAirMusic]
+    music-source = {}
+    working-dir = {}
+    """).format(tmpdir.ensure_dir('source'), tmpdir.ensure_dir('working')))
+    command = [find_executable('FlashAirMusic'), '--config', str(config_file)]
+
+    # Not running. Commands don't touch --log.
+    with pytest.raises(subprocess.CalledProcessError) as exc:
+        subprocess.check_output(command + ['status', '--log', str(tmpdir.join('dne', 'fam.log'))],
+                                stderr=subprocess.STDOUT, timeout=30)
+    assert 'Unable to reach the service on {}'.format(tmpdir.join('working', '.fam_control.sock')) in \
+        exc.value.output.decode('utf-8')
+
+    # Run.
+    stdout_file = tmpdir.join('stdout.log')
+    process = subprocess.Popen(command + ['run', '--verbose'], stderr=subprocess.STDOUT, stdout=stdout_file.open('w'))
+    for _ in range(100):
+        if 'Listening for control requests on' in stdout_file.read() or process.poll() is not None:
+            break
+        time.sleep(0.1)
+
+    # Send commands.
+    outputs = list()
+    try:
+        for subcommand in (['pause', 'upload'], ['status'], ['resume'], ['sync-now'], ['status']):
+            outputs.append(subprocess.check_output(command + subcommand, timeout=30).decode('utf-8'))
+    finally:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+    # Verify.
+    stdout = stdout_file.read()
+    print(stdout, file=sys.stderr)
+    assert outputs[0].endswith('\nPaused upload.\n')
+    assert '\nPaused: upload\nConverting 0 song(s), 0 waiting.\nNot uploading.\n' in outputs[1]
+    assert outputs[2].endswith('\nResumed convert, upload.\n')
+    assert outputs[3].endswith('\nSync requested.\n')
+    assert '\nPaused: nothing\n' in outputs[4]
+    assert 'Pausing upload.' in stdout
+    assert 'Resuming upload.' in stdout
+    assert 'Traceback' not in stdout
+    assert 'ERROR' not in stdout
+    assert 'BUG!' not in stdout
+
+
 @pytest.mark.skipif(str(FFMPEG_DEFAULT_BINARY is None))
 def test_empty(tmpdir):
     """Test with no music to convert.
@@ -105,6 +255,7 @@ def test_empty(tmpdir):
     config_file.write(dedent("""\
     [FlashAirMusic]
     music-source = {}
+    stall-threshold = 0.5
     verbose = true
     working-dir = {}
     """).format(tmpdir.ensure_dir('source'), tmpdir.ensure_dir('working')))
@@ -133,6 +284,8 @@ def test_empty(tmpdir):
     assert 'Found: 0 new source songs, 0 orphaned target songs, 0 empty directories.' in stdout
     assert 'watch_directory() saw shutdown signal.' in stdout
     assert 'Stopping loop.' in stdout
+    assert 'Watching for event loop stalls longer than 0.50 seconds.' in stdout
+    assert 'Watchdog stopped.' in stdout
     assert 'Main loop has exited.' in stdout
     assert 'Task was destroyed but it is pending!' not in stdout
     assert 'Traceback' not in stdout
@@ -0,0 +1,169 @@
+"""Test functions in module."""
+
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from flash_air_music import metrics
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('9099', ('127.0.0.1', 9099)),
+    ('0.0.0.0:9099', ('0.0.0.0', 9099)),
+    ('[::1]:9099', ('::1', 9099)),
+    ('/run/fam.sock', ('/run/fam.sock', None)),
+    ('0', None),
+    ('65536', None),
+    ('host:', None),
+    ('fam.sock', None),
+])
+def test_parse_address(value, expected):
+    """Test parse_address() function.
+
+    :param str value: Test input.
+    :param tuple expected: Expected return value, None if ValueError is expected.
+    """
+    if expected is None:
+        with pytest.raises(ValueError):
+            metrics.parse_address(value)
+    else:
+        assert metrics.parse_address(value) == expected
+
+
+def test_render(monkeypatch):
+    """Test render() with every metric type.
+
+    :param monkeypatch: pytest fixture.
+    """
+    monkeypatch.setattr(metrics, 'REGISTRY', list())
+    counter = metrics.Counter('test_total', 'Test counter.', ['result'])
+    gauge = metrics.Gauge('test_depth', 'Test gauge.')
+    histogram = metrics.Histogram('test_seconds', 'Test histogram.', buckets=(1, 0.5))
+    metrics.Counter('test_idle_total', 'Never incremented.')
+
+    counter.inc(result='ok')
+    counter.inc(2, result='ok')
+    counter.inc(result='a"b\\c\nd')
+    gauge.inc()
+    gauge.inc(-3)
+    gauge.set(5)
+    for value in (0.25, 0.75, 2):
+        histogram.observe(value)
+    with pytest.raises(KeyError):
+        counter.inc()
+
+    expected = [
+        '# HELP test_total Test counter.',
+        '# TYPE test_total counter',
+        'test_total{result="a\\"b\\\\c\\nd"} 1',
+        'test_total{result="ok"} 3',
+        '# HELP test_depth Test gauge.',
+        '# TYPE test_depth gauge',
+        'test_depth 5',
+        '# HELP test_seconds Test histogram.',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{le="0.5"} 1',
+        'test_seconds_bucket{le="1"} 2',
+        'test_seconds_bucket{le="+Inf"} 3',
+        'test_seconds_sum 3.0',
+        'test_seconds_count 3',
+        '# HELP test_idle_total Never incremented.',
+        '# TYPE test_idle_total counter',
+        'test_idle_total 0',
+    ]
+    assert metrics.render() == '\n'.join(expected) + '\n'
+
+
+@asyncio.coroutine
+def request(path, method=b'GET', target=b'/metrics'):
+    """Send one HTTP request to a UNIX socket.
+
+    :param str path: Socket path.
+    :param bytes method: HTTP method.
+    :param bytes target: Request target.
+
+    :return: Response.
+    :rtype: bytes
+    """
+    reader, writer = yield from asyncio.open_unix_connection(path)
+    writer.write(method + b' ' + target + b' HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    response = yield from reader.read()
+    writer.close()
+    return response
+
+
+def test_threads(monkeypatch):
+    """Test updating metrics from several threads at once while rendering them.
+
+    :param monkeypatch: pytest fixture.
+    """
+    monkeypatch.setattr(metrics, 'REGISTRY', list())
+    counter = metrics.Counter('test_total', 'Test counter.')
+    histogram = metrics.Histogram('test_seconds', 'Test histogram.', buckets=(1,))
+
+    def update():
+        """Update both metrics many times."""
+        for _ in range(10000):
+            counter.inc()
+            histogram.observe(0.5)
+
+    threads = [threading.Thread(target=update) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while any(t.is_alive() for t in threads):
+        assert counter.render()[-1].startswith('test_total ')
+    for thread in threads:
+        thread.join()
+
+    assert counter.values[()] == 40000
+    assert histogram.values[()] == ((40000,), 20000.0, 40000)
+
+
+def test_serve(monkeypatch, tmpdir, caplog, shutdown_future):
+    """Test serve() on a UNIX socket.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param shutdown_future: conftest fixture.
+    """
+    monkeypatch.setattr(metrics, 'REGISTRY', list())
+    metrics.Counter('test_total', 'Test counter.').inc(7)
+    path = str(tmpdir.join('metrics.sock'))
+    socket.socket(socket.AF_UNIX).bind(path)  # Stale socket left behind by a killed process.
+    loop = asyncio.get_event_loop()
+    task = loop.create_task(metrics.serve(path))
+    for _ in range(100):
+        if caplog.records and caplog.records[-1].message.startswith('Serving metrics'):
+            break
+        loop.run_until_complete(asyncio.sleep(0.01))
+
+    # Metrics.
+    response = loop.run_until_complete(request(path))
+    head, body = response.split(b'\r\n\r\n', 1)
+    assert head.startswith(b'HTTP/1.0 200 OK\r\n')
+    assert b'Content-Type: text/plain; version=0.0.4; charset=utf-8' in head
+    assert body == b'# HELP test_total Test counter.\n# TYPE test_total counter\ntest_total 7\n'
+
+    # Errors.
+    assert loop.run_until_complete(request(path, target=b'/other')).startswith(b'HTTP/1.0 404 Not Found\r\n')
+    assert loop.run_until_complete(request(path, method=b'POST')).startswith(b'HTTP/1.0 405 Method Not Allowed\r\n')
+
+    # Shut down.
+    shutdown_future.set_result(15)
+    loop.run_until_complete(asyncio.wait_for(task, 5))
+    assert not tmpdir.join('metrics.sock').check()
+
+
+def test_serve_error(tmpdir, caplog):
+    """Test serve() when unable to listen.
+
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    """
+    path = str(tmpdir.join('dne', 'metrics.sock'))
+    asyncio.get_event_loop().run_until_complete(metrics.serve(path))
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+    assert messages[-1].startswith('Unable to serve metrics on {}: '.format(path))
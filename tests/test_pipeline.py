@@ -0,0 +1,140 @@
+"""Test flash_air_music.pipeline functions/classes."""
+
+import asyncio
+import io
+import signal
+
+import pytest
+
+from flash_air_music import metrics, pipeline
+from flash_air_music.upload.telemetry import CountingReader
+
+
+class FakeTransport(object):
+    """Record signals sent to a process."""
+
+    def __init__(self, exited=False):
+        """Constructor.
+
+        :param bool exited: Raise ProcessLookupError like an exited process.
+        """
+        self.exited = exited
+        self.signals = list()
+
+    def send_signal(self, signum):
+        """Record signal.
+
+        :param int signum: Signal number.
+        """
+        if self.exited:
+            raise ProcessLookupError
+        self.signals.append(signum)
+
+
+def test_pause_resume_conversions(caplog):
+    """Test stopping and continuing ffmpeg processes.
+
+    :param caplog: pytest extension fixture.
+    """
+    state = pipeline.Pipeline()
+    first, exited = FakeTransport(), FakeTransport(exited=True)
+    state.conversion_started(100, 'song1.flac', first)
+    state.conversion_started(101, 'song2.flac', exited)
+
+    state.pause(['convert'])
+    state.pause(['convert'])  # Already paused.
+    assert state.is_paused('convert')
+    assert not state.is_paused('upload')
+    assert first.signals == [signal.SIGSTOP]
+
+    # Started while paused.
+    late = FakeTransport()
+    state.conversion_started(102, 'song3.flac', late)
+    assert late.signals == [signal.SIGSTOP]
+
+    state.conversion_finished(101)
+    state.resume(['convert', 'upload'])
+    assert not state.is_paused('convert')
+    assert first.signals == [signal.SIGSTOP, signal.SIGCONT]
+    assert late.signals == [signal.SIGSTOP, signal.SIGCONT]
+
+    messages = [r.message for r in caplog.records if r.name == pipeline.__name__]
+    assert messages == ['Pausing convert.', 'Process 101 already exited.', 'Resuming convert.']
+
+
+@pytest.mark.parametrize('mode', ['resume', 'shutdown'])
+def test_wait_resumed(shutdown_future, mode):
+    """Test wait_resumed().
+
+    :param shutdown_future: conftest fixture.
+    :param str mode: Scenario to test for.
+    """
+    state = pipeline.Pipeline()
+    loop = asyncio.get_event_loop()
+
+    # Not paused.
+    loop.run_until_complete(asyncio.wait_for(state.wait_resumed('convert'), 1))
+
+    # Paused.
+    state.pause(['convert'])
+    task = loop.create_task(state.wait_resumed('convert'))
+    loop.run_until_complete(asyncio.sleep(0.1))
+    assert not task.done()
+    if mode == 'resume':
+        state.resume(['convert'])
+    else:
+        shutdown_future.set_result(signal.SIGTERM)
+    loop.run_until_complete(asyncio.wait_for(task, 1))
+    assert state.is_paused('convert') is (mode == 'shutdown')
+
+
+def test_wake_upload():
+    """Test waking up watch_for_flashair() by resuming uploads or requesting a sync."""
+    state = pipeline.Pipeline()
+    state.wake_upload()  # Nobody sleeping yet.
+
+    wakeup = state.upload_wakeup()
+    state.pause(['upload'])
+    assert not wakeup.done()
+    state.resume(['upload'])
+    assert wakeup.done()
+
+    wakeup = state.upload_wakeup()
+    state.wake_upload()
+    assert wakeup.done()
+
+
+def test_snapshot(monkeypatch):
+    """Test snapshot().
+
+    :param monkeypatch: pytest fixture.
+    """
+    monkeypatch.setattr(metrics.SCAN_SECONDS, 'values', dict())
+    monkeypatch.setattr(pipeline.CONVERSION_QUEUE, 'values', {(): 3})
+    state = pipeline.Pipeline()
+    state.conversion_started(100, 'song1.flac', FakeTransport())
+    state.scanned('convert_discover', 0.25)
+    state.pause(['upload'])
+
+    # Upload in progress.
+    state.upload_started('/tmp/song.mp3', 3000)
+    state.upload_sent(1000)  # Part already on the card.
+    reader = CountingReader(io.BytesIO(b'x' * 2000))
+    state.upload_sending(reader)
+    reader.read(500)
+
+    snapshot = state.snapshot()
+    assert [(c['pid'], c['song']) for c in snapshot['conversions']] == [(100, 'song1.flac')]
+    assert 0 <= snapshot['conversions'][0]['elapsed'] < 5
+    assert snapshot['paused'] == ['upload']
+    assert snapshot['pending'] == 3
+    assert snapshot['scans'] == dict(convert_discover=0.25)
+    assert snapshot['upload'] == dict(source='/tmp/song.mp3', size=3000, sent=1500)
+    assert metrics.SCAN_SECONDS.values[('convert_discover',)][-1] == 1
+
+    # Request finished, then file.
+    reader.read()
+    state.upload_sent(reader.count)
+    assert state.snapshot()['upload']['sent'] == 3000
+    state.upload_finished()
+    assert state.snapshot()['upload'] is None
@@ -0,0 +1,106 @@
+"""Test flash_air_music.profiler functions/classes."""
+
+import asyncio
+import pstats
+import threading
+import time
+
+from flash_air_music import profiler
+
+
+def busy_thread(stop):
+    """Keep a thread busy until stopped.
+
+    :param threading.Event stop: Stop when set.
+    """
+    while not stop.wait(0.001):
+        sum(range(1000))
+
+
+@asyncio.coroutine
+def allocate(keep):
+    """Allocate memory on the event loop.
+
+    :param list keep: Keep allocated objects alive in this list.
+    """
+    for _ in range(20):
+        keep.append(bytearray(100 * 1024))
+        yield from asyncio.sleep(0.01)
+
+
+def test_collapsed():
+    """Test Sampler.collapsed()."""
+    sampler = profiler.Sampler(0)
+    sampler.counts = {
+        ('MainThread', ('a:main', 'b:run')): 2,
+        ('worker', ('a:work',)): 5,
+        ('MainThread', ('a:main',)): 2,
+    }
+    assert sampler.collapsed() == ['worker;a:work 5', 'MainThread;a:main 2', 'MainThread;a:main;b:run 2']
+
+
+def test_profile(tmpdir, caplog):
+    """Test a profiling session from start to stop.
+
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    """
+    state, keep, stop = profiler.Profiler(), list(), threading.Event()
+    directory = tmpdir.join('working', 'profiles')
+    thread = threading.Thread(target=busy_thread, args=(stop,), name='busy')
+    thread.start()
+
+    # Profile.
+    state.toggle(str(directory))
+    assert state.active
+    try:
+        asyncio.get_event_loop().run_until_complete(allocate(keep))
+    finally:
+        stop.set()
+        thread.join()
+    state.toggle(str(directory))
+    assert not state.active
+
+    # Verify files.
+    names = sorted(p.basename for p in directory.listdir())
+    assert len(names) == 3
+    prefix = names[0].split('.')[0]
+    assert names == [prefix + '.pstats', prefix + '.samples.txt', prefix + '.tracemalloc.txt']
+    assert prefix == time.strftime('%Y%m%d-%H%M%S', time.strptime(prefix, '%Y%m%d-%H%M%S'))
+
+    # cProfile only sees the event loop thread.
+    stats = pstats.Stats(str(directory.join(prefix + '.pstats')))
+    functions = {f[2] for f in stats.stats}
+    assert 'allocate' in functions
+    assert 'busy_thread' not in functions
+
+    # Samples see the other threads.
+    samples = directory.join(prefix + '.samples.txt').read().splitlines()
+    assert any(s.startswith('busy;') and ';{}:busy_thread'.format(__name__) in s for s in samples)
+    assert not any(':allocate' in s for s in samples)
+
+    # Allocations.
+    allocations = directory.join(prefix + '.tracemalloc.txt').read().splitlines()
+    assert 0 < len(allocations) <= profiler.TOP_ALLOCATIONS
+    assert 'test_profiler.py' in allocations[0]
+
+    messages = [r.message for r in caplog.records if r.name == profiler.__name__]
+    assert messages == [
+        'Started profiling.',
+        'Stopped profiling, wrote {}.{{pstats,samples.txt,tracemalloc.txt}}'.format(directory.join(prefix)),
+    ]
+
+
+def test_profile_write_error(tmpdir, caplog):
+    """Test stop() when the profiles directory can't be created.
+
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    """
+    state = profiler.Profiler()
+    directory = tmpdir.ensure('profiles')  # File instead of directory.
+    state.start()
+    assert state.stop(str(directory)) == list()
+    assert not state.active
+    messages = [r.message for r in caplog.records if r.name == profiler.__name__]
+    assert messages[-1].startswith('Unable to write profile to {}: '.format(directory))
@@ -0,0 +1,70 @@
+"""Test functions in module."""
+
+import time
+
+import pytest
+
+from flash_air_music import schedule
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('0-24', set(range(24))),
+    ('1-2', {1}),
+    ('22-2', {22, 23, 0, 1}),
+    ('23-0', {23}),
+    ('1-3,2-4,20-21', {1, 2, 3, 20}),
+])
+def test_parse_hours(value, expected):
+    """Test parse_hours() with valid values.
+
+    :param str value: Window string.
+    :param set expected: Expected return value.
+    """
+    assert schedule.parse_hours(value) == expected
+
+
+@pytest.mark.parametrize('value', ['', '1', '1-1', '-1-2', '1-', 'a-b', '24-1', '1-25', '1-2,'])
+def test_parse_hours_invalid(value):
+    """Test parse_hours() with invalid values.
+
+    :param str value: Window string.
+    """
+    with pytest.raises(ValueError):
+        schedule.parse_hours(value)
+
+
+@pytest.mark.parametrize('value,hour,expected', [
+    (None, 12, True),
+    ('', 12, True),
+    ('22-7', 23, True),
+    ('22-7', 6, True),
+    ('22-7', 7, False),
+    ('22-7', 12, False),
+])
+def test_in_window(value, hour, expected):
+    """Test in_window().
+
+    :param str value: Window string.
+    :param int hour: Hour to check.
+    :param bool expected: Expected return value.
+    """
+    assert schedule.in_window(value, hour) is expected
+
+
+@pytest.mark.parametrize('value,clock,expected', [
+    (None, (12, 0, 0), None),
+    ('0-24', (12, 0, 0), None),
+    ('22-7', (12, 0, 0), 0),
+    ('22-7', (22, 0, 0), 9 * 3600),
+    ('22-7', (6, 59, 30), 30),
+    ('1-2,2-3', (1, 30, 0), 5400),
+])
+def test_seconds_left(value, clock, expected):
+    """Test seconds_left().
+
+    :param str value: Window string.
+    :param tuple clock: Hour, minute, and second of the local time to check.
+    :param int expected: Expected return value.
+    """
+    now = time.struct_time((2016, 2, 1) + clock + (0, 32, 0))
+    assert schedule.seconds_left(value, now) == expected
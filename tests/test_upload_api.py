@@ -12,6 +12,21 @@ from flash_air_music.upload import api
 from tests import HERE
 
 
+@pytest.mark.parametrize('url,expected', [
+    ('http://flashair/command.cgi?op=100&DIR=/MUSIC', 'command.cgi?op=100'),
+    ('http://flashair/command.cgi?op=221', 'command.cgi?op=221'),
+    ('http://flashair/upload.cgi?UPDIR=/MUSIC', 'upload.cgi'),
+    ('http://flashair/MUSIC/_fam_helper.lua?/MUSIC/song.mp3', '_fam_helper.lua'),
+])
+def test_endpoint_name(url, expected):
+    """Test endpoint_name() function.
+
+    :param str url: Test input.
+    :param str expected: Expected return value.
+    """
+    assert api.endpoint_name(url) == expected
+
+
 @pytest.mark.httpretty
 @pytest.mark.parametrize('mode', ['GET', 'POST'])
 def test_http_get_post(caplog, mode):
@@ -149,6 +164,34 @@ def test_command_get_time_zone(mode):
     assert exc.value.args[0] == expected
 
 
+@pytest.mark.httpretty
+@pytest.mark.parametrize('mode', ['400', 'bad response', '7812800/7822336,512'])
+def test_command_get_free_space(mode):
+    """Test command_get_free_space().
+
+    :param str mode: Scenario to test for.
+    """
+    # Setup responses and expectations.
+    if mode == '400':
+        status, body, exception, expected = 400, '', exceptions.FlashAirHTTPError, 400
+    elif mode == 'bad response':
+        status, body, exception, expected = 200, 'unexpected', exceptions.FlashAirBadResponse, 'unexpected'
+    else:
+        status, body, exception, expected = 200, mode + '\r\n', None, (7812800, 7822336, 512)
+    httpretty.register_uri(httpretty.GET, 'http://flashair/command.cgi', body=body, status=status)
+
+    # Handle non-exception.
+    if not exception:
+        actual = api.command_get_free_space('flashair')
+        assert actual == expected
+        return
+
+    # Handle exceptions.
+    with pytest.raises(exception) as exc:
+        api.command_get_free_space('flashair')
+    assert exc.value.args[0] == expected
+
+
 @pytest.mark.httpretty
 @pytest.mark.parametrize('bad', [True, False])
 def test_lua_script_execute(bad):
@@ -34,6 +34,7 @@ def test_song(tmpdir, mode):
     assert song.source == str(source)
     assert song.target == '/MUSIC/song.mp3'
     assert song.needs_action is (False if mode == 'up to date' else True)
+    assert not hasattr(song, '__dict__')
     assert len(attrs) == 4
     assert attrs[0] == str(source)
     assert attrs[1] == '/MUSIC/song.mp3'
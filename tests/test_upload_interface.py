@@ -1,11 +1,15 @@
 """Test functions in module."""
 
+import json
 import os
+import zlib
 
 import pytest
 
 from flash_air_music import exceptions
+from flash_air_music.pipeline import Pipeline
 from flash_air_music.upload import api, interface
+from flash_air_music.upload.remote import RemoteTree
 from tests import HERE, TZINFO
 
 
@@ -33,6 +37,24 @@ def test_get_card_time_zone(monkeypatch):
     assert actual == TZINFO
 
 
+@pytest.mark.parametrize('total,sector_size,expected', [
+    (15523840, 512, 32 * 1024),  # 8 GB SDHC.
+    (122142720, 512, 128 * 1024),  # 64 GB SDXC.
+    (10 * 1024 ** 4 // 4096, 4096, 128 * 1024),  # Larger than any entry in CLUSTER_SIZES.
+    (1000, 65536, 65536),  # Sectors larger than the estimated cluster.
+])
+def test_get_card_free_space(monkeypatch, total, sector_size, expected):
+    """Test get_card_free_space().
+
+    :param monkeypatch: pytest fixture.
+    :param int total: Total sectors.
+    :param int sector_size: Bytes per sector.
+    :param int expected: Expected bytes per allocation unit.
+    """
+    monkeypatch.setattr(api, 'command_get_free_space', lambda _: (100, total, sector_size))
+    assert interface.get_card_free_space('flashair') == (100 * sector_size, expected)
+
+
 def test_get_files_empty_root(monkeypatch):
     """Test get_files() with empty root directory.
 
@@ -314,6 +336,9 @@ def test_delete_files_dirs(monkeypatch, shutdown_future, shutdown):
     """
     order = list()
     monkeypatch.setattr(api, 'upload_delete', lambda _, p: order.append(p))
+    tree = RemoteTree()
+    tree.store('flashair', TZINFO, {'/MUSIC/song.mp3': (1, 2), '/MUSIC/subdir/a.mp3': (1, 2)}, ['/MUSIC/subdir/c'])
+    monkeypatch.setattr(interface, 'REMOTE_TREE', tree)
 
     if shutdown:
         shutdown_future.set_result(True)
@@ -338,9 +363,15 @@ def test_delete_files_dirs(monkeypatch, shutdown_future, shutdown):
 
     interface.delete_files_dirs('flashair', paths)
     assert order == expected
+    if shutdown:
+        assert sorted(tree.files) == ['/MUSIC/song.mp3', '/MUSIC/subdir/a.mp3']
+        assert tree.empty_dirs == ['/MUSIC/subdir/c']
+    else:
+        assert tree.files == dict()
+        assert tree.empty_dirs == list()
 
 
-@pytest.mark.parametrize('mode', ['no dir', 'no file', 'error', ''])
+@pytest.mark.parametrize('mode', ['no dir', 'no file', 'one file', 'error', ''])
 def test_initialize_upload(monkeypatch, mode):
     """Test initialize_upload().
 
@@ -349,25 +380,35 @@ def test_initialize_upload(monkeypatch, mode):
     """
     monkeypatch.setattr(api, 'upload_ftime_updir_writeprotect', lambda *_: None)
     uploaded = list()
-    script_size = os.stat(interface.LUA_HELPER_SCRIPT).st_size
+    listing = 'WLANSD_FILELIST\r\n/MUSIC,_fam_join.lua,{},32,18495,28453\r\n'.format(
+        os.stat(interface.LUA_JOIN_SCRIPT).st_size
+    )
+    listing += '/MUSIC,_fam_move_touch.lua,{},32,18495,28453\r\n'.format(os.stat(interface.LUA_HELPER_SCRIPT).st_size)
 
     def command_get_file_list(*_):
         """Mock."""
         if not uploaded and mode == 'no dir':
             raise exceptions.FlashAirDirNotFoundError
-        if (not uploaded and mode != '') or (uploaded and mode == 'error'):
+        if not uploaded and mode in ('no file', 'error'):
             return 'WLANSD_FILELIST\r\n'
-        return 'WLANSD_FILELIST\r\n/MUSIC,_fam_move_touch.lua,{},32,18495,28453\r\n'.format(script_size)
+        if (not uploaded and mode == 'one file') or (uploaded and mode == 'error'):
+            return listing.splitlines(keepends=True)[0] + listing.splitlines(keepends=True)[2]
+        return listing
     monkeypatch.setattr(api, 'command_get_file_list', command_get_file_list)
 
     def upload_upload_file(*args):
         """Mock."""
-        uploaded.append(True)
-        assert args[1] == '_fam_move_touch.lua'
+        uploaded.append(args[1])
     monkeypatch.setattr(api, 'upload_upload_file', upload_upload_file)
 
     if mode != 'error':
         interface.initialize_upload('flashair', TZINFO)
+        if mode == 'one file':
+            assert uploaded == ['_fam_join.lua']
+        elif mode:
+            assert uploaded == ['_fam_move_touch.lua', '_fam_join.lua']
+        else:
+            assert uploaded == list()
         return
 
     with pytest.raises(exceptions.FlashAirBadResponse):
@@ -385,6 +426,9 @@ def test_upload_files(monkeypatch, shutdown_future, shutdown):
     upload, execute = list(), list()
     monkeypatch.setattr(api, 'upload_upload_file', lambda *args: upload.append(args[-1].name))
     monkeypatch.setattr(api, 'lua_script_execute', lambda *args: execute.append(args[-1]))
+    tree = RemoteTree()
+    tree.store('flashair', TZINFO, dict(), ['/MUSIC', '/MUSIC/other'])
+    monkeypatch.setattr(interface, 'REMOTE_TREE', tree)
 
     if shutdown:
         shutdown_future.set_result(True)
@@ -397,3 +441,129 @@ def test_upload_files(monkeypatch, shutdown_future, shutdown):
 
     actual = list(zip(upload, execute))
     assert actual == expected
+
+    # Verify remote tree.
+    if shutdown:
+        assert tree.files == dict()
+        assert tree.empty_dirs == ['/MUSIC', '/MUSIC/other']
+    else:
+        stat = HERE.join('1khz_sine_2.mp3').stat()
+        assert tree.files == {'/MUSIC/song.mp3': (stat.size, int(stat.mtime))}
+        assert tree.empty_dirs == ['/MUSIC/other']
+
+
+@pytest.mark.parametrize('paused', [False, True])
+def test_upload_files_pipeline(monkeypatch, caplog, paused):
+    """Test upload_files() reporting progress to and stopping when paused in PIPELINE.
+
+    :param monkeypatch: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param bool paused: Uploads paused.
+    """
+    state, progress = Pipeline(), list()
+
+    def upload_upload_file(_, __, reader):
+        """Fake upload reading the whole file.
+
+        :param reader: CountingReader instance.
+        """
+        reader.read(1000)
+        progress.append(state.snapshot()['upload'])
+        reader.read()
+
+    monkeypatch.setattr(api, 'upload_upload_file', upload_upload_file)
+    monkeypatch.setattr(api, 'lua_script_execute', lambda *_: progress.append(state.snapshot()['upload']))
+    monkeypatch.setattr(interface, 'PIPELINE', state)
+    monkeypatch.setattr(interface, 'REMOTE_TREE', RemoteTree())
+    if paused:
+        state.pause(['upload'])
+
+    source, size = str(HERE.join('1khz_sine_2.mp3')), HERE.join('1khz_sine_2.mp3').size()
+    interface.upload_files('flashair', [(source, '/MUSIC/song.mp3', 1454388430)])
+
+    # Verify.
+    assert state.upload is None
+    if paused:
+        assert progress == list()
+        assert 'Uploads paused, stop uploading songs.' in [r.message for r in caplog.records]
+    else:
+        assert progress == [dict(source=source, size=size, sent=1000), dict(source=source, size=size, sent=size)]
+
+
+@pytest.mark.parametrize('mode', ['new', 'resume', 'shutdown', 'join error', 'two songs'])
+def test_upload_chunked(monkeypatch, tmpdir, shutdown_future, mode):
+    """Test upload_files() with files larger than UPLOAD_PART_SIZE.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param shutdown_future: conftest fixture.
+    :param str mode: Scenario to test for.
+    """
+    monkeypatch.setattr(interface, 'UPLOAD_PART_SIZE', 4)
+    monkeypatch.setattr(interface, 'REMOTE_TREE', RemoteTree())
+    source = tmpdir.join('song.mp3')
+    source.write_binary(b'0123456789')
+    prefix = '_fam_part_{:08x}_'.format(zlib.crc32(b'/MUSIC/song.mp3 10 1454388430'))
+
+    # Card has a stale part from another file, and part 0 plus a truncated part 1 from an interrupted attempt.
+    listing = 'WLANSD_FILELIST\r\n/MUSIC,_fam_part_00000000_000.bin,4,32,18495,28453\r\n'
+    if mode == 'resume':
+        listing += '/MUSIC,{0}000.bin,4,32,18495,28453\r\n/MUSIC,{0}001.bin,2,32,18495,28453\r\n'.format(prefix)
+    monkeypatch.setattr(api, 'command_get_file_list', lambda *_: listing)
+
+    calls = list()
+    monkeypatch.setattr(api, 'upload_delete', lambda _, p: calls.append(('delete', p)))
+    monkeypatch.setattr(api, 'upload_upload_file', lambda _, n, h: calls.append(('upload', n, h.read())))
+    join_error = 'unable to open part 1.' if mode == 'join error' else ''
+    monkeypatch.setattr(api, 'lua_script_execute', lambda _, p, a: calls.append(('execute', p, a)) or json.dumps(
+        dict(error=join_error, arg_prefix=a.split()[0])))
+
+    listed = list()
+
+    def get_staged_parts(ip_addr):
+        """Mock function, triggers shutdown before the first part is uploaded.
+
+        :param str ip_addr: IP address of FlashAir to connect to.
+        """
+        listed.append(ip_addr)
+        if mode == 'shutdown':
+            shutdown_future.set_result(True)
+        return original(ip_addr)
+    original = interface.get_staged_parts
+    monkeypatch.setattr(interface, 'get_staged_parts', get_staged_parts)
+
+    # Run.
+    if mode == 'join error':
+        with pytest.raises(exceptions.FlashAirBadResponse) as exc:
+            interface.upload_files('flashair', [(str(source), '/MUSIC/song.mp3', 1454388430)])
+        assert exc.value.args[0] == 'Joining parts failed: unable to open part 1.'
+        assert calls[-1][:2] == ('execute', '/MUSIC/_fam_join.lua')
+        assert not interface.REMOTE_TREE.files
+        return
+    if mode == 'two songs':
+        source.copy(tmpdir.join('song2.mp3'))
+        files_attrs = [(str(source), '/MUSIC/song.mp3', 1454388430), (str(tmpdir.join('song2.mp3')), '/MUSIC/2.mp3', 1)]
+        interface.upload_files('flashair', files_attrs)
+        assert listed == ['flashair']
+        assert [c[:2] for c in calls if c[0] != 'upload'] == [
+            ('delete', '/MUSIC/_fam_part_00000000_000.bin'),  # Only deleted once, parts of song.mp3 not deleted.
+            ('execute', '/MUSIC/_fam_join.lua'),
+            ('execute', '/MUSIC/_fam_move_touch.lua'),
+            ('execute', '/MUSIC/_fam_join.lua'),
+            ('execute', '/MUSIC/_fam_move_touch.lua'),
+        ]
+        assert sorted(interface.REMOTE_TREE.files) == ['/MUSIC/2.mp3', '/MUSIC/song.mp3']
+        return
+    interface.upload_files('flashair', [(str(source), '/MUSIC/song.mp3', 1454388430)])
+
+    # Verify.
+    expected = [('delete', '/MUSIC/_fam_part_00000000_000.bin')]
+    if mode != 'shutdown':
+        if mode == 'new':
+            expected.append(('upload', prefix + '000.bin', b'0123'))
+        expected.append(('upload', prefix + '001.bin', b'4567'))
+        expected.append(('upload', prefix + '002.bin', b'89'))
+        expected.append(('execute', '/MUSIC/_fam_join.lua', '/MUSIC/{} 3 10 /MUSIC/_fam_staged.bin'.format(prefix)))
+        expected.append(('execute', '/MUSIC/_fam_move_touch.lua', '/MUSIC/_fam_staged.bin 1454388430 /MUSIC/song.mp3'))
+    assert calls == expected
+    assert list(interface.REMOTE_TREE.files) == ([] if mode == 'shutdown' else ['/MUSIC/song.mp3'])
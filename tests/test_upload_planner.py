@@ -0,0 +1,106 @@
+"""Test functions in module."""
+
+import os
+
+import pytest
+
+from flash_air_music.upload import planner
+from flash_air_music.upload.discover import Song
+from tests import TZINFO
+
+
+@pytest.mark.parametrize('value', ['size', 'newest,size', 'pinned,album,newest,size', 'album'])
+def test_parse_order(value):
+    """Test parse_order() with valid values.
+
+    :param str value: Upload order.
+    """
+    assert planner.parse_order(value) == value.split(',')
+
+
+@pytest.mark.parametrize('value', ['', 'largest', 'size,size', 'size,', 'Size'])
+def test_parse_order_invalid(value):
+    """Test parse_order() with invalid values.
+
+    :param str value: Upload order.
+    """
+    with pytest.raises(ValueError):
+        planner.parse_order(value)
+
+
+def test_parse_pinned_dirs():
+    """Test parse_pinned_dirs()."""
+    assert planner.parse_pinned_dirs(None, '/working', '/music') == tuple()
+    assert planner.parse_pinned_dirs('', '/working', '/music') == tuple()
+    expected = ('/working/Favorites/', '/working/Podcasts/Current/')
+    assert planner.parse_pinned_dirs('Favorites:Podcasts/Current/::', '/working', '/music/') == expected
+
+    # Absolute paths in the music source are moved to the working dir.
+    expected = ('/working/Podcasts/', '/working/Podcasts/Current/', '/working/')
+    value = '/music/Podcasts:/music/Podcasts/Current/:/music'
+    assert planner.parse_pinned_dirs(value, '/working', '/music') == expected
+
+    # Outside of the music source.
+    for value in ('/other', '/musical', 'Favorites:/working/Favorites'):
+        with pytest.raises(ValueError):
+            planner.parse_pinned_dirs(value, '/working', '/music')
+
+
+@pytest.mark.parametrize('order,expected', [
+    ('size', ['ring/b.mp3', 'ring/a.mp3', 'new/1.mp3', 'old/1.mp3', 'new/2.mp3', 'old/2.mp3']),
+    ('newest,size', ['new/2.mp3', 'new/1.mp3', 'ring/b.mp3', 'ring/a.mp3', 'old/2.mp3', 'old/1.mp3']),
+    ('album,size', ['ring/b.mp3', 'ring/a.mp3', 'new/1.mp3', 'new/2.mp3', 'old/1.mp3', 'old/2.mp3']),
+    ('album,newest,size', ['new/2.mp3', 'new/1.mp3', 'ring/b.mp3', 'ring/a.mp3', 'old/2.mp3', 'old/1.mp3']),
+    ('pinned,size', ['old/1.mp3', 'old/2.mp3', 'ring/b.mp3', 'ring/a.mp3', 'new/1.mp3', 'new/2.mp3']),
+    ('pinned,album,newest,size', ['old/2.mp3', 'old/1.mp3', 'new/2.mp3', 'new/1.mp3', 'ring/b.mp3', 'ring/a.mp3']),
+])
+def test_plan(tmpdir, order, expected):
+    """Test plan() with every policy.
+
+    :param tmpdir: pytest fixture.
+    :param str order: Upload order.
+    :param list expected: Expected relative paths in upload order.
+    """
+    layout = [  # Path, size, mtime.
+        ('new/1.mp3', 300, 3000000000),
+        ('new/2.mp3', 500, 3000000002),
+        ('old/1.mp3', 400, 1000000000),
+        ('old/2.mp3', 600, 1000000002),
+        ('ring/a.mp3', 20, 2000000000),
+        ('ring/b.mp3', 10, 2000000002),
+    ]
+    songs = list()
+    for path, size, mtime in layout:
+        tmpdir.ensure(path).write(b'\x00' * size)
+        os.utime(str(tmpdir.join(path)), (mtime, mtime))
+        songs.append(Song(str(tmpdir.join(path)), str(tmpdir), '/MUSIC', dict(), TZINFO))
+    pinned_dirs = planner.parse_pinned_dirs('old', str(tmpdir), '/music')
+
+    actual = planner.plan(songs, planner.parse_order(order), pinned_dirs)
+    assert [os.path.relpath(s.source, str(tmpdir)) for s in actual] == expected
+
+
+@pytest.mark.parametrize('free_bytes,expected', [
+    (10000, ['small.mp3', 'replace.mp3', 'large.mp3']),
+    (4096, ['small.mp3', 'replace.mp3']),
+    (1024, ['small.mp3']),
+    (512, ['small.mp3']),
+    (0, []),
+])
+def test_fit_capacity(tmpdir, free_bytes, expected):
+    """Test fit_capacity().
+
+    :param tmpdir: pytest fixture.
+    :param int free_bytes: Free space on the card.
+    :param list expected: Expected relative paths that fit.
+    """
+    remote_metadata = {'/MUSIC/replace.mp3': (1000, 0)}
+    songs = list()
+    for path, size in (('small.mp3', 100), ('replace.mp3', 1024), ('large.mp3', 2100)):
+        tmpdir.join(path).write(b'\x00' * size)
+        songs.append(Song(str(tmpdir.join(path)), str(tmpdir), '/MUSIC', remote_metadata, TZINFO))
+
+    # 512 byte blocks, files over 2048 bytes are uploaded in parts and need twice their space.
+    fits, left_out = planner.fit_capacity(songs, free_bytes, 512, 2048)
+    assert [os.path.basename(s.source) for s in fits] == expected
+    assert [s for s in songs if s not in fits] == left_out
@@ -0,0 +1,53 @@
+"""Test functions in module."""
+
+from flash_air_music.upload import remote
+from tests import TZINFO
+
+
+def test_is_fresh(monkeypatch):
+    """Test is_fresh() and invalidate().
+
+    :param monkeypatch: pytest fixture.
+    """
+    now = [100.0]
+    monkeypatch.setattr(remote.time, 'monotonic', lambda: now[0])
+    tree = remote.RemoteTree()
+    assert not tree.is_fresh('flashair', None)
+
+    tree.store('flashair', TZINFO, dict(), list())
+    now[0] = 160.0
+    assert tree.age == 60
+    assert tree.is_fresh('flashair', None)
+    assert tree.is_fresh('flashair', 61)
+    assert not tree.is_fresh('flashair', 60)
+    assert not tree.is_fresh('flashair', 0)
+    assert not tree.is_fresh('other', None)
+
+    tree.invalidate()
+    assert not tree.is_fresh('flashair', None)
+    assert tree.tzinfo is None
+
+
+def test_deleted_uploaded():
+    """Test deleted() and uploaded()."""
+    files = {
+        '/MUSIC/song.mp3': (1, 2),
+        '/MUSIC/subdir/a.mp3': (3, 4),
+        '/MUSIC/subdir/b.mp3': (5, 6),
+        '/MUSIC/subdir2/c.mp3': (7, 8),
+    }
+    empty_dirs = ['/MUSIC/subdir/empty', '/MUSIC/subdir3', '/MUSIC/subdir4/empty']
+    tree = remote.RemoteTree()
+    tree.store('flashair', TZINFO, files, empty_dirs)
+
+    # Delete a file and a directory with everything in it.
+    tree.deleted('/MUSIC/song.mp3')
+    tree.deleted('/MUSIC/subdir/')
+    assert sorted(tree.files) == ['/MUSIC/subdir2/c.mp3']
+    assert tree.empty_dirs == ['/MUSIC/subdir3', '/MUSIC/subdir4/empty']
+
+    # Upload into empty directories.
+    tree.uploaded('/MUSIC/subdir2/c.mp3', 9, 10)
+    tree.uploaded('/MUSIC/subdir4/empty/d.mp3', 11, 12)
+    assert tree.files == {'/MUSIC/subdir2/c.mp3': (9, 10), '/MUSIC/subdir4/empty/d.mp3': (11, 12)}
+    assert tree.empty_dirs == ['/MUSIC/subdir3']
@@ -8,8 +8,18 @@ from flash_air_music.exceptions import FlashAirError, FlashAirNetworkError, Flas
 from flash_air_music.upload import run
 from flash_air_music.upload.discover import Song
 from flash_air_music.upload.interface import epoch_to_ftime
+from flash_air_music.upload.remote import RemoteTree
+from flash_air_music.upload.telemetry import Throughput
 from tests import HERE, TZINFO
 
+CONFIG = {
+    '--music-source': '',
+    '--pinned-dirs': None,
+    '--sync-hours': None,
+    '--upload-order': 'size',
+    '--working-dir': '',
+}
+
 
 @pytest.mark.parametrize('exc', [FlashAirNetworkError, FlashAirError, None])
 def test_scan(monkeypatch, exc):
@@ -26,8 +36,11 @@ def test_scan(monkeypatch, exc):
         if exc:
             raise exc('Error')
         return TZINFO
-    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG', {'--working-dir': ''})
+    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG', {'--remote-cache-ttl': '0', '--working-dir': ''})
+    monkeypatch.setattr(run, 'REMOTE_TREE', RemoteTree())
+    monkeypatch.setattr(run, 'get_card_free_space', lambda _: (1024, 512))
     monkeypatch.setattr(run, 'get_card_time_zone', func)
+    monkeypatch.setattr(run, 'get_remote_files', lambda *_: (dict(), list()))
     monkeypatch.setattr(run, 'get_songs', lambda *_: ([1, 2, 3], None, None, None))
     monkeypatch.setattr(run, 'files_dirs_to_delete', lambda *_: {4, 5, 6})
 
@@ -41,6 +54,50 @@ def test_scan(monkeypatch, exc):
         run.scan('')
 
 
+@pytest.mark.parametrize('mode', ['ttl 0', 'ttl 900', 'retry', 'other card', 'walk failed'])
+def test_scan_remote_tree(monkeypatch, mode):
+    """Test scan() reusing the remote listing.
+
+    :param monkeypatch: pytest fixture.
+    :param str mode: Scenario to test for.
+    """
+    walked = list()
+
+    def get_remote_files(*_):
+        """Mock function.
+
+        :param _: unused.
+        """
+        walked.append(True)
+        return None if mode == 'walk failed' else ({'/MUSIC/walked.mp3': (1, 2)}, list())
+
+    tree = RemoteTree()
+    tree.store('flashair', TZINFO, {'/MUSIC/cached.mp3': (1, 2)}, list())
+    ttl = '0' if mode in ('ttl 0', 'walk failed') else '900'
+    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG', {'--remote-cache-ttl': ttl, '--working-dir': ''})
+    monkeypatch.setattr(run, 'REMOTE_TREE', tree)
+    monkeypatch.setattr(run, 'get_card_free_space', lambda _: (1024, 512))
+    monkeypatch.setattr(run, 'get_card_time_zone', lambda _: TZINFO)
+    monkeypatch.setattr(run, 'get_remote_files', get_remote_files)
+    monkeypatch.setattr(run, 'get_songs', lambda *args: (list(), list(), args[-1][0], list()))
+
+    # Run.
+    ip_addr = 'other' if mode == 'other card' else 'flashair'
+    actual = run.scan(ip_addr, retry=mode == 'retry')
+
+    # Verify.
+    if mode == 'walk failed':
+        assert actual == (list(), set(), None)
+        assert tree.ip_addr is None
+    elif mode in ('ttl 900', 'retry'):
+        assert actual == (list(), {'/MUSIC/cached.mp3'}, TZINFO)
+        assert not walked
+    else:
+        assert actual == (list(), {'/MUSIC/walked.mp3'}, TZINFO)
+        assert tree.ip_addr == ip_addr
+        assert tree.files == {'/MUSIC/walked.mp3': (1, 2)}
+
+
 @pytest.mark.parametrize('exc', [FlashAirURLTooLong, FlashAirNetworkError, FlashAirError, None])
 def test_upload_cleanup_initialize_upload(monkeypatch, tmpdir, caplog, exc):
     """Test upload_cleanup() with initialize_upload() exception handling.
@@ -57,6 +114,7 @@ def test_upload_cleanup_initialize_upload(monkeypatch, tmpdir, caplog, exc):
         """
         if exc:
             raise exc('Error')
+    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG', CONFIG)
     monkeypatch.setattr(run, 'initialize_upload', func)
     monkeypatch.setattr(run, 'delete_files_dirs', lambda *_: None)
     monkeypatch.setattr(run, 'upload_files', lambda *_: None)
@@ -101,6 +159,7 @@ def test_upload_cleanup_delete_files_dirs(monkeypatch, caplog, exc):
         """
         if exc:
             raise exc('Error')
+    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG', CONFIG)
     monkeypatch.setattr(run, 'initialize_upload', lambda *_: None)
     monkeypatch.setattr(run, 'delete_files_dirs', func)
     monkeypatch.setattr(run, 'upload_files', lambda *_: None)
@@ -137,6 +196,7 @@ def test_upload_cleanup_upload_files(monkeypatch, tmpdir, caplog, exc):
         if exc:
             raise exc('Error')
         attrs.extend(args[1])
+    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG', CONFIG)
     monkeypatch.setattr(run, 'initialize_upload', lambda *_: None)
     monkeypatch.setattr(run, 'delete_files_dirs', lambda *_: None)
     monkeypatch.setattr(run, 'upload_files', func)
@@ -170,6 +230,126 @@ def test_upload_cleanup_upload_files(monkeypatch, tmpdir, caplog, exc):
     assert attrs == expected
 
 
+@pytest.mark.parametrize('exc', [FlashAirNetworkError, FlashAirError, None])
+def test_scan_free_space(monkeypatch, caplog, exc):
+    """Test scan() getting free space on the card.
+
+    :param monkeypatch: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param exception exc: Exception to test for.
+    """
+    def func(_):
+        """Mock function.
+
+        :param _: unused.
+        """
+        if exc:
+            raise exc('Error')
+        return 1024, 512
+    tree = RemoteTree()
+    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG', {'--remote-cache-ttl': '0', '--working-dir': ''})
+    monkeypatch.setattr(run, 'REMOTE_TREE', tree)
+    monkeypatch.setattr(run, 'get_card_free_space', func)
+    monkeypatch.setattr(run, 'get_card_time_zone', lambda _: TZINFO)
+    monkeypatch.setattr(run, 'get_remote_files', lambda *_: (dict(), list()))
+    monkeypatch.setattr(run, 'get_songs', lambda *_: (list(), list(), dict(), list()))
+
+    if exc == FlashAirNetworkError:
+        with pytest.raises(FlashAirNetworkError):
+            run.scan('flashair')
+        return
+    run.scan('flashair')
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+
+    if exc:
+        assert (tree.free_bytes, tree.block_size) == (None, 1)
+        assert messages[-1] == 'Unable to get free space on FlashAir card, not checking if songs fit.'
+    else:
+        assert (tree.free_bytes, tree.block_size) == (1024, 512)
+
+
+@pytest.mark.parametrize('free_bytes', [None, 3072, 2048, 1024])
+def test_upload_cleanup_free_space(monkeypatch, tmpdir, caplog, free_bytes):
+    """Test upload_cleanup() only uploading songs that fit on the card.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param int free_bytes: Free space on the card before deleting.
+    """
+    attrs = list()
+    tree = RemoteTree()
+    tree.store('flashair', TZINFO, {'/MUSIC/old.mp3': (1000, 0)}, list())
+    tree.free_bytes, tree.block_size = free_bytes, 512
+    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG', CONFIG)
+    monkeypatch.setattr(run, 'REMOTE_TREE', tree)
+    monkeypatch.setattr(run, 'FREE_SPACE_RESERVE', 1024)
+    monkeypatch.setattr(run, 'initialize_upload', lambda *_: None)
+    monkeypatch.setattr(run, 'delete_files_dirs', lambda *_: None)
+    monkeypatch.setattr(run, 'upload_files', lambda _, f: attrs.extend(f))
+
+    for name, size in (('a.mp3', 1500), ('b.mp3', 500), ('c.mp3', 1000)):
+        tmpdir.join(name).write(b'\x00' * size)
+    songs = [Song(str(tmpdir.join(n)), str(tmpdir), '/MUSIC', dict(), TZINFO) for n in ('a.mp3', 'b.mp3', 'c.mp3')]
+
+    # Run. Deleting old.mp3 frees 1024 bytes (two 512 byte blocks), 1024 bytes are reserved.
+    run.upload_cleanup('', songs, {'/MUSIC/old.mp3'}, TZINFO)
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+
+    # Verify.
+    actual = [a[1] for a in attrs]
+    if free_bytes in (None, 3072):
+        assert actual == ['/MUSIC/b.mp3', '/MUSIC/c.mp3', '/MUSIC/a.mp3']
+        assert not [m for m in messages if m.startswith('Not enough free space')]
+    elif free_bytes == 2048:
+        assert actual == ['/MUSIC/b.mp3', '/MUSIC/c.mp3']
+        assert 'Not enough free space on the FlashAir card for 1 song(s) (1500 bytes), skipping them.' in messages
+    else:
+        assert actual == ['/MUSIC/b.mp3']
+        assert 'Not enough free space on the FlashAir card for 2 song(s) (2500 bytes), skipping them.' in messages
+
+
+@pytest.mark.parametrize('seconds', [None, 0, 2, 3600])
+def test_upload_cleanup_sync_hours(monkeypatch, tmpdir, caplog, seconds):
+    """Test upload_cleanup() only uploading songs that fit in the remaining sync hours.
+
+    :param monkeypatch: pytest fixture.
+    :param tmpdir: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param int seconds: Seconds left in sync hours.
+    """
+    attrs = list()
+    throughput = Throughput()
+    throughput.record(1024, 1.0)
+    monkeypatch.setattr(run, 'GLOBAL_MUTABLE_CONFIG', dict(CONFIG, **{'--sync-hours': '1-2'}))
+    monkeypatch.setattr(run, 'THROUGHPUT', throughput)
+    monkeypatch.setattr(run, 'seconds_left', lambda _: seconds)
+    monkeypatch.setattr(run, 'initialize_upload', lambda *_: None)
+    monkeypatch.setattr(run, 'delete_files_dirs', lambda *_: None)
+    monkeypatch.setattr(run, 'upload_files', lambda _, f: attrs.extend(f))
+
+    for name, size in (('a.mp3', 1024), ('b.mp3', 512), ('c.mp3', 2048)):
+        tmpdir.join(name).write(b'\x00' * size)
+    songs = [Song(str(tmpdir.join(n)), str(tmpdir), '/MUSIC', dict(), TZINFO) for n in ('a.mp3', 'b.mp3', 'c.mp3')]
+
+    # Run.
+    run.upload_cleanup('', songs, list(), TZINFO)
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+
+    # Verify.
+    if seconds in (None, 3600):
+        assert [a[1] for a in attrs] == ['/MUSIC/b.mp3', '/MUSIC/a.mp3', '/MUSIC/c.mp3']
+        assert 'Estimated upload time 3584 second(s) at 1.0 KiB/s.' not in messages
+        assert 'Estimated upload time 3 second(s) at 1.0 KiB/s.' in messages
+    elif seconds == 2:
+        assert [a[1] for a in attrs] == ['/MUSIC/b.mp3', '/MUSIC/a.mp3']
+        assert 'Only 2 of 3 song(s) estimated to fit in the remaining sync hours.' in messages
+    else:
+        assert attrs == list()
+        assert 'Only 0 of 3 song(s) estimated to fit in the remaining sync hours.' in messages
+        assert 'Uploading 0 song(s).' not in messages
+
+
 @pytest.mark.parametrize('mode', ['shutdown', 'nothing to do', 'success'])
 def test_run_quick(monkeypatch, caplog, shutdown_future, mode):
     """Test run() without needing to iterate.
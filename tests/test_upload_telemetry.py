@@ -0,0 +1,58 @@
+"""Test functions in module."""
+
+import io
+
+import pytest
+
+from flash_air_music.upload import telemetry
+
+
+def test_counting_reader():
+    """Test CountingReader."""
+    handle = io.BytesIO(b'0123456789')
+    handle.name = 'song.mp3'
+    reader = telemetry.CountingReader(handle)
+    assert reader.name == 'song.mp3'
+    assert reader.read(4) == b'0123'
+    assert reader.read() == b'456789'
+    assert reader.read() == b''
+    assert reader.count == 10
+
+
+def test_throughput(monkeypatch):
+    """Test Throughput estimates and session totals.
+
+    :param monkeypatch: pytest fixture.
+    """
+    monkeypatch.setattr(telemetry, 'SAMPLE_WINDOW', 2)
+    throughput = telemetry.Throughput()
+    assert throughput.bytes_per_second is None
+    assert throughput.session_bytes_per_second is None
+    assert throughput.eta(100) is None
+
+    # Rolling window only keeps the last two samples, session keeps everything.
+    throughput.record(100, 10.0)
+    throughput.record(300, 1.0)
+    throughput.record(500, 1.0)
+    assert throughput.bytes_per_second == 400
+    assert throughput.session_bytes_per_second == 75
+    assert throughput.eta(1000) == 2.5
+
+    # New session keeps the estimate.
+    throughput.start_session()
+    assert throughput.session_bytes == 0
+    assert throughput.session_bytes_per_second is None
+    assert throughput.bytes_per_second == 400
+
+
+@pytest.mark.parametrize('seconds,expected', [(None, 3), (0, 0), (0.5, 1), (1, 1), (2, 2), (3, 3)])
+def test_fit(seconds, expected):
+    """Test Throughput.fit().
+
+    :param int seconds: Time available.
+    :param int expected: Expected return value.
+    """
+    throughput = telemetry.Throughput()
+    assert throughput.fit([100, 200, 300], seconds) == 3
+    throughput.record(100, 1.0)
+    assert throughput.fit([100, 100, 100], seconds) == expected
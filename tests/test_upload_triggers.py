@@ -4,6 +4,9 @@ import asyncio
 import socket
 
 from flash_air_music.upload import triggers
+from flash_air_music.upload.remote import RemoteTree
+
+CONFIG = {'--ip-addr': '127.0.0.1', '--probe-timeout': '2', '--sync-hours': None}
 
 
 def test_skip(monkeypatch, caplog, shutdown_future):
@@ -16,7 +19,7 @@ def test_skip(monkeypatch, caplog, shutdown_future):
     loop = asyncio.get_event_loop()
     shutdown_future.set_result(True)
 
-    monkeypatch.setattr(triggers, 'GLOBAL_MUTABLE_CONFIG', {'--ip-addr': None})
+    monkeypatch.setattr(triggers, 'GLOBAL_MUTABLE_CONFIG', dict(CONFIG, **{'--ip-addr': None}))
 
     loop.run_until_complete(triggers.watch_for_flashair())
 
@@ -32,20 +35,25 @@ def test_fail(monkeypatch, caplog, shutdown_future):
     :param caplog: pytest extension fixture.
     :param shutdown_future: conftest fixture.
     """
+    @asyncio.coroutine
     def func(*_):
         """Raise exception."""
         raise socket.error('Error')
     loop = asyncio.get_event_loop()
     shutdown_future.set_result(True)
 
-    monkeypatch.setattr(triggers, 'GLOBAL_MUTABLE_CONFIG', {'--ip-addr': '127.0.0.1'})
-    monkeypatch.setattr(triggers.socket, 'connect', func)
+    monkeypatch.setattr(triggers, 'GLOBAL_MUTABLE_CONFIG', CONFIG)
+    monkeypatch.setattr(triggers.asyncio, 'open_connection', func)
+    tree = RemoteTree()
+    tree.store('127.0.0.1', None, dict(), list())
+    monkeypatch.setattr(triggers, 'REMOTE_TREE', tree)
 
     loop.run_until_complete(triggers.watch_for_flashair())
 
     messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
     assert '127.0.0.1 is reachable. calling run().' not in messages
     assert 'watch_for_flashair() saw shutdown signal.' in messages
+    assert tree.ip_addr is None
 
 
 def test_success(monkeypatch, caplog, shutdown_future):
@@ -58,13 +66,113 @@ def test_success(monkeypatch, caplog, shutdown_future):
     loop = asyncio.get_event_loop()
     tries = list(range(3))
 
-    monkeypatch.setattr(triggers, 'GLOBAL_MUTABLE_CONFIG', {'--ip-addr': '127.0.0.1'})
+    monkeypatch.setattr(triggers, 'GLOBAL_MUTABLE_CONFIG', CONFIG)
     monkeypatch.setattr(triggers, 'run', asyncio.coroutine(lambda *_: tries.pop() or shutdown_future.set_result(True)))
     monkeypatch.setattr(triggers, 'SUCCESS_SLEEP', 1)
-    monkeypatch.setattr(triggers.socket, 'connect', lambda *_: None)
+    monkeypatch.setattr(triggers, 'probe', asyncio.coroutine(lambda *_: True))
 
     loop.run_until_complete(triggers.watch_for_flashair())
 
     messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
     assert '127.0.0.1 is reachable. calling run().' in messages
     assert 'watch_for_flashair() saw shutdown signal.' in messages
+
+
+def test_outside_sync_hours(monkeypatch, caplog, shutdown_future):
+    """Test with current time outside of --sync-hours.
+
+    :param monkeypatch: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param shutdown_future: conftest fixture.
+    """
+    loop = asyncio.get_event_loop()
+    shutdown_future.set_result(True)
+
+    monkeypatch.setattr(triggers, 'GLOBAL_MUTABLE_CONFIG', dict(CONFIG, **{'--sync-hours': '1-2'}))
+    monkeypatch.setattr(triggers, 'in_window', lambda *_: False)
+    monkeypatch.setattr(triggers, 'probe', asyncio.coroutine(lambda *_: True))
+
+    loop.run_until_complete(triggers.watch_for_flashair())
+
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+    assert 'Outside of sync hours. Skipping watch_for_flashair().' in messages
+    assert '127.0.0.1 is reachable. calling run().' not in messages
+    assert 'watch_for_flashair() saw shutdown signal.' in messages
+
+
+def test_probe(caplog):
+    """Test probe() against a listening and a closed port.
+
+    :param caplog: pytest extension fixture.
+    """
+    loop = asyncio.get_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(lambda *_: None, '127.0.0.1', 0))
+    port = server.sockets[0].getsockname()[1]
+    try:
+        assert loop.run_until_complete(triggers.probe('127.0.0.1', 2, port)) is True
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+    assert loop.run_until_complete(triggers.probe('127.0.0.1', 2, port)) is False
+    assert not [r for r in caplog.records if r.levelname == 'ERROR']
+
+
+def test_probe_does_not_block(monkeypatch):
+    """Test probe() timing out on a card that never answers while other coroutines keep running.
+
+    :param monkeypatch: pytest fixture.
+    """
+    loop = asyncio.get_event_loop()
+    ticks = list()
+
+    @asyncio.coroutine
+    def open_connection(*_):
+        """Never connect, like a card out of range."""
+        yield from asyncio.sleep(60)
+
+    @asyncio.coroutine
+    def ticker():
+        """Count event loop iterations."""
+        while True:
+            ticks.append(True)
+            yield from asyncio.sleep(0.01)
+
+    monkeypatch.setattr(triggers.asyncio, 'open_connection', open_connection)
+    task = loop.create_task(ticker())
+    start_time = loop.time()
+    assert loop.run_until_complete(triggers.probe('flashair', 0.2)) is False
+    task.cancel()
+
+    assert loop.time() - start_time < 1
+    assert len(ticks) > 5
+
+
+def test_back_off(monkeypatch, caplog, shutdown_future):
+    """Test time between checks doubling while the card is away and resetting when it reappears.
+
+    :param monkeypatch: pytest fixture.
+    :param caplog: pytest extension fixture.
+    :param shutdown_future: conftest fixture.
+    """
+    loop = asyncio.get_event_loop()
+    reachable = [False, False, False, False, False, True, False]
+
+    @asyncio.coroutine
+    def probe(*_):
+        """Mock probe()."""
+        if len(reachable) == 1:
+            shutdown_future.set_result(True)
+        return reachable.pop(0)
+
+    monkeypatch.setattr(triggers, 'GLOBAL_MUTABLE_CONFIG', CONFIG)
+    monkeypatch.setattr(triggers, 'MAX_ABSENT_SLEEP', 4)
+    monkeypatch.setattr(triggers, 'EVERY_SECONDS_CHECK', 1)
+    monkeypatch.setattr(triggers, 'probe', probe)
+    monkeypatch.setattr(triggers, 'run', asyncio.coroutine(lambda *_: False))
+    monkeypatch.setattr(triggers, 'wait_for_shutdown', asyncio.coroutine(lambda *_: shutdown_future.done()))
+
+    loop.run_until_complete(triggers.watch_for_flashair())
+
+    messages = [r.message for r in caplog.records if r.name.startswith('flash_air_music')]
+    actual = [int(m.split()[-2]) for m in messages if m.startswith('127.0.0.1 not reachable, next check in ')]
+    assert actual == [1, 2, 4, 4, 4, 1]
@@ -0,0 +1,110 @@
+"""Test flash_air_music.watchdog functions/classes."""
+
+import asyncio
+import re
+import time
+
+from flash_air_music import metrics, watchdog
+
+
+def blocking_call(seconds):
+    """Block the event loop.
+
+    :param float seconds: Seconds to block for.
+    """
+    time.sleep(seconds)
+
+
+@asyncio.coroutine
+def busy(block):
+    """Run on the event loop, blocking it for a while in the middle.
+
+    :param float block: Seconds to block for. 0 to not block.
+    """
+    yield from asyncio.sleep(0.3)
+    if block:
+        blocking_call(block)
+    yield from asyncio.sleep(0.3)
+
+
+def test_stall(monkeypatch, caplog):
+    """Test logging the stack of a blocked event loop.
+
+    :param monkeypatch: pytest fixture.
+    :param caplog: pytest extension fixture.
+    """
+    monkeypatch.setattr(metrics.LOOP_STALLS, 'values', dict())
+    loop = asyncio.get_event_loop()
+    thread = watchdog.Watchdog(loop, 0.1)
+    thread.start()
+    loop.run_until_complete(busy(0.6))
+    thread.stop()
+    assert not thread.is_alive()
+
+    # Verify.
+    messages = [r.message for r in caplog.records if r.name == watchdog.__name__ and r.levelname == 'WARNING']
+    assert len(messages) == 2
+    assert re.match(r'Event loop blocked for 0\.1\d seconds\. Stack:\n', messages[0])
+    assert 'in blocking_call\n    time.sleep(seconds)' in messages[0]
+    assert 'in busy\n' in messages[0]
+    assert re.match(r'Event loop was blocked for 0\.(5[5-9]|6\d) seconds\.$', messages[1])
+    assert metrics.LOOP_STALLS.values[()] == 1
+
+
+def test_no_stall(monkeypatch, caplog):
+    """Test measuring event loop lag without stalls.
+
+    :param monkeypatch: pytest fixture.
+    :param caplog: pytest extension fixture.
+    """
+    monkeypatch.setattr(metrics.LOOP_LAG_SECONDS, 'values', dict())
+    loop = asyncio.get_event_loop()
+    thread = watchdog.Watchdog(loop, 0.1)
+    thread.start()
+    loop.run_until_complete(busy(0))
+    thread.stop()
+
+    # Verify.
+    messages = [r.message for r in caplog.records if r.name == watchdog.__name__]
+    assert messages == ['Watching for event loop stalls longer than 0.10 seconds.', 'Watchdog stopped.']
+    counts, _, count = metrics.LOOP_LAG_SECONDS.values[()]
+    assert count >= 3
+    assert counts[metrics.LAG_BUCKETS.index(0.1)] == count
+
+
+def test_loop_closed_or_stopped():
+    """Test probe() with a closed loop and with a loop that isn't running."""
+    loop = asyncio.new_event_loop()
+    thread = watchdog.Watchdog(loop, 0.1)
+    stack = thread.loop_stack()
+    assert 'in test_loop_closed_or_stopped\n    stack = thread.loop_stack()\n' in stack
+
+    # Not running, stop() ends the wait.
+    thread.stopping.set()
+    assert thread.probe() is None
+
+    # Closed.
+    loop.close()
+    thread.stopping.clear()
+    assert thread.probe() is None
+
+
+def test_stop_unanswered(monkeypatch, caplog):
+    """Test stop() while a probe waits on a loop that stopped running.
+
+    :param monkeypatch: pytest fixture.
+    :param caplog: pytest extension fixture.
+    """
+    monkeypatch.setattr(metrics.LOOP_STALLS, 'values', dict())
+    loop = asyncio.new_event_loop()
+    thread = watchdog.Watchdog(loop, 1.0)
+    thread.start()
+    time.sleep(0.5)  # First probe sent after 0.25 seconds, never answered.
+    start_time = time.monotonic()
+    thread.stop()
+    assert time.monotonic() - start_time < 0.2
+    loop.close()
+
+    # Verify.
+    assert not [r for r in caplog.records if r.name == watchdog.__name__ and r.levelname == 'WARNING']
+    assert metrics.LOOP_STALLS.values == dict()